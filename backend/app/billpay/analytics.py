@@ -0,0 +1,194 @@
+"""
+Accounts payable analytics
+
+AP aging, vendor spend and monthly trends are grouped aggregates computed
+in the database, one query each. refresh_vendor_metrics() keeps the
+denormalized Vendor counters (total_paid, total_bills, average_bill_amount,
+on_time_payment_rate) current with one grouped query and a bulk_update, so
+vendor dashboards read stored values.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from dateutil.relativedelta import relativedelta
+from django.db.models import Avg, Count, DecimalField, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+from .models import Bill, Vendor
+
+ZERO = Decimal('0.00')
+
+# Bills in these statuses are not payable
+CLOSED_STATUSES = ('paid', 'cancelled')
+
+# Aging buckets: (label, min days past due, max days past due); None is open-ended
+AGING_BUCKETS = [
+    ('current', None, 0),
+    ('days_1_30', 1, 30),
+    ('days_31_60', 31, 60),
+    ('days_61_90', 61, 90),
+    ('days_over_90', 91, None),
+]
+
+REMAINING = F('total_amount') - F('amount_paid')
+MONEY = DecimalField(max_digits=15, decimal_places=2)
+
+
+def _sum(expression, **kwargs):
+    """Sum that yields 0.00 instead of NULL"""
+    return Coalesce(Sum(expression, **kwargs), ZERO, output_field=MONEY)
+
+
+def ap_aging(organization_id, today=None):
+    """
+    Amounts payable by days past due, in one aggregate query
+
+    Returns:
+        dict: {bucket label: Decimal}
+    """
+    today = today or timezone.now().date()
+
+    buckets = {}
+    for label, min_days, max_days in AGING_BUCKETS:
+        condition = Q()
+        if min_days is not None:
+            condition &= Q(due_date__lte=today - timedelta(days=min_days))
+        if max_days is not None:
+            condition &= Q(due_date__gte=today - timedelta(days=max_days))
+        buckets[label] = _sum(REMAINING, filter=condition)
+
+    return Bill.objects.filter(organization_id=organization_id).exclude(
+        status__in=CLOSED_STATUSES
+    ).aggregate(**buckets)
+
+
+def vendor_spend(organization_id, since=None, vendor_id=None, limit=None, statuses=None):
+    """
+    Per-vendor billed and paid amounts, largest spend first
+
+    Args:
+        organization_id: Organization UUID
+        since: Only bills dated on or after this date
+        vendor_id: Only this vendor
+        limit: Maximum vendors returned
+        statuses: Only bills in these statuses (defaults to every non-cancelled bill)
+
+    Returns:
+        list: [{'vendor_id', 'vendor_name', 'bills', 'total_billed', 'total_paid', 'outstanding'}]
+    """
+    bills = Bill.objects.filter(organization_id=organization_id).exclude(status='cancelled')
+    if since:
+        bills = bills.filter(bill_date__gte=since)
+    if vendor_id:
+        bills = bills.filter(vendor_id=vendor_id)
+    if statuses:
+        bills = bills.filter(status__in=statuses)
+
+    rows = bills.values('vendor_id', vendor_name=F('vendor__name')).annotate(
+        bills=Count('id'),
+        total_billed=_sum('total_amount'),
+        total_paid=_sum('amount_paid'),
+        outstanding=_sum(REMAINING, filter=~Q(status='paid')),
+    ).order_by('-total_paid', 'vendor_name')
+
+    return list(rows[:limit] if limit else rows)
+
+
+def monthly_trend(organization_id, months=12, vendor_id=None, today=None):
+    """
+    Billed and paid amounts per bill month for the last `months` months
+
+    Months without bills are included with zeros.
+
+    Returns:
+        list: [{'month': 'YYYY-MM', 'bills', 'billed', 'paid'}] oldest first
+    """
+    today = today or timezone.now().date()
+    first_month = today.replace(day=1) - relativedelta(months=months - 1)
+
+    bills = Bill.objects.filter(organization_id=organization_id, bill_date__gte=first_month).exclude(
+        status='cancelled'
+    )
+    if vendor_id:
+        bills = bills.filter(vendor_id=vendor_id)
+
+    totals = {
+        row['month'].strftime('%Y-%m'): row
+        for row in bills.annotate(month=TruncMonth('bill_date')).values('month').annotate(
+            bills=Count('id'),
+            billed=_sum('total_amount'),
+            paid=_sum('amount_paid'),
+        )
+    }
+
+    series = []
+    for offset in range(months):
+        month = (first_month + relativedelta(months=offset)).strftime('%Y-%m')
+        row = totals.get(month, {})
+        series.append({
+            'month': month,
+            'bills': row.get('bills', 0),
+            'billed': row.get('billed', ZERO),
+            'paid': row.get('paid', ZERO),
+        })
+    return series
+
+
+def refresh_vendor_metrics(vendors=None, batch_size=1000):
+    """
+    Recompute denormalized Vendor spend and payment metrics
+
+    One grouped query over bills covers every vendor; changed vendors are
+    written back with bulk_update.
+
+    Args:
+        vendors: Vendor queryset (defaults to all vendors)
+        batch_size: Rows per UPDATE
+
+    Returns:
+        int: Number of vendors updated
+    """
+    vendors = vendors if vendors is not None else Vendor.objects.all()
+    paid = Q(status='paid', paid_at__isnull=False)
+
+    stats = {
+        row['vendor_id']: row
+        for row in Bill.objects.filter(vendor__in=vendors).exclude(status='cancelled').values('vendor_id').annotate(
+            total_paid=_sum('amount_paid'),
+            total_bills=Count('id'),
+            average_bill_amount=Avg('total_amount'),
+            paid_bills=Count('id', filter=paid),
+            paid_on_time=Count('id', filter=paid & Q(paid_at__date__lte=F('due_date'))),
+        )
+    }
+
+    fields = ['total_paid', 'total_bills', 'average_bill_amount', 'on_time_payment_rate']
+    to_update = []
+    for vendor in vendors.only('id', *fields):
+        row = stats.get(vendor.id)
+        values = {
+            'total_paid': ZERO,
+            'total_bills': 0,
+            'average_bill_amount': ZERO,
+            'on_time_payment_rate': Decimal('100.00'),
+        }
+        if row:
+            values.update(
+                total_paid=row['total_paid'],
+                total_bills=row['total_bills'],
+                average_bill_amount=Decimal(str(row['average_bill_amount'] or 0)).quantize(Decimal('0.01')),
+            )
+            if row['paid_bills']:
+                values['on_time_payment_rate'] = (
+                    Decimal(row['paid_on_time'] * 100) / row['paid_bills']
+                ).quantize(Decimal('0.01'))
+
+        if all(getattr(vendor, field) == value for field, value in values.items()):
+            continue
+
+        for field, value in values.items():
+            setattr(vendor, field, value)
+        to_update.append(vendor)
+
+    Vendor.objects.bulk_update(to_update, fields, batch_size=batch_size)
+
+    return len(to_update)
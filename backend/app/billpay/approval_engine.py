@@ -1,110 +1,277 @@
 """
 Approval workflow engine for bills
+
+An organization's workflows are compiled once into an approval table: plain
+data holding, per workflow, its rules sorted by priority with their condition
+values already parsed and their approver IDs resolved. Tables are cached per
+organization under a revision stamp (latest workflow updated_at plus workflow
+count), so any edit to a workflow, its rules or its approvers yields a new key
+and the stale table is never read again.
+
+Routing N bills then costs a fixed number of queries: the revision stamp, the
+table on a cache miss, one bulk_create for the requests and one status UPDATE
+per outcome. Decisions are batched the same way: one UPDATE for the
+approver's requests, one grouped count of what is still open, one UPDATE
+per bill outcome and one bulk_create into the audit log.
 """
-from .models import ApprovalRequest, ApprovalWorkflow, ApprovalRule
-from decimal import Decimal
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, Max, Q, Value, When
+from django.utils import timezone
+from .models import ApprovalRequest, ApprovalWorkflow, ApprovalRule, Bill, BillAuditLog
+
+APPROVAL_TABLE_CACHE_PREFIX = 'billpay:approval-table:v2'
+
+# Requests still waiting on a decision
+OPEN_REQUEST_STATUSES = ('pending', 'escalated')
+
+
+def _parse_amount(value):
+    """Parse an amount condition once; unparseable values never match"""
+    try:
+        return Decimal(value)
+    except (InvalidOperation, TypeError):
+        return None
+
+
+# condition_type -> (parse condition_value, predicate(bill, parsed value))
+CONDITIONS = {
+    'amount_gt': (_parse_amount, lambda bill, value: value is not None and bill.total_amount > value),
+    'amount_lt': (_parse_amount, lambda bill, value: value is not None and bill.total_amount < value),
+    'category': (str, lambda bill, value: bill.category == value),
+    'vendor': (str, lambda bill, value: str(bill.vendor_id) == value),
+    'department': (str, lambda bill, value: bill.department == value),
+}
+
+
+def _revision(organization_id):
+    """Stamp that changes whenever the organization's workflows change"""
+    stamp = ApprovalWorkflow.objects.filter(organization_id=organization_id).aggregate(
+        updated=Max('updated_at'),
+        count=Count('id')
+    )
+    updated = stamp['updated'].isoformat() if stamp['updated'] else 'none'
+    return f"{updated}:{stamp['count']}"
 
 
-class ApprovalEngine:
-    """Route bills through approval workflows"""
+def compile_approval_table(organization_id):
+    """
+    Compile an organization's workflows into an approval table
     
-    def __init__(self, bill):
-        self.bill = bill
-        self.workflow = self._determine_workflow()
+    Returns:
+        dict: {
+            'default': default workflow ID or None,
+            'workflows': {workflow ID: [(condition_type, parsed value, approval_type, [approver IDs]), ...]},
+            'escalation_hours': {workflow ID: hours},
+        }
+    """
+    workflows = list(
+        ApprovalWorkflow.objects.filter(organization_id=organization_id).values_list(
+            'id', 'is_default', 'is_active', 'escalation_hours'
+        )
+    )
+    table = {
+        'default': next((wf_id for wf_id, is_default, is_active, _ in workflows if is_default and is_active), None),
+        'workflows': {wf_id: [] for wf_id, _, _, _ in workflows},
+        'escalation_hours': {wf_id: hours for wf_id, _, _, hours in workflows},
+    }
     
-    def _determine_workflow(self):
-        """Determine which workflow applies to this bill"""
-        # Check if bill has specific workflow assigned
-        if self.bill.approval_workflow:
-            return self.bill.approval_workflow
-        
-        # Use default workflow for organization
-        default_workflow = ApprovalWorkflow.objects.filter(
-            organization=self.bill.organization,
-            is_default=True,
-            is_active=True
-        ).first()
-        
-        if default_workflow:
-            return default_workflow
-        
-        return None
+    approvers = {}
+    for rule_id, user_id in ApprovalRule.approvers.through.objects.filter(
+        approvalrule__workflow__organization_id=organization_id
+    ).order_by('id').values_list('approvalrule_id', 'user_id'):
+        approvers.setdefault(rule_id, []).append(user_id)
     
-    def create_approval_requests(self):
-        """Create approval requests based on workflow rules"""
-        if not self.workflow:
-            # No approval required
-            self.bill.status = 'approved'
-            self.bill.save()
-            return []
-        
-        # Get applicable rules
-        rules = self._get_applicable_rules()
-        
-        if not rules:
-            # No rules match, auto-approve
-            self.bill.status = 'approved'
-            self.bill.save()
-            return []
-        
-        # Create approval requests
-        approval_requests = []
-        sequence = 1
+    for rule in ApprovalRule.objects.filter(workflow__organization_id=organization_id).order_by('priority').values(
+        'id', 'workflow_id', 'condition_type', 'condition_value', 'approval_type'
+    ):
+        if rule['condition_type'] not in CONDITIONS:
+            continue
+        parse, _ = CONDITIONS[rule['condition_type']]
+        table['workflows'][rule['workflow_id']].append((
+            rule['condition_type'],
+            parse(rule['condition_value']),
+            rule['approval_type'],
+            approvers.get(rule['id'], []),
+        ))
+    
+    return table
+
+
+def get_approval_table(organization_id):
+    """Approval table for an organization, compiled on first use per workflow revision"""
+    key = f"{APPROVAL_TABLE_CACHE_PREFIX}:{organization_id}:{_revision(organization_id)}"
+    table = cache.get(key)
+    if table is None:
+        table = compile_approval_table(organization_id)
+        cache.set(key, table, settings.BILL_APPROVAL_TABLE_TTL)
+    return table
+
+
+def plan_approval_requests(bill, table, now=None):
+    """
+    Approval requests a bill needs under an approval table
+    
+    Requests escalate after their workflow's escalation_hours from `now`.
+    
+    Returns:
+        tuple: (workflow ID or None, unsaved ApprovalRequest list)
+    """
+    workflow_id = bill.approval_workflow_id or table['default']
+    if workflow_id not in table['workflows']:
+        return None, []
+    
+    requests = []
+    sequence = 1
+    escalate_after = (now or timezone.now()) + timedelta(hours=table['escalation_hours'][workflow_id])
+    
+    for condition_type, value, approval_type, approver_ids in table['workflows'].get(workflow_id, []):
+        _, predicate = CONDITIONS[condition_type]
+        if not predicate(bill, value):
+            continue
         
-        for rule in rules:
-            for approver in rule.approvers.all():
-                approval_request = ApprovalRequest.objects.create(
-                    bill=self.bill,
-                    workflow=self.workflow,
-                    approver=approver,
-                    sequence=sequence,
-                    status='pending'
-                )
-                approval_requests.append(approval_request)
-                
-                if rule.approval_type == 'sequential':
-                    sequence += 1
+        for approver_id in approver_ids:
+            requests.append(ApprovalRequest(
+                bill=bill,
+                workflow_id=workflow_id,
+                approver_id=approver_id,
+                sequence=sequence,
+                status='pending',
+                escalate_after=escalate_after
+            ))
             
-            if rule.approval_type == 'parallel':
+            if approval_type == 'sequential':
                 sequence += 1
         
-        return approval_requests
+        if approval_type == 'parallel':
+            sequence += 1
     
-    def _get_applicable_rules(self):
-        """Get rules that apply to this bill"""
-        if not self.workflow:
-            return []
-        
-        applicable_rules = []
+    return workflow_id, requests
+
+
+def submit_bills_for_approval(organization_id, bill_ids):
+    """
+    Route draft bills through their approval workflows
+    
+    Bills that need approval move to pending_approval with their requests
+    created in bulk; bills no rule applies to are approved straight away.
+    Bills that are missing, not in draft or flagged as duplicates are skipped.
+    
+    Args:
+        organization_id: Organization UUID
+        bill_ids: Bill UUIDs to submit
+    
+    Returns:
+        dict: {'pending_approval': [bill IDs], 'approved': [bill IDs], 'requests': number of requests created}
+    """
+    with transaction.atomic():
+        bills = list(
+            Bill.objects.select_for_update().filter(
+                organization_id=organization_id, id__in=bill_ids, status='draft', duplicate_of__isnull=True
+            ).only('id', 'total_amount', 'category', 'department', 'vendor_id', 'approval_workflow_id')
+        )
+        if not bills:
+            return {'pending_approval': [], 'approved': [], 'requests': 0}
         
-        for rule in self.workflow.rules.all():
-            if self._rule_matches(rule):
-                applicable_rules.append(rule)
+        table = get_approval_table(organization_id)
+        now = timezone.now()
+        requests = []
+        pending, approved = [], []
         
-        # Sort by priority
-        applicable_rules.sort(key=lambda r: r.priority)
+        for bill in bills:
+            _, bill_requests = plan_approval_requests(bill, table, now)
+            requests.extend(bill_requests)
+            (pending if bill_requests else approved).append(bill.id)
         
-        return applicable_rules
+        ApprovalRequest.objects.bulk_create(requests, batch_size=settings.BILL_APPROVAL_BATCH_SIZE)
+        if pending:
+            Bill.objects.filter(id__in=pending).update(status='pending_approval', updated_at=now)
+        if approved:
+            Bill.objects.filter(id__in=approved).update(status='approved', updated_at=now)
     
-    def _rule_matches(self, rule):
-        """Check if a rule matches the bill"""
-        condition_type = rule.condition_type
-        condition_value = rule.condition_value
-        
-        if condition_type == 'amount_gt':
-            return self.bill.total_amount > Decimal(condition_value)
+    return {'pending_approval': pending, 'approved': approved, 'requests': len(requests)}
+
+
+def decide_approvals(organization_id, user, decisions, comments='', ip_address=None):
+    """
+    Record a user's approve/reject decisions on many bills
+    
+    The user decides every open request on a bill that is assigned or
+    escalated to them. A rejection rejects the bill; a bill is approved once
+    none of its requests are open and none were rejected. Bills that are no
+    longer pending approval, or that the user has nothing open on, are
+    skipped.
+    
+    Args:
+        organization_id: Organization UUID
+        user: Deciding user
+        decisions: {bill ID: 'approve' or 'reject'}
+        comments: Comment stored on every decided request
+        ip_address: Client address for the audit log
+    
+    Returns:
+        dict: {'approved': [bill IDs], 'rejected': [bill IDs], 'pending': {bill ID: open requests}}
+    """
+    now = timezone.now()
+    
+    with transaction.atomic():
+        # Bill locks serialize approvers deciding the same bills, so the open count below is final
+        bill_ids = list(
+            Bill.objects.select_for_update().filter(
+                organization_id=organization_id, id__in=decisions.keys(), status='pending_approval'
+            ).values_list('id', flat=True)
+        )
+        assigned = ApprovalRequest.objects.filter(
+            Q(approver=user) | Q(escalated_to=user),
+            bill_id__in=bill_ids,
+            status__in=OPEN_REQUEST_STATUSES
+        )
+        decided = set(assigned.values_list('bill_id', flat=True))
+        if not decided:
+            return {'approved': [], 'rejected': [], 'pending': {}}
         
-        elif condition_type == 'amount_lt':
-            return self.bill.total_amount < Decimal(condition_value)
+        rejected = [bill_id for bill_id in decided if decisions[bill_id] == 'reject']
+        accepted = [bill_id for bill_id in decided if decisions[bill_id] != 'reject']
         
-        elif condition_type == 'category':
-            return self.bill.category == condition_value
+        assigned.filter(bill_id__in=decided).update(
+            status=Case(When(bill_id__in=rejected, then=Value('rejected')), default=Value('approved')),
+            decision_date=now,
+            comments=comments,
+            updated_at=now
+        )
         
-        elif condition_type == 'vendor':
-            return str(self.bill.vendor.id) == condition_value
+        pending, vetoed = {}, set()
+        if accepted:
+            for bill_id, open_count, rejected_count in ApprovalRequest.objects.filter(
+                bill_id__in=accepted, status__in=OPEN_REQUEST_STATUSES + ('rejected',)
+            ).values('bill_id').annotate(
+                open=Count('id', filter=Q(status__in=OPEN_REQUEST_STATUSES)),
+                rejected=Count('id', filter=Q(status='rejected'))
+            ).values_list('bill_id', 'open', 'rejected'):
+                if open_count:
+                    pending[bill_id] = open_count
+                if rejected_count:
+                    vetoed.add(bill_id)
+        approved = [bill_id for bill_id in accepted if bill_id not in pending and bill_id not in vetoed]
         
-        elif condition_type == 'department':
-            return self.bill.department == condition_value
+        if rejected:
+            Bill.objects.filter(id__in=rejected).update(status='rejected', updated_at=now)
+        if approved:
+            Bill.objects.filter(id__in=approved).update(status='approved', updated_at=now)
         
-        return False
-
+        BillAuditLog.objects.bulk_create([
+            BillAuditLog(
+                bill_id=bill_id,
+                action='rejected' if bill_id in rejected else 'approved',
+                description=f"{'Rejected' if bill_id in rejected else 'Approved'} by {user.name}",
+                changes={'comments': comments, 'pending_approvals': pending.get(bill_id, 0)},
+                performed_by=user,
+                ip_address=ip_address
+            )
+            for bill_id in decided
+        ], batch_size=settings.BILL_APPROVAL_BATCH_SIZE)
+    
+    return {'approved': approved, 'rejected': rejected, 'pending': pending}
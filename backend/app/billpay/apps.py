@@ -8,4 +8,6 @@ class BillPayConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app.billpay'
     verbose_name = 'Bill Pay Automation'
-
+    
+    def ready(self):
+        from . import signals  # noqa: F401
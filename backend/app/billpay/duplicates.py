@@ -0,0 +1,222 @@
+"""
+Duplicate bill detection
+
+The same vendor invoice often arrives twice: typed in by hand, forwarded by
+email, scanned, or pushed over the API, each with its own bill number
+format ("INV-00123", "Invoice #123", "123"). Every bill keeps a normalized
+bill number, and a bill is a likely duplicate of an earlier bill from the
+same vendor that has the same normalized number. When either bill has no
+number to compare, the same amount with bill dates less than
+DUPLICATE_WINDOW_DAYS apart stands in for it; two bills whose numbers
+differ are never duplicates, so a vendor's flat weekly bills are not
+flagged. Both checks are range lookups on the (vendor,
+normalized_bill_number) and (vendor, total_amount, bill_date) indexes.
+
+Drafts the recurring-bill generator creates are placeholders for a vendor
+bill that has not arrived yet, never originals, and their generated numbers
+carry no identity: the real bill supersedes its placeholder (which is
+flagged as the duplicate), and a placeholder generated after the real bill
+was entered is flagged as it is created.
+"""
+import re
+from collections import defaultdict
+from datetime import timedelta
+from itertools import groupby
+from django.db.models import Q
+from django.utils import timezone
+from .models import Bill
+
+DUPLICATE_WINDOW_DAYS = 7
+
+# Recurring-generated drafts awaiting the real vendor bill
+GENERATED_PLACEHOLDER = Q(recurring_schedule__isnull=False, status='draft')
+
+# Leading labels that carry no identity ("INV-", "Invoice #", "Bill No.") when followed by digits
+NUMBER_PREFIX = re.compile(r'^(?:INVOICE|INV|BILL|NUMBER|NUM|NO|REF)+(?=[0-9])')
+NON_ALPHANUMERIC = re.compile(r'[^A-Z0-9]')
+
+
+def normalize_bill_number(bill_number):
+    """Canonical form of a bill number for duplicate matching"""
+    normalized = NON_ALPHANUMERIC.sub('', (bill_number or '').upper())
+    stripped = NUMBER_PREFIX.sub('', normalized).lstrip('0')
+    # Keep the original when stripping leaves nothing (e.g. "INV" or "000")
+    return stripped or normalized
+
+
+def is_placeholder(bill):
+    """Whether a bill is a recurring-generated draft"""
+    return bill.recurring_schedule_id is not None and bill.status == 'draft'
+
+
+def _matching_number(bill, normalized):
+    """Normalized number a bill is matched on; blank for placeholders"""
+    return '' if is_placeholder(bill) else normalized
+
+
+def _within_window(first_date, second_date):
+    """Whether two bill dates are less than DUPLICATE_WINDOW_DAYS apart"""
+    return abs((first_date - second_date).days) < DUPLICATE_WINDOW_DAYS
+
+
+def _same_amount_nearby(bill):
+    return Q(
+        total_amount=bill.total_amount,
+        bill_date__gt=bill.bill_date - timedelta(days=DUPLICATE_WINDOW_DAYS),
+        bill_date__lt=bill.bill_date + timedelta(days=DUPLICATE_WINDOW_DAYS)
+    )
+
+
+def find_duplicate(bill):
+    """
+    Earliest live bill created before `bill` that it appears to duplicate
+
+    Returns:
+        Bill or None
+    """
+    matches = _same_amount_nearby(bill)
+    number = _matching_number(bill, bill.normalized_bill_number)
+    if number:
+        # Numbered bills match on the number, or on amount and date against an unnumbered bill
+        matches = Q(normalized_bill_number=number) | (matches & Q(normalized_bill_number=''))
+
+    return Bill.objects.filter(
+        matches,
+        vendor_id=bill.vendor_id,
+        created_at__lt=bill.created_at,
+        duplicate_of__isnull=True
+    ).exclude(id=bill.id).exclude(status='cancelled').exclude(GENERATED_PLACEHOLDER).order_by(
+        'created_at'
+    ).only('id', 'bill_number').first()
+
+
+def supersede_placeholders(bill):
+    """
+    Flag the recurring placeholders a real bill arrived for as its duplicates
+
+    Returns:
+        int: Placeholders flagged
+    """
+    return Bill.objects.filter(
+        GENERATED_PLACEHOLDER,
+        _same_amount_nearby(bill),
+        vendor_id=bill.vendor_id,
+        duplicate_of__isnull=True,
+        duplicate_reviewed=False
+    ).exclude(id=bill.id).update(duplicate_of=bill, updated_at=timezone.now())
+
+
+def flag_generated_duplicates(bills):
+    """
+    Point unsaved generated bills at a real bill already entered for their cycle
+
+    One query covers the whole list: candidate bills for its vendors and
+    amounts are loaded once and matched on the date window in memory.
+    Generated numbers carry no identity, so any real bill matches.
+    """
+    if not bills:
+        return
+
+    window = timedelta(days=DUPLICATE_WINDOW_DAYS)
+    candidates = defaultdict(list)
+    for vendor_id, total_amount, bill_date, bill_id in Bill.objects.filter(
+        vendor_id__in={bill.vendor_id for bill in bills},
+        total_amount__in={bill.total_amount for bill in bills},
+        bill_date__range=(min(bill.bill_date for bill in bills) - window, max(bill.bill_date for bill in bills) + window),
+        duplicate_of__isnull=True
+    ).exclude(status='cancelled').exclude(GENERATED_PLACEHOLDER).order_by('created_at').values_list(
+        'vendor_id', 'total_amount', 'bill_date', 'id'
+    ):
+        candidates[(str(vendor_id), total_amount)].append((bill_date, bill_id))
+
+    for bill in bills:
+        bill.duplicate_of_id = next((
+            bill_id for bill_date, bill_id in candidates.get((str(bill.vendor_id), bill.total_amount), [])
+            if _within_window(bill_date, bill.bill_date)
+        ), None)
+
+
+def check_duplicate(bill):
+    """
+    Refresh a bill's normalized number and duplicate flag after it is written
+
+    Bills a user has reviewed as not duplicates are never re-flagged. A
+    real bill that duplicates nothing supersedes its recurring placeholders.
+
+    Returns:
+        Bill or None: The bill it duplicates
+    """
+    bill.normalized_bill_number = normalize_bill_number(bill.bill_number)
+    original = None if bill.duplicate_reviewed else find_duplicate(bill)
+    bill.duplicate_of = original
+    bill.save(update_fields=['normalized_bill_number', 'duplicate_of', 'updated_at'])
+    if original is None and not is_placeholder(bill):
+        supersede_placeholders(bill)
+    return original
+
+
+def backscan_duplicates(bills, dry_run=False, batch_size=1000):
+    """
+    Normalize bill numbers and flag duplicates across existing bills
+
+    Bills are streamed ordered by vendor and creation time; each vendor's
+    bills are matched in memory against the earlier ones, and changes are
+    written with bulk_update.
+
+    Args:
+        bills: Bill queryset to scan
+        dry_run: Report without writing
+        batch_size: Rows per UPDATE
+
+    Returns:
+        list: (bill ID, duplicate-of bill ID) for newly flagged bills
+    """
+    flagged = []
+    to_update = []
+
+    rows = bills.exclude(status='cancelled').order_by('vendor_id', 'created_at').only(
+        'id', 'vendor_id', 'bill_number', 'bill_date', 'total_amount', 'status', 'recurring_schedule_id',
+        'normalized_bill_number', 'duplicate_of_id', 'duplicate_reviewed'
+    ).iterator(chunk_size=batch_size)
+
+    for _, vendor_bills in groupby(rows, key=lambda bill: bill.vendor_id):
+        by_number = {}
+        by_amount = {}
+
+        for bill in vendor_bills:
+            normalized = normalize_bill_number(bill.bill_number)
+            number = _matching_number(bill, normalized)
+            original = None
+            if not bill.duplicate_reviewed:
+                original = by_number.get(number) if number else None
+                if original is None:
+                    original = next((
+                        earlier for earlier, earlier_number in by_amount.get(bill.total_amount, [])
+                        if not (number and earlier_number) and _within_window(earlier.bill_date, bill.bill_date)
+                    ), None)
+
+            # Placeholders are never originals
+            if original is None and not is_placeholder(bill):
+                if number:
+                    by_number.setdefault(number, bill)
+                by_amount.setdefault(bill.total_amount, []).append((bill, number))
+
+            duplicate_of_id = original.id if original else None
+            if bill.normalized_bill_number == normalized and bill.duplicate_of_id == duplicate_of_id:
+                continue
+
+            if duplicate_of_id and bill.duplicate_of_id != duplicate_of_id:
+                flagged.append((bill.id, duplicate_of_id))
+            bill.normalized_bill_number = normalized
+            bill.duplicate_of_id = duplicate_of_id
+            to_update.append(bill)
+
+            if len(to_update) >= batch_size:
+                if not dry_run:
+                    Bill.objects.bulk_update(to_update, ['normalized_bill_number', 'duplicate_of'])
+                to_update = []
+
+    if to_update and not dry_run:
+        Bill.objects.bulk_update(to_update, ['normalized_bill_number', 'duplicate_of'])
+
+    return flagged
@@ -0,0 +1,33 @@
+"""
+Normalize bill numbers and flag likely duplicate bills
+"""
+from django.core.management.base import BaseCommand
+
+from app.billpay.duplicates import backscan_duplicates
+from app.billpay.models import Bill
+
+
+class Command(BaseCommand):
+    help = 'Back-scan existing bills for likely duplicates (same vendor, bill number or amount and date)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--org', dest='org_id', help='Only scan bills of this organization')
+        parser.add_argument('--dry-run', action='store_true', help='Report duplicates without flagging them')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Bills per UPDATE')
+
+    def handle(self, *args, **options):
+        bills = Bill.objects.all()
+        if options['org_id']:
+            bills = bills.filter(organization_id=options['org_id'])
+
+        flagged = backscan_duplicates(
+            bills,
+            dry_run=options['dry_run'],
+            batch_size=options['batch_size']
+        )
+
+        for bill_id, original_id in flagged:
+            self.stdout.write(f'{bill_id}: duplicate of {original_id}')
+
+        verb = 'Found' if options['dry_run'] else 'Flagged'
+        self.stdout.write(self.style.SUCCESS(f'✓ {verb} {len(flagged)} likely duplicate bills'))
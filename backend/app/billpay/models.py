@@ -129,6 +129,7 @@ class Bill(models.Model):
     status = models.CharField(max_length=30, choices=STATUS_CHOICES, default='draft')
     amount_paid = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     paid_at = models.DateTimeField(null=True, blank=True)
+    due_soon_notified_at = models.DateTimeField(null=True, blank=True)  # Set by the due-soon transition
     
     # Scheduled payment
     scheduled_payment_date = models.DateField(null=True, blank=True)
@@ -156,6 +157,11 @@ class Bill(models.Model):
     requires_approval = models.BooleanField(default=True)
     approval_workflow = models.ForeignKey('ApprovalWorkflow', on_delete=models.SET_NULL, null=True, blank=True)
     
+    # Duplicate detection (maintained by app.billpay.duplicates)
+    normalized_bill_number = models.CharField(max_length=100, blank=True)
+    duplicate_of = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='duplicates')
+    duplicate_reviewed = models.BooleanField(default=False)  # Marked as not a duplicate; never re-flagged
+    
     # Metadata
     description = models.TextField(blank=True)
     notes = models.TextField(blank=True)
@@ -173,6 +179,9 @@ class Bill(models.Model):
             models.Index(fields=['organization', 'status']),
             models.Index(fields=['due_date']),
             models.Index(fields=['vendor']),
+            # Duplicate candidate lookups
+            models.Index(fields=['vendor', 'normalized_bill_number']),
+            models.Index(fields=['vendor', 'total_amount', 'bill_date']),
         ]
     
     def __str__(self):
@@ -307,6 +316,7 @@ class ApprovalRequest(models.Model):
     comments = models.TextField(blank=True)
     
     # Escalation
+    escalate_after = models.DateTimeField(null=True, blank=True)  # Workflow SLA deadline, set on creation
     escalated_at = models.DateTimeField(null=True, blank=True)
     escalated_to = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='escalated_approvals')
     
@@ -316,6 +326,9 @@ class ApprovalRequest(models.Model):
     class Meta:
         db_table = 'billpay_approval_request'
         ordering = ['sequence', 'created_at']
+        indexes = [
+            models.Index(fields=['status', 'escalate_after']),
+        ]
     
     def __str__(self):
         return f"{self.bill.bill_number} - {self.approver.name} ({self.status})"
@@ -357,6 +370,9 @@ class RecurringSchedule(models.Model):
     last_generated_date = models.DateField(null=True, blank=True)
     next_expected_date = models.DateField(null=True, blank=True)
     
+    # Set when created or refreshed by the recurring-bill detector; manual schedules stay null
+    detected_at = models.DateTimeField(null=True, blank=True)
+    
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -1,71 +1,391 @@
 """
 OCR processing for bill capture
+
+Pages are recognised by Tesseract, one tesseract process per page, driven
+from a bounded worker pool. Recognition runs outside the interpreter, so
+pool threads give real per-core parallelism and keep working inside
+daemonic Celery prefork workers (which may not start process pools of
+their own); multi-page PDFs are rasterized and recognised page-parallel.
+
+Raw OCR output is cached in default storage under a hash of the uploaded
+file, so a duplicate upload skips recognition entirely. Parsing and vendor
+matching are cheap and always rerun against the organization's current
+vendors.
 """
-from decimal import Decimal
-from datetime import datetime
+import hashlib
+import io
+import json
+import os
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from difflib import SequenceMatcher
+
+import pytesseract
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from pdf2image import convert_from_bytes, pdfinfo_from_bytes
+from PIL import Image
+
+# One core per tesseract process; parallelism comes from the pool
+os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+
+# Bump when recognition settings change so cached OCR output is not reused
+OCR_CACHE_VERSION = 1
+
+# Vendor names are looked for in the first lines of the first page
+VENDOR_HEADER_LINES = 8
+
+AMOUNT_PATTERN = re.compile(r'\$?\s?((?:\d{1,3}(?:,\d{3})+|\d+)\.\d{2})(?!\d)')
+
+DATE_PATTERNS = [
+    (re.compile(r'\b(\d{4}-\d{1,2}-\d{1,2})\b'), ['%Y-%m-%d']),
+    (re.compile(r'\b(\d{1,2}/\d{1,2}/\d{4})\b'), ['%m/%d/%Y', '%d/%m/%Y']),
+    (re.compile(r'\b(\d{1,2}-\d{1,2}-\d{4})\b'), ['%m-%d-%Y', '%d-%m-%Y']),
+    (re.compile(r'\b(\d{1,2}/\d{1,2}/\d{2})\b'), ['%m/%d/%y']),
+    (re.compile(r'\b([A-Z][a-z]{2,8}\.? \d{1,2},? \d{4})\b'), ['%B %d %Y', '%b %d %Y']),
+    (re.compile(r'\b(\d{1,2} [A-Z][a-z]{2,8}\.? \d{4})\b'), ['%d %B %Y', '%d %b %Y']),
+]
+
+BILL_NUMBER_PATTERN = re.compile(
+    r'\b(?:invoice|inv|bill|statement)\b\.?\s*(?:number|no\.?|num|#)?\s*[:#]?\s*'
+    r'([A-Z0-9][A-Z0-9\-_/.]*\d[A-Z0-9\-_/.]*)',
+    re.IGNORECASE
+)
+DUE_DATE_LABEL = re.compile(r'\bdue\b', re.IGNORECASE)
+BILL_DATE_LABEL = re.compile(r'\bdate\b', re.IGNORECASE)
+NET_TERMS_PATTERN = re.compile(r'\bnet\s*(\d{1,3})\b', re.IGNORECASE)
+
+# Checked in order; the first label with an amount on its line wins
+TOTAL_LABELS = [
+    re.compile(r'\b(?:amount|balance|total)\s+due\b', re.IGNORECASE),
+    re.compile(r'(?<!sub)(?<!sub )(?<!sub-)\btotal\b', re.IGNORECASE),
+]
+SUBTOTAL_LABEL = re.compile(r'\bsub\s*-?\s*total\b', re.IGNORECASE)
+TAX_LABEL = re.compile(r'\b(?:sales\s+)?(?:tax|vat|gst)\b', re.IGNORECASE)
+
+LINE_ITEM_PATTERN = re.compile(
+    r'^(?P<description>[A-Za-z].*?)\s+(?P<quantity>\d+(?:\.\d+)?)\s+'
+    r'\$?(?P<unit_price>[\d,]+\.\d{2})\s+\$?(?P<amount>[\d,]+\.\d{2})$'
+)
+
+HEADER_SKIP_PATTERN = re.compile(r'\b(?:invoice|bill|statement|page|date|tax|total)\b', re.IGNORECASE)
+VENDOR_SUFFIXES = {'inc', 'incorporated', 'llc', 'ltd', 'limited', 'co', 'corp', 'corporation', 'company', 'plc', 'gmbh'}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_ocr_executor():
+    """Shared pool that runs tesseract and rasterization jobs"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.BILL_OCR_WORKERS,
+                thread_name_prefix='bill-ocr'
+            )
+    return _executor
+
+
+def ocr_image(image):
+    """
+    Recognise one page image
+    
+    Args:
+        image: PIL image
+    
+    Returns:
+        dict: {'text': page text, 'confidence': mean word confidence 0-1}
+    """
+    data = pytesseract.image_to_data(
+        image,
+        lang=settings.BILL_OCR_LANG,
+        config='--psm 4',
+        output_type=pytesseract.Output.DICT
+    )
+    
+    lines = {}
+    confidences = []
+    for index, word in enumerate(data['text']):
+        word = word.strip()
+        confidence = float(data['conf'][index])
+        if not word or confidence < 0:
+            continue
+        key = (data['block_num'][index], data['par_num'][index], data['line_num'][index])
+        lines.setdefault(key, []).append(word)
+        confidences.append(confidence)
+    
+    return {
+        'text': '\n'.join(' '.join(words) for _, words in sorted(lines.items())),
+        'confidence': round(sum(confidences) / len(confidences) / 100, 4) if confidences else 0.0,
+    }
+
+
+def _ocr_image_bytes(content):
+    with Image.open(io.BytesIO(content)) as image:
+        return ocr_image(image.convert('L'))
+
+
+def _ocr_pdf_page(content, page_number):
+    pages = convert_from_bytes(
+        content,
+        dpi=settings.BILL_OCR_DPI,
+        first_page=page_number,
+        last_page=page_number,
+        grayscale=True
+    )
+    return ocr_image(pages[0])
+
+
+def recognize_document(content):
+    """
+    OCR a bill image or PDF, reusing the cached result for identical files
+    
+    Args:
+        content: File bytes
+    
+    Returns:
+        dict: {'hash': SHA-256 of the file, 'pages': [{'text', 'confidence'}, ...]}
+    """
+    content_hash = hashlib.sha256(content).hexdigest()
+    path = f"{settings.BILL_OCR_CACHE_PREFIX}/v{OCR_CACHE_VERSION}/{content_hash}.json"
+    
+    if default_storage.exists(path):
+        with default_storage.open(path, 'rb') as cached:
+            return json.loads(cached.read())
+    
+    executor = get_ocr_executor()
+    if content.startswith(b'%PDF'):
+        page_count = pdfinfo_from_bytes(content)['Pages']
+        pages = list(executor.map(lambda page: _ocr_pdf_page(content, page), range(1, page_count + 1)))
+    else:
+        pages = [executor.submit(_ocr_image_bytes, content).result()]
+    
+    result = {'hash': content_hash, 'pages': pages}
+    if not default_storage.exists(path):
+        default_storage.save(path, ContentFile(json.dumps(result).encode('utf-8')))
+    
+    return result
+
+
+def normalize_vendor_name(name):
+    """Lowercase, strip punctuation and corporate suffixes"""
+    words = re.sub(r'[^a-z0-9 ]+', ' ', (name or '').lower()).split()
+    return ' '.join(word for word in words if word not in VENDOR_SUFFIXES)
 
 
 class OCRProcessor:
     """Extract data from bill images using OCR"""
     
     @staticmethod
-    def process_bill_image(image_path):
+    def process_bill_image(image_path, organization_id=None):
         """
-        Process bill image and extract data
-        In production, this would use Tesseract, Google Vision API, or AWS Textract
+        Process a bill image or PDF stored on disk and extract data
         """
-        # Mock implementation
-        extracted_data = {
-            'vendor_name': None,
-            'bill_number': None,
-            'bill_date': None,
-            'due_date': None,
-            'total_amount': None,
-            'line_items': [],
-            'confidence': Decimal('0.85'),  # Overall confidence score
-            'raw_text': ''
-        }
+        with open(image_path, 'rb') as document:
+            return OCRProcessor.process_document(document.read(), organization_id)
+    
+    @staticmethod
+    def process_document(content, organization_id=None):
+        """
+        OCR a bill document and parse it into bill fields
         
-        # In production:
-        # 1. Use OCR library (pytesseract, google-cloud-vision, boto3 textract)
-        # 2. Extract text from image
-        # 3. Parse structured data using regex patterns
-        # 4. Validate extracted data
-        # 5. Return structured results
+        Args:
+            content: Image or PDF bytes
+            organization_id: Match the vendor against this organization's vendors
+        
+        Returns:
+            dict: Extracted fields, confidence and raw text
+        """
+        recognized = recognize_document(content)
+        pages = recognized['pages']
+        raw_text = '\n'.join(page['text'] for page in pages)
         
+        extracted_data = OCRProcessor.parse_text(raw_text)
+        extracted_data['vendor_id'] = None
+        extracted_data['vendor_match_score'] = None
+        
+        if organization_id:
+            from .models import Vendor
+            vendors = Vendor.objects.filter(
+                organization_id=organization_id, is_active=True
+            ).values_list('id', 'name', 'company_name')
+            match = OCRProcessor.match_vendor(pages[0]['text'] if pages else '', vendors)
+            if match:
+                vendor_id, vendor_name, score = match
+                extracted_data.update(vendor_id=vendor_id, vendor_name=vendor_name, vendor_match_score=score)
+        
+        ocr_confidence = sum(page['confidence'] for page in pages) / len(pages) if pages else 0
+        validation = OCRProcessor.validate_extraction(extracted_data)
+        
+        extracted_data.update(
+            confidence=(Decimal(str(ocr_confidence)) * validation['confidence']).quantize(Decimal('0.01')),
+            ocr_confidence=round(ocr_confidence, 4),
+            missing_fields=validation['missing_fields'],
+            page_count=len(pages),
+            image_hash=recognized['hash'],
+            raw_text=raw_text
+        )
         return extracted_data
     
+    @staticmethod
+    def parse_text(text):
+        """Parse OCR text into bill fields"""
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        
+        bill_number = None
+        for line in lines:
+            match = BILL_NUMBER_PATTERN.search(line)
+            if match:
+                bill_number = match.group(1).rstrip('.')
+                break
+        
+        bill_date, due_date = OCRProcessor.parse_bill_dates(lines)
+        
+        return {
+            'vendor_name': OCRProcessor.parse_vendor_name(text),
+            'bill_number': bill_number,
+            'bill_date': bill_date,
+            'due_date': due_date,
+            'subtotal': OCRProcessor._labeled_amount(lines, [SUBTOTAL_LABEL]),
+            'tax_amount': OCRProcessor._labeled_amount(lines, [TAX_LABEL], exclude=TOTAL_LABELS + [SUBTOTAL_LABEL]),
+            'total_amount': OCRProcessor._labeled_amount(lines, TOTAL_LABELS, exclude=[SUBTOTAL_LABEL])
+                or max(OCRProcessor.parse_amounts(text), default=None),
+            'line_items': OCRProcessor.parse_line_items(lines),
+        }
+    
     @staticmethod
     def parse_vendor_name(text):
-        """Extract vendor name from OCR text"""
-        # Implementation would use NLP/regex patterns
+        """Extract vendor name from OCR text (first plausible header line)"""
+        for line in text.splitlines()[:VENDOR_HEADER_LINES]:
+            line = line.strip()
+            if len(re.findall(r'[A-Za-z]', line)) >= 3 and not HEADER_SKIP_PATTERN.search(line) \
+                    and not AMOUNT_PATTERN.search(line):
+                return line
         return None
     
+    @staticmethod
+    def match_vendor(text, vendors):
+        """
+        Fuzzy-match OCR text against known vendors
+        
+        Args:
+            text: OCR text (the vendor is expected near the top)
+            vendors: Iterable of (id, name, company_name)
+        
+        Returns:
+            tuple: (vendor_id, vendor_name, score) or None below the threshold
+        """
+        threshold = settings.BILL_OCR_VENDOR_MATCH_THRESHOLD
+        header = [
+            normalized for normalized in (
+                normalize_vendor_name(line) for line in text.splitlines()[:VENDOR_HEADER_LINES]
+            ) if normalized
+        ]
+        padded_text = f" {normalize_vendor_name(text)} "
+        
+        best = None
+        for vendor_id, name, company_name in vendors:
+            for candidate in filter(None, {normalize_vendor_name(name), normalize_vendor_name(company_name)}):
+                if f" {candidate} " in padded_text:
+                    score = 1.0
+                else:
+                    score = 0.0
+                    for line in header:
+                        matcher = SequenceMatcher(None, candidate, line)
+                        if matcher.real_quick_ratio() >= threshold and matcher.quick_ratio() >= threshold:
+                            score = max(score, matcher.ratio())
+                
+                if score >= threshold and (best is None or score > best[2]):
+                    best = (vendor_id, name, round(score, 4))
+        
+        return best
+    
     @staticmethod
     def parse_amounts(text):
         """Extract amounts from OCR text"""
-        # Find all currency amounts
-        pattern = r'\$?\d+[,.]?\d*'
-        amounts = re.findall(pattern, text)
-        return [Decimal(amt.replace('$', '').replace(',', '')) for amt in amounts]
+        amounts = []
+        for amount in AMOUNT_PATTERN.findall(text):
+            try:
+                amounts.append(Decimal(amount.replace(',', '')))
+            except InvalidOperation:
+                continue
+        return amounts
     
     @staticmethod
     def parse_dates(text):
-        """Extract dates from OCR text"""
-        # Common date patterns
-        patterns = [
-            r'\d{1,2}/\d{1,2}/\d{4}',
-            r'\d{1,2}-\d{1,2}-\d{4}',
-            r'\d{4}-\d{1,2}-\d{1,2}'
-        ]
+        """Extract dates from OCR text, in order of appearance"""
+        found = []
+        for pattern, formats in DATE_PATTERNS:
+            for match in pattern.finditer(text):
+                value = match.group(1).replace('.', '').replace(',', '')
+                for date_format in formats:
+                    try:
+                        found.append((match.start(), datetime.strptime(value, date_format).date()))
+                        break
+                    except ValueError:
+                        continue
+        
+        return [parsed for _, parsed in sorted(found, key=lambda item: item[0])]
+    
+    @staticmethod
+    def parse_bill_dates(lines):
+        """Pick the bill date and due date, using labels, then payment terms, then order"""
+        bill_date = due_date = None
+        
+        for line in lines:
+            dates = OCRProcessor.parse_dates(line)
+            if not dates:
+                continue
+            if DUE_DATE_LABEL.search(line):
+                due_date = due_date or dates[-1]
+            elif BILL_DATE_LABEL.search(line):
+                bill_date = bill_date or dates[0]
+        
+        all_dates = OCRProcessor.parse_dates('\n'.join(lines))
+        if not bill_date and all_dates:
+            bill_date = min(all_dates)
         
-        dates = []
-        for pattern in patterns:
-            matches = re.findall(pattern, text)
-            dates.extend(matches)
+        if not due_date and bill_date:
+            terms = NET_TERMS_PATTERN.search('\n'.join(lines))
+            if terms:
+                due_date = bill_date + timedelta(days=int(terms.group(1)))
+            elif all_dates and max(all_dates) > bill_date:
+                due_date = max(all_dates)
         
-        return dates
+        return bill_date, due_date
+    
+    @staticmethod
+    def parse_line_items(lines):
+        """Extract 'description qty unit_price amount' rows"""
+        line_items = []
+        for line in lines:
+            if any(label.search(line) for label in TOTAL_LABELS + [SUBTOTAL_LABEL, TAX_LABEL]):
+                continue
+            match = LINE_ITEM_PATTERN.match(line)
+            if match:
+                line_items.append({
+                    'description': match.group('description'),
+                    'quantity': Decimal(match.group('quantity')),
+                    'unit_price': Decimal(match.group('unit_price').replace(',', '')),
+                    'amount': Decimal(match.group('amount').replace(',', '')),
+                })
+        return line_items
+    
+    @staticmethod
+    def _labeled_amount(lines, labels, exclude=()):
+        """Last amount on the last line carrying the highest-priority label"""
+        for label in labels:
+            for line in reversed(lines):
+                if label.search(line) and not any(other.search(line) for other in exclude):
+                    amounts = OCRProcessor.parse_amounts(line)
+                    if amounts:
+                        return amounts[-1]
+        return None
     
     @staticmethod
     def validate_extraction(data):
@@ -86,3 +406,11 @@ class OCRProcessor:
             'missing_fields': missing_fields
         }
 
+    @staticmethod
+    def apply_to_bill(bill, extracted_data):
+        """Store OCR results on a bill (ocr_data is kept JSON-safe)"""
+        bill.ocr_data = json.loads(json.dumps(extracted_data, default=str))
+        bill.ocr_confidence = extracted_data['confidence']
+        bill.capture_method = 'ocr'
+        bill.save(update_fields=['ocr_data', 'ocr_confidence', 'capture_method', 'updated_at'])
+        return bill
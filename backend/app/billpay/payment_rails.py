@@ -0,0 +1,73 @@
+"""
+Payment rails for bill payments
+
+A rail moves money for a chunk of BillPayment rows and reports one outcome
+per payment. The active rail is configured with BILL_PAYMENT_RAIL (a dotted
+path); LocalPaymentRail settles everything in-process and is the default for
+development and tests. Every payment is sent under idempotency_key(), which
+stays the same when a stuck payment is resubmitted: a rail must return the
+original outcome for a key it has already seen instead of paying again.
+"""
+import uuid
+from dataclasses import dataclass
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+@dataclass
+class RailResult:
+    """Outcome of one payment on a rail"""
+    payment_id: uuid.UUID
+    success: bool
+    transaction_id: str = ''
+    confirmation_number: str = ''
+    error: str = ''
+
+
+class PaymentRail:
+    """Interface for payment rails"""
+    
+    name = 'base'
+    
+    @staticmethod
+    def idempotency_key(payment):
+        """Key the processor deduplicates a payment's submissions by"""
+        return f"billpay-payment-{payment.id}"
+    
+    def send_payments(self, payments):
+        """
+        Submit payments to the rail, each under its idempotency_key()
+        
+        Args:
+            payments: BillPayment objects (with bill and bill.vendor loaded)
+        
+        Returns:
+            list: RailResult per payment
+        """
+        raise NotImplementedError
+
+
+class LocalPaymentRail(PaymentRail):
+    """Settles every payment immediately without contacting a processor"""
+    
+    name = 'local'
+    
+    def send_payments(self, payments):
+        results = []
+        for payment in payments:
+            if payment.amount <= 0:
+                results.append(RailResult(payment.id, False, error='Payment amount must be positive'))
+                continue
+            
+            results.append(RailResult(
+                payment.id,
+                True,
+                transaction_id=f"local_{payment.id.hex}",
+                confirmation_number=payment.id.hex[:12].upper()
+            ))
+        return results
+
+
+def get_payment_rail():
+    """Instantiate the configured payment rail"""
+    return import_string(settings.BILL_PAYMENT_RAIL)()
@@ -0,0 +1,221 @@
+"""
+Payment batch execution
+
+A PaymentBatch is split into chunks of payments, and each chunk is paid in
+three steps so money never moves inside a transaction that can roll back:
+
+1. Claim: the chunk's pending payments are locked with
+   select_for_update(skip_locked) and moved to processing, committed before
+   the rail is called. A redelivered chunk or a second run of the batch
+   finds nothing pending and pays nothing.
+2. Send: the claimed payments go to the payment rail in one call, outside
+   any transaction, each under its own idempotency key.
+3. Settle: the chunk's bills are locked (in ID order, so concurrent chunks
+   never deadlock) and payments and bills are written back with one
+   bulk_update each.
+
+If anything fails after the claim, the payments stay in processing: the
+rail may already have paid them, so they are never marked failed. Once
+they have been processing for BILL_PAYMENT_RECONCILE_AFTER seconds,
+reconcile_payments resubmits them under the same idempotency keys and
+settles whatever the rail reports.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import Bill, BillPayment, PaymentBatch
+from .payment_rails import get_payment_rail
+
+# Error entries kept per chunk in processing_results
+MAX_REPORTED_ERRORS = 50
+
+
+def chunk_payment_ids(batch, chunk_size):
+    """Split a batch's pending payment IDs into chunks"""
+    payment_ids = [
+        str(payment_id)
+        for payment_id in batch.payments.filter(status='pending').order_by('id').values_list('id', flat=True)
+    ]
+    return [payment_ids[start:start + chunk_size] for start in range(0, len(payment_ids), chunk_size)]
+
+
+def claim_payments(payment_ids, stale_before=None):
+    """
+    Move payments to processing and commit before any money moves
+    
+    Pending payments are claimed; with `stale_before`, payments left in
+    processing since before then are reclaimed instead. Rows another worker
+    has locked are skipped.
+    
+    Returns:
+        list: Claimed BillPayment objects with bill and bill.vendor loaded
+    """
+    claimable = Q(status='processing', updated_at__lt=stale_before) if stale_before else Q(status='pending')
+    
+    with transaction.atomic():
+        claimed = list(
+            BillPayment.objects.select_for_update(skip_locked=True).filter(
+                claimable, id__in=payment_ids
+            ).values_list('id', flat=True)
+        )
+        BillPayment.objects.filter(id__in=claimed).update(status='processing', updated_at=timezone.now())
+    
+    return list(BillPayment.objects.filter(id__in=claimed).select_related('bill__vendor'))
+
+
+def settle_payments(payments, outcomes, rail_name):
+    """
+    Write a rail's outcomes back to claimed payments and their bills
+    
+    Payments without an outcome stay in processing for reconciliation.
+    
+    Returns:
+        dict: {'success': int, 'failed': int, 'processing': int, 'amount_paid': str,
+               'errors': [{'payment_id', 'error'}]}
+    """
+    now = timezone.now()
+    summary = {'success': 0, 'failed': 0, 'processing': 0, 'amount_paid': Decimal('0.00'), 'errors': []}
+    
+    with transaction.atomic():
+        # Only payments still processing are settled, so an outcome is never applied twice
+        unsettled = set(
+            BillPayment.objects.select_for_update().filter(
+                id__in=[payment.id for payment in payments], status='processing'
+            ).values_list('id', flat=True)
+        )
+        payments = [payment for payment in payments if payment.id in unsettled]
+        bills = {
+            bill.id: bill
+            for bill in Bill.objects.select_for_update().filter(
+                id__in={payment.bill_id for payment in payments}
+            ).order_by('id')
+        }
+        
+        settled = []
+        paid_bills = {}
+        for payment in payments:
+            result = outcomes.get(payment.id)
+            if result is None:
+                summary['processing'] += 1
+                if len(summary['errors']) < MAX_REPORTED_ERRORS:
+                    summary['errors'].append({'payment_id': str(payment.id), 'error': f'No result from {rail_name} rail'})
+                continue
+            
+            payment.updated_at = now
+            settled.append(payment)
+            
+            if not result.success:
+                payment.status = 'failed'
+                summary['failed'] += 1
+                if len(summary['errors']) < MAX_REPORTED_ERRORS:
+                    summary['errors'].append({'payment_id': str(payment.id), 'error': result.error})
+                continue
+            
+            payment.status = 'completed'
+            payment.transaction_id = result.transaction_id
+            payment.confirmation_number = result.confirmation_number
+            summary['success'] += 1
+            summary['amount_paid'] += payment.amount
+            
+            bill = bills[payment.bill_id]
+            bill.amount_paid += payment.amount
+            if bill.amount_paid >= bill.total_amount and bill.status != 'paid':
+                bill.status = 'paid'
+                bill.paid_at = now
+            bill.updated_at = now
+            paid_bills[bill.id] = bill
+        
+        BillPayment.objects.bulk_update(
+            settled, ['status', 'transaction_id', 'confirmation_number', 'updated_at']
+        )
+        Bill.objects.bulk_update(paid_bills.values(), ['amount_paid', 'status', 'paid_at', 'updated_at'])
+    
+    summary['amount_paid'] = str(summary['amount_paid'])
+    return summary
+
+
+def execute_payment_chunk(payment_ids, rail=None, stale_before=None):
+    """
+    Claim, pay and settle one chunk of payments
+    
+    Args:
+        payment_ids: BillPayment IDs in the chunk
+        rail: PaymentRail (defaults to the configured rail)
+        stale_before: Reclaim payments stuck in processing since before this time
+    
+    Returns:
+        dict: settle_payments() summary
+    """
+    rail = rail or get_payment_rail()
+    payments = claim_payments(payment_ids, stale_before)
+    if not payments:
+        return {'success': 0, 'failed': 0, 'processing': 0, 'amount_paid': '0.00', 'errors': []}
+    
+    outcomes = {result.payment_id: result for result in rail.send_payments(payments)}
+    return settle_payments(payments, outcomes, rail.name)
+
+
+def report_unsettled_chunk(payment_ids, error):
+    """Report a chunk that failed as a whole; its claimed payments stay in processing"""
+    return {
+        'success': 0,
+        'failed': 0,
+        'processing': BillPayment.objects.filter(id__in=payment_ids, status='processing').count(),
+        'amount_paid': '0.00',
+        'errors': [{'payment_id': None, 'error': error}],
+    }
+
+
+def reconcile_payments(now=None, chunk_size=None):
+    """
+    Resubmit payments stuck in processing and settle the rail's outcomes
+    
+    Batches left in processing by these payments are completed (or failed)
+    once none of their payments are processing any more.
+    
+    Returns:
+        dict: summarize_chunks() report
+    """
+    stale_before = (now or timezone.now()) - timedelta(seconds=settings.BILL_PAYMENT_RECONCILE_AFTER)
+    chunk_size = chunk_size or settings.BILL_PAYMENT_CHUNK_SIZE
+    stale = list(
+        BillPayment.objects.filter(status='processing', updated_at__lt=stale_before).order_by('id').values_list(
+            'id', 'batch_id'
+        )
+    )
+    payment_ids = [str(payment_id) for payment_id, _ in stale]
+    
+    results = summarize_chunks([
+        execute_payment_chunk(payment_ids[start:start + chunk_size], stale_before=stale_before)
+        for start in range(0, len(payment_ids), chunk_size)
+    ])
+    
+    now = timezone.now()
+    settled = PaymentBatch.objects.filter(
+        id__in={batch_id for _, batch_id in stale if batch_id}, status='processing'
+    ).exclude(payments__status='processing')
+    settled.filter(payments__status='failed').update(status='failed', updated_at=now)
+    settled.update(status='completed', updated_at=now)
+    
+    return results
+
+
+def summarize_chunks(chunk_results):
+    """Aggregate per-chunk summaries into a batch's processing_results"""
+    results = {
+        'success': 0, 'failed': 0, 'processing': 0, 'amount_paid': Decimal('0.00'),
+        'chunks': len(chunk_results), 'errors': []
+    }
+    
+    for chunk in chunk_results:
+        results['success'] += chunk['success']
+        results['failed'] += chunk['failed']
+        results['processing'] += chunk['processing']
+        results['amount_paid'] += Decimal(chunk['amount_paid'])
+        results['errors'].extend(chunk['errors'][:MAX_REPORTED_ERRORS - len(results['errors'])])
+    
+    results['amount_paid'] = str(results['amount_paid'])
+    return results
@@ -0,0 +1,310 @@
+"""
+Recurring bill detection and generation
+
+Detection loads bill history into a pandas frame (one row per bill) and
+works per (organization, vendor) group without Python loops: the gaps
+between consecutive bills are snapped to the nearest billing frequency,
+and a vendor is recurring when enough of its gaps fit that frequency and
+its amounts are stable. Detected patterns are written to RecurringSchedule
+with one bulk_create and one bulk_update. New detected schedules are
+inactive until someone confirms them, so detection alone never creates
+bills.
+
+Generation claims due schedules in chunks; each chunk creates its bills
+with bulk_create and advances the schedules with one bulk_update in the
+same transaction.
+"""
+from datetime import timedelta
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .duplicates import flag_generated_duplicates, normalize_bill_number
+from .models import Bill, RecurringSchedule, Vendor
+
+CENTS = Decimal('0.01')
+
+# Calendar step per RecurringSchedule frequency
+FREQUENCY_OFFSETS = {
+    'weekly': {'weeks': 1},
+    'biweekly': {'weeks': 2},
+    'monthly': {'months': 1},
+    'quarterly': {'months': 3},
+    'annually': {'years': 1},
+}
+FREQUENCY_STEPS = {frequency: relativedelta(**offset) for frequency, offset in FREQUENCY_OFFSETS.items()}
+
+# Average length in days of each frequency, for snapping observed gaps
+FREQUENCY_DAYS = {
+    'weekly': 7,
+    'biweekly': 14,
+    'monthly': 30.44,
+    'quarterly': 91.31,
+    'annually': 365.25,
+}
+
+MIN_OCCURRENCES = 3  # Bills needed before a vendor can be recurring
+GAP_TOLERANCE = 0.2  # Gap within 20% of the frequency's length counts as regular
+MIN_REGULARITY = 0.75  # Share of gaps that must be regular
+MAX_AMOUNT_VARIATION = 0.15  # Coefficient of variation of bill amounts
+MIN_TOLERANCE_PERCENT = 5  # Floor for amount_tolerance_percent on detected schedules
+STALE_PERIODS = 2  # Patterns with no bill for this many periods are dropped
+
+BILL_DUE_DAYS = 30  # Generated bills fall due this many days after the bill date
+
+HISTORY_COLUMNS = ['organization_id', 'vendor_id', 'bill_date', 'total_amount']
+
+
+def next_expected_date(cycle_date, frequency):
+    """Date of the cycle after `cycle_date`"""
+    return cycle_date + FREQUENCY_STEPS[frequency]
+
+
+def load_bill_history(organization_ids=None):
+    """
+    Bill history as a frame with one row per non-cancelled bill
+
+    Args:
+        organization_ids: Restrict to these organizations (defaults to all)
+
+    Returns:
+        DataFrame: organization_id, vendor_id (as strings), bill_date, total_amount (float)
+    """
+    bills = Bill.objects.exclude(status='cancelled')
+    if organization_ids is not None:
+        bills = bills.filter(organization_id__in=organization_ids)
+
+    frame = pd.DataFrame.from_records(
+        bills.values_list(*HISTORY_COLUMNS).iterator(chunk_size=10000),
+        columns=HISTORY_COLUMNS
+    )
+    frame['organization_id'] = frame['organization_id'].astype(str)
+    frame['vendor_id'] = frame['vendor_id'].astype(str)
+    frame['bill_date'] = pd.to_datetime(frame['bill_date'])
+    frame['total_amount'] = frame['total_amount'].astype(float)
+    return frame
+
+
+def detect_recurring_patterns(history, today=None):
+    """
+    Find recurring (organization, vendor) billing patterns
+
+    Args:
+        history: Frame from load_bill_history()
+        today: Reference date for dropping stale patterns
+
+    Returns:
+        DataFrame: one row per pattern with organization_id, vendor_id, frequency,
+        start_date, next_expected_date, expected_amount, amount_tolerance_percent
+    """
+    today = pd.Timestamp(today or timezone.now().date())
+    keys = ['organization_id', 'vendor_id']
+    if history.empty:
+        return pd.DataFrame(columns=keys)
+
+    history = history.sort_values(keys + ['bill_date'])
+    history['gap'] = history.groupby(keys, sort=False)['bill_date'].diff().dt.days
+
+    stats = history.groupby(keys, sort=False).agg(
+        occurrences=('bill_date', 'size'),
+        start_date=('bill_date', 'min'),
+        last_date=('bill_date', 'max'),
+        median_gap=('gap', 'median'),
+        amount_median=('total_amount', 'median'),
+        amount_mean=('total_amount', 'mean'),
+        amount_std=('total_amount', 'std'),
+        amount_min=('total_amount', 'min'),
+        amount_max=('total_amount', 'max'),
+    )
+    stats = stats[(stats['occurrences'] >= MIN_OCCURRENCES) & (stats['amount_median'] > 0)]
+    if stats.empty:
+        return stats.reset_index()
+
+    # Snap each group's median gap to the nearest frequency
+    frequencies = np.array(list(FREQUENCY_DAYS))
+    period_days = np.array(list(FREQUENCY_DAYS.values()))
+    error = np.abs(stats['median_gap'].to_numpy()[:, None] - period_days) / period_days
+    best = error.argmin(axis=1)
+    stats['frequency'] = frequencies[best]
+    stats['period'] = period_days[best]
+    stats['period_error'] = error[np.arange(len(best)), best]
+
+    # Share of each group's gaps that fit its frequency
+    gaps = history.join(stats['period'], on=keys, how='inner')
+    gap_error = (gaps['gap'] - gaps['period']).abs() / gaps['period']
+    gaps['regular'] = np.where(gaps['gap'].isna(), np.nan, gap_error <= GAP_TOLERANCE)
+    stats['regularity'] = gaps.groupby(keys, sort=False)['regular'].mean()
+
+    variation = stats['amount_std'] / stats['amount_mean']
+    deviation = np.maximum(
+        stats['amount_max'] - stats['amount_median'],
+        stats['amount_median'] - stats['amount_min']
+    ) / stats['amount_median']
+    stale_after = pd.to_timedelta(stats['period'] * STALE_PERIODS, unit='D')
+
+    patterns = stats[
+        (stats['period_error'] <= GAP_TOLERANCE)
+        & (stats['regularity'] >= MIN_REGULARITY)
+        & (variation <= MAX_AMOUNT_VARIATION)
+        & (stats['last_date'] + stale_after >= today)
+    ].copy()
+
+    patterns['amount_tolerance_percent'] = np.maximum(
+        np.ceil(deviation[patterns.index] * 100), MIN_TOLERANCE_PERCENT
+    )
+    patterns['next_expected_date'] = patterns['last_date']
+    for frequency, offset in FREQUENCY_OFFSETS.items():
+        mask = patterns['frequency'] == frequency
+        patterns.loc[mask, 'next_expected_date'] = patterns.loc[mask, 'last_date'] + pd.DateOffset(**offset)
+
+    return patterns.rename(columns={'amount_median': 'expected_amount'})[[
+        'frequency', 'start_date', 'next_expected_date', 'expected_amount', 'amount_tolerance_percent'
+    ]].reset_index()
+
+
+def sync_recurring_schedules(patterns, batch_size=1000):
+    """
+    Create or refresh detected RecurringSchedule rows
+
+    Schedules someone created by hand (detected_at is null) are left alone,
+    and so is every pattern for a vendor that has one. New schedules are
+    created inactive, pending confirmation; refreshes keep is_active as is.
+
+    Args:
+        patterns: Frame from detect_recurring_patterns()
+        batch_size: Rows per INSERT/UPDATE
+
+    Returns:
+        tuple: (schedules created, schedules updated)
+    """
+    if patterns.empty:
+        return 0, 0
+
+    now = timezone.now()
+    organization_ids = set(patterns['organization_id'])
+    vendor_ids = set(patterns['vendor_id'])
+
+    detected, manual = {}, set()
+    for schedule in RecurringSchedule.objects.filter(
+        organization_id__in=organization_ids, vendor_id__in=vendor_ids
+    ).order_by('created_at'):
+        key = (str(schedule.organization_id), str(schedule.vendor_id))
+        if schedule.detected_at is None:
+            manual.add(key)
+        else:
+            detected.setdefault(key, schedule)
+
+    vendor_names = {
+        str(vendor_id): name for vendor_id, name in Vendor.objects.filter(id__in=vendor_ids).values_list('id', 'name')
+    }
+
+    to_create, to_update = [], []
+    for pattern in patterns.itertuples(index=False):
+        key = (pattern.organization_id, pattern.vendor_id)
+        if key in manual:
+            continue
+
+        expected_amount = Decimal(str(pattern.expected_amount)).quantize(CENTS)
+        tolerance = Decimal(int(pattern.amount_tolerance_percent))
+        next_date = pattern.next_expected_date.date()
+
+        schedule = detected.get(key)
+        if schedule is None:
+            to_create.append(RecurringSchedule(
+                organization_id=pattern.organization_id,
+                vendor_id=pattern.vendor_id,
+                name=f"{vendor_names[pattern.vendor_id]} ({pattern.frequency})",
+                description='Detected from bill history; confirm to generate bills',
+                frequency=pattern.frequency,
+                start_date=pattern.start_date.date(),
+                expected_amount=expected_amount,
+                amount_tolerance_percent=tolerance,
+                next_expected_date=next_date,
+                is_active=False,
+                detected_at=now
+            ))
+            continue
+
+        schedule.frequency = pattern.frequency
+        schedule.expected_amount = expected_amount
+        schedule.amount_tolerance_percent = tolerance
+        # Never move a schedule back to a cycle the generator already billed
+        if schedule.next_expected_date is None or schedule.next_expected_date < next_date:
+            schedule.next_expected_date = next_date
+        schedule.detected_at = now
+        schedule.updated_at = now
+        to_update.append(schedule)
+
+    RecurringSchedule.objects.bulk_create(to_create, batch_size=batch_size)
+    RecurringSchedule.objects.bulk_update(
+        to_update,
+        ['frequency', 'expected_amount', 'amount_tolerance_percent', 'next_expected_date', 'detected_at', 'updated_at'],
+        batch_size=batch_size
+    )
+
+    return len(to_create), len(to_update)
+
+
+def generate_bill_chunk(run_date, batch_size):
+    """
+    Create the next cycle's bill for up to `batch_size` due schedules
+
+    Schedules without a next_expected_date start at their start_date.
+
+    Args:
+        run_date: Bill every cycle expected on or before this date
+        batch_size: Maximum schedules claimed in this chunk
+
+    Returns:
+        int: Schedules processed
+    """
+    now = timezone.now()
+
+    with transaction.atomic():
+        # Rows locked by a concurrent run are skipped, not waited on
+        schedules = list(
+            RecurringSchedule.objects.select_for_update(skip_locked=True).annotate(
+                cycle_date=Coalesce('next_expected_date', 'start_date')
+            ).filter(
+                is_active=True,
+                cycle_date__lte=run_date
+            ).filter(
+                Q(end_date__isnull=True) | Q(end_date__gte=Coalesce('next_expected_date', 'start_date'))
+            ).order_by('id')[:batch_size]
+        )
+
+        bills = []
+        for schedule in schedules:
+            cycle_date = schedule.cycle_date
+            bill_number = f"REC-{schedule.id}-{cycle_date}"
+            bills.append(Bill(
+                organization_id=schedule.organization_id,
+                vendor_id=schedule.vendor_id,
+                bill_number=bill_number,
+                normalized_bill_number=normalize_bill_number(bill_number),
+                bill_date=cycle_date,
+                due_date=cycle_date + timedelta(days=BILL_DUE_DAYS),
+                subtotal=schedule.expected_amount,
+                total_amount=schedule.expected_amount,
+                is_recurring=True,
+                recurring_schedule_id=schedule.id,
+                requires_approval=schedule.requires_approval,
+                status='draft',
+                created_by_id=schedule.created_by_id
+            ))
+
+            schedule.last_generated_date = cycle_date
+            schedule.next_expected_date = next_expected_date(cycle_date, schedule.frequency)
+            schedule.updated_at = now
+
+        flag_generated_duplicates(bills)
+        Bill.objects.bulk_create(bills, batch_size=batch_size)
+        RecurringSchedule.objects.bulk_update(
+            schedules, ['last_generated_date', 'next_expected_date', 'updated_at'], batch_size=batch_size
+        )
+
+    return len(schedules)
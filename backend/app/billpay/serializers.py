@@ -1,6 +1,7 @@
 """
 Serializers for Bill Pay Automation
 """
+from django.conf import settings
 from rest_framework import serializers
 from .models import (
     Vendor, Bill, BillLineItem, ApprovalWorkflow, ApprovalRule,
@@ -86,14 +87,16 @@ class BillSerializer(serializers.ModelSerializer):
             'subtotal', 'tax_amount', 'discount_amount', 'total_amount',
             'status', 'amount_paid', 'amount_remaining', 'paid_at',
             'scheduled_payment_date', 'payment_method',
-            'capture_method', 'ocr_confidence', 'attachment', 'attachment_url',
+            'capture_method', 'ocr_confidence', 'ocr_data', 'attachment', 'attachment_url',
             'category', 'department', 'project',
             'is_recurring', 'recurring_schedule', 'requires_approval',
             'description', 'notes', 'tags', 'is_overdue',
+            'duplicate_of', 'duplicate_reviewed',
             'created_by', 'created_at', 'updated_at',
             'line_items', 'payments', 'approval_requests'
         ]
-        read_only_fields = ['id', 'amount_paid', 'paid_at', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'amount_paid', 'paid_at', 'ocr_confidence', 'ocr_data',
+                            'duplicate_of', 'duplicate_reviewed', 'created_at', 'updated_at']
     
     def get_amount_remaining(self, obj):
         return float(obj.amount_remaining())
@@ -102,6 +105,44 @@ class BillSerializer(serializers.ModelSerializer):
         return obj.is_overdue()
 
 
+class BulkBillSubmitSerializer(serializers.Serializer):
+    """Bulk submission of draft bills for approval"""
+    bill_ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        allow_empty=False,
+        max_length=settings.BILL_BULK_SUBMIT_MAX_BILLS
+    )
+
+
+class BillDecisionSerializer(serializers.Serializer):
+    """One approver decision on a bill"""
+    bill_id = serializers.UUIDField()
+    decision = serializers.ChoiceField(choices=['approve', 'reject'])
+
+
+class BulkBillDecisionSerializer(serializers.Serializer):
+    """Bulk approve/reject decisions by the requesting approver"""
+    decisions = serializers.ListField(
+        child=BillDecisionSerializer(),
+        allow_empty=False,
+        max_length=settings.BILL_BULK_SUBMIT_MAX_BILLS
+    )
+    comments = serializers.CharField(required=False, allow_blank=True, default='')
+
+
+class PaymentOptimizationSerializer(serializers.Serializer):
+    """Inputs for the cash-aware payment schedule optimizer"""
+    cash_balance = serializers.DecimalField(max_digits=15, decimal_places=2, required=False)
+    minimum_balance = serializers.DecimalField(
+        max_digits=15, decimal_places=2, default=settings.BILL_MINIMUM_CASH_BALANCE
+    )
+    cost_of_capital = serializers.DecimalField(
+        max_digits=5, decimal_places=2, min_value=0, default=settings.BILL_COST_OF_CAPITAL_PERCENT,
+        help_text='Annual cost of cash, in percent'
+    )
+    dry_run = serializers.BooleanField(default=True)
+
+
 class ApprovalRuleSerializer(serializers.ModelSerializer):
     """Serializer for approval rules"""
     approver_names = serializers.SerializerMethodField()
@@ -141,9 +182,9 @@ class RecurringScheduleSerializer(serializers.ModelSerializer):
             'id', 'vendor', 'vendor_name', 'name', 'description', 'frequency',
             'start_date', 'end_date', 'expected_amount', 'amount_tolerance_percent',
             'auto_pay_enabled', 'requires_approval', 'is_active',
-            'last_generated_date', 'next_expected_date', 'created_at'
+            'last_generated_date', 'next_expected_date', 'detected_at', 'created_at'
         ]
-        read_only_fields = ['id', 'last_generated_date', 'next_expected_date', 'created_at']
+        read_only_fields = ['id', 'last_generated_date', 'next_expected_date', 'detected_at', 'created_at']
 
 
 class PaymentBatchSerializer(serializers.ModelSerializer):
@@ -0,0 +1,56 @@
+"""
+Signal handlers for Bill Pay Automation
+
+Compiled approval tables are keyed on their workflows' updated_at, so edits
+to rules or approvers touch the owning workflow to retire the cached table.
+Escalated approvals and bills coming due are handed to tasks that send one
+digest per recipient.
+"""
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from app.core.transitions import status_transitioned
+from .models import ApprovalRequest, ApprovalRule, ApprovalWorkflow, Bill
+
+
+def touch_workflows(**filters):
+    """Bump updated_at on the matching workflows"""
+    ApprovalWorkflow.objects.filter(**filters).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=ApprovalRule)
+@receiver(post_delete, sender=ApprovalRule)
+def approval_rule_changed(sender, instance, **kwargs):
+    touch_workflows(id=instance.workflow_id)
+
+
+@receiver(m2m_changed, sender=ApprovalRule.approvers.through)
+def approval_rule_approvers_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear', 'pre_clear'):
+        return
+    
+    if not reverse:
+        touch_workflows(id=instance.workflow_id)
+    elif action == 'pre_clear':
+        # A user's approver links are about to go; pk_set is not provided for clears
+        touch_workflows(rules__approvers=instance)
+    elif pk_set:
+        touch_workflows(rules__in=pk_set)
+
+
+@receiver(status_transitioned, sender=ApprovalRequest)
+def approvals_escalated(sender, transition, ids, **kwargs):
+    if transition != 'approval_escalated':
+        return
+    
+    from .tasks import notify_escalated_approvals
+    notify_escalated_approvals.delay([str(request_id) for request_id in ids])
+
+
+@receiver(status_transitioned, sender=Bill)
+def bills_due_soon(sender, transition, ids, **kwargs):
+    if transition != 'bill_due_soon':
+        return
+    
+    from .tasks import notify_bills_due_soon
+    notify_bills_due_soon.delay([str(bill_id) for bill_id in ids])
@@ -5,140 +5,236 @@ from celery import shared_task
 
 
 @shared_task
-def detect_recurring_bills():
-    """Detect recurring bill patterns using ML"""
-    from .models import Bill, RecurringSchedule
-    from datetime import timedelta
-    # ML-based detection of recurring patterns
-    return "Recurring bills detected"
+def detect_recurring_bills(organization_ids=None):
+    """Detect recurring vendor billing patterns and keep RecurringSchedule in sync"""
+    from django.conf import settings
+    from .recurring import detect_recurring_patterns, load_bill_history, sync_recurring_schedules
+    
+    patterns = detect_recurring_patterns(load_bill_history(organization_ids))
+    created, updated = sync_recurring_schedules(patterns, batch_size=settings.RECURRING_BILL_BATCH_SIZE)
+    
+    return f"Detected {len(patterns)} recurring patterns ({created} new schedules, {updated} updated)"
 
 
 @shared_task
 def check_bill_due_dates():
-    """Check for upcoming and overdue bills"""
+    """Flag bills coming due and mark overdue bills (one UPDATE each)"""
+    from app.core.transitions import run_transitions
+    from .transitions import BILL_TRANSITIONS
+    
+    counts = run_transitions(BILL_TRANSITIONS)
+    
+    return f"Checked {counts['bill_due_soon']} upcoming, marked {counts['bill_overdue']} overdue"
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def process_bill_ocr(self, bill_id):
+    """OCR a bill's attachment and store the extracted fields on the bill"""
     from .models import Bill
-    from datetime import date, timedelta
+    from .ocr_processor import OCRProcessor
     
-    # Check bills due in next 7 days
-    upcoming = Bill.objects.filter(
-        due_date__lte=date.today() + timedelta(days=7),
-        due_date__gte=date.today(),
-        status__in=['approved', 'scheduled']
-    )
+    try:
+        bill = Bill.objects.get(id=bill_id)
+    except Bill.DoesNotExist:
+        return f"Bill {bill_id} not found"
     
-    # Send reminders
-    for bill in upcoming:
-        # TODO: Send notification
-        pass
+    if not bill.attachment:
+        return f"Bill {bill_id} has no attachment"
     
-    # Mark overdue bills
-    overdue = Bill.objects.filter(
-        due_date__lt=date.today(),
-        status__in=['draft', 'pending_approval', 'approved']
-    )
+    try:
+        with bill.attachment.open('rb') as attachment:
+            content = attachment.read()
+        extracted_data = OCRProcessor.process_document(content, bill.organization_id)
+    except OSError as exc:
+        raise self.retry(exc=exc)
     
-    overdue.update(status='overdue')
+    OCRProcessor.apply_to_bill(bill, extracted_data)
     
-    return f"Checked {upcoming.count()} upcoming, marked {overdue.count()} overdue"
+    return f"OCR processed bill {bill_id} (confidence {extracted_data['confidence']})"
 
 
 @shared_task
 def process_payment_batch(batch_id):
-    """Process a payment batch"""
-    from .models import PaymentBatch, BillPayment
-    from django.utils import timezone
+    """Pay a batch as parallel chunks; results are collected by finalize_payment_batch"""
+    from celery import chord
+    from django.conf import settings
+    from .models import PaymentBatch
+    from .payments import chunk_payment_ids
     
     batch = PaymentBatch.objects.get(id=batch_id)
+    chunks = chunk_payment_ids(batch, settings.BILL_PAYMENT_CHUNK_SIZE)
+    
+    if not chunks:
+        return finalize_payment_batch([], batch_id)
     
-    results = {'success': 0, 'failed': 0}
-    
-    for payment in batch.payments.all():
-        try:
-            # Process payment through payment gateway
-            # Mock implementation
-            payment.status = 'completed'
-            payment.save()
-            
-            # Update bill
-            bill = payment.bill
-            bill.amount_paid += payment.amount
-            if bill.amount_paid >= bill.total_amount:
-                bill.status = 'paid'
-                bill.paid_at = timezone.now()
-            bill.save()
-            
-            results['success'] += 1
-        except Exception as e:
-            payment.status = 'failed'
-            payment.save()
-            results['failed'] += 1
-    
-    batch.status = 'completed' if results['failed'] == 0 else 'failed'
-    batch.processed_at = timezone.now()
-    batch.processing_results = results
-    batch.save()
+    chord(process_payment_chunk.s(payment_ids) for payment_ids in chunks)(
+        finalize_payment_batch.s(batch_id)
+    )
+    
+    return f"Dispatched {len(chunks)} payment chunks for batch {batch_id}"
+
+
+@shared_task
+def process_payment_chunk(payment_ids):
+    """Claim, pay and settle one chunk of a batch"""
+    import logging
+    from .payments import execute_payment_chunk, report_unsettled_chunk
+    
+    try:
+        return execute_payment_chunk(payment_ids)
+    except Exception as e:
+        # Claimed payments stay in processing; the rail may have paid them, so reconcile_payments settles them
+        logging.getLogger(__name__).exception("Payment chunk of %d payments failed", len(payment_ids))
+        return report_unsettled_chunk(payment_ids, str(e))
+
+
+@shared_task
+def finalize_payment_batch(chunk_results, batch_id):
+    """Aggregate chunk results into the batch's processing_results"""
+    from django.utils import timezone
+    from .models import BillPayment, PaymentBatch
+    from .payments import summarize_chunks
+    
+    results = summarize_chunks(chunk_results)
+    # Counted across the batch, so a rerun with nothing left to claim does not complete it early
+    results['processing'] = BillPayment.objects.filter(batch_id=batch_id, status='processing').count()
+    if results['processing']:
+        status = 'processing'  # Settled later by reconcile_payments
+    else:
+        status = 'completed' if results['failed'] == 0 else 'failed'
+    
+    PaymentBatch.objects.filter(id=batch_id).update(
+        status=status,
+        processed_at=timezone.now(),
+        processing_results=results,
+        updated_at=timezone.now()
+    )
     
     return results
 
 
 @shared_task
-def generate_recurring_bills():
-    """Generate bills from recurring schedules"""
-    from .models import RecurringSchedule, Bill
+def reconcile_payments():
+    """Resubmit payments stuck in processing under their idempotency keys and settle them"""
+    from .payments import reconcile_payments as reconcile
+    
+    results = reconcile()
+    
+    return f"Reconciled {results['success'] + results['failed']} payments ({results['processing']} still processing)"
+
+
+@shared_task
+def generate_recurring_bills(run_date=None):
+    """
+    Create the bills due from recurring schedules
+    Schedules are processed in chunks of RECURRING_BILL_BATCH_SIZE, each
+    written with bulk inserts in its own transaction; a schedule that is
+    several cycles behind gets one bill per cycle
+    """
     from datetime import date
+    from django.conf import settings
+    from django.utils import timezone
+    from .recurring import generate_bill_chunk
     
-    schedules = RecurringSchedule.objects.filter(
-        is_active=True,
-        next_expected_date__lte=date.today()
-    )
+    run_date = date.fromisoformat(run_date) if run_date else timezone.now().date()
     
     generated_count = 0
-    for schedule in schedules:
-        # Create new bill
-        Bill.objects.create(
-            organization=schedule.organization,
-            vendor=schedule.vendor,
-            bill_number=f"REC-{schedule.id}-{date.today()}",
-            bill_date=date.today(),
-            due_date=date.today() + timedelta(days=30),
-            total_amount=schedule.expected_amount,
-            is_recurring=True,
-            recurring_schedule=schedule,
-            status='draft'
-        )
-        
-        # Update schedule
-        schedule.last_generated_date = date.today()
-        # Calculate next date based on frequency
-        schedule.save()
-        
-        generated_count += 1
+    while True:
+        processed = generate_bill_chunk(run_date, settings.RECURRING_BILL_BATCH_SIZE)
+        if not processed:
+            break
+        generated_count += processed
     
     return f"Generated {generated_count} recurring bills"
 
 
 @shared_task
 def escalate_pending_approvals():
-    """Escalate approval requests that are overdue"""
+    """
+    Escalate approval requests past their workflow's SLA
+    One UPDATE ... RETURNING moves them and routes each to the workflow or
+    organization owner
+    """
+    from app.core.transitions import run_transitions
+    from .transitions import APPROVAL_TRANSITIONS
+    
+    counts = run_transitions(APPROVAL_TRANSITIONS)
+    
+    # Escalation notifications are sent by the status_transitioned receiver
+    return f"Escalated {counts['approval_escalated']} approvals"
+
+
+@shared_task
+def notify_escalated_approvals(request_ids):
+    """Email each escalation recipient one digest of the approvals escalated to them"""
+    from itertools import groupby
+    from django.conf import settings
+    from django.core.mail import send_mass_mail
     from .models import ApprovalRequest
-    from django.utils import timezone
-    from datetime import timedelta
     
-    cutoff = timezone.now() - timedelta(hours=48)
+    requests = ApprovalRequest.objects.filter(
+        id__in=request_ids, escalated_to__isnull=False
+    ).select_related('bill__vendor', 'approver', 'escalated_to').order_by('escalated_to_id', 'bill__due_date')
+    
+    messages = []
+    for _, recipient_requests in groupby(requests, key=lambda request: request.escalated_to_id):
+        recipient_requests = list(recipient_requests)
+        recipient = recipient_requests[0].escalated_to
+        lines = [
+            f"- {request.bill.bill_number} from {request.bill.vendor.name}: "
+            f"${request.bill.total_amount}, due {request.bill.due_date} (waiting on {request.approver.name})"
+            for request in recipient_requests
+        ]
+        messages.append((
+            f"{len(recipient_requests)} bill approvals escalated to you",
+            f"Hi {recipient.name},\n\nThese approvals passed their deadline and were escalated to you:\n\n"
+            + "\n".join(lines),
+            settings.DEFAULT_FROM_EMAIL,
+            [recipient.email]
+        ))
+    
+    send_mass_mail(messages, fail_silently=False)
+    
+    return f"Sent {len(messages)} escalation digests for {len(request_ids)} approvals"
+
+
+@shared_task
+def notify_bills_due_soon(bill_ids):
+    """Email each organization owner one digest of their bills coming due"""
+    from itertools import groupby
+    from django.conf import settings
+    from django.core.mail import send_mass_mail
+    from .models import Bill
     
-    pending_requests = ApprovalRequest.objects.filter(
-        status='pending',
-        created_at__lt=cutoff,
-        escalated_at__isnull=True
-    )
+    bills = Bill.objects.filter(id__in=bill_ids).select_related(
+        'vendor', 'organization__owner'
+    ).order_by('organization_id', 'due_date')
+    
+    messages = []
+    for _, organization_bills in groupby(bills, key=lambda bill: bill.organization_id):
+        organization_bills = list(organization_bills)
+        owner = organization_bills[0].organization.owner
+        lines = [
+            f"- {bill.bill_number} from {bill.vendor.name}: ${bill.total_amount - bill.amount_paid} due {bill.due_date}"
+            for bill in organization_bills
+        ]
+        messages.append((
+            f"{len(organization_bills)} bills due soon",
+            f"Hi {owner.name},\n\nThese bills fall due in the next few days:\n\n" + "\n".join(lines),
+            settings.DEFAULT_FROM_EMAIL,
+            [owner.email]
+        ))
+    
+    send_mass_mail(messages, fail_silently=False)
+    
+    return f"Sent {len(messages)} due-soon digests for {len(bill_ids)} bills"
+
+
+@shared_task
+def update_vendor_metrics():
+    """Refresh denormalized vendor spend and on-time metrics (one grouped query)"""
+    from .analytics import refresh_vendor_metrics
     
-    for request in pending_requests:
-        # Escalate to manager or workflow owner
-        request.status = 'escalated'
-        request.escalated_at = timezone.now()
-        request.save()
-        
-        # TODO: Send escalation notification
+    updated = refresh_vendor_metrics()
     
-    return f"Escalated {pending_requests.count()} approvals"
-
+    return f"Updated metrics for {updated} vendors"
@@ -0,0 +1,64 @@
+"""
+Bill and approval status transitions
+"""
+from datetime import timedelta
+from django.db.models import F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, NullIf
+from app.core.transitions import Transition
+from .models import Bill, ApprovalRequest, ApprovalWorkflow
+
+# Approved or scheduled bills get one due-soon notification this many days out
+DUE_SOON_DAYS = 7
+
+# Pending approvals without a workflow SLA (escalate_after) escalate after this many hours
+ESCALATION_HOURS = 48
+
+# Escalations go to the workflow's owner, or to the organization owner when the
+# workflow has none or its owner is the approver being escalated
+ESCALATION_TARGET = Coalesce(
+    NullIf(
+        Subquery(ApprovalWorkflow.objects.filter(id=OuterRef('workflow_id')).values('created_by_id')[:1]),
+        F('approver_id')
+    ),
+    Subquery(Bill.objects.filter(id=OuterRef('bill_id')).values('organization__owner_id')[:1])
+)
+
+BILL_TRANSITIONS = [
+    Transition(
+        'bill_due_soon',
+        Bill,
+        lambda now: Q(
+            status__in=['approved', 'scheduled'],
+            due_date__gte=now.date(),
+            due_date__lte=now.date() + timedelta(days=DUE_SOON_DAYS),
+            due_soon_notified_at__isnull=True
+        ),
+        lambda now: {'due_soon_notified_at': now, 'updated_at': now}
+    ),
+    Transition(
+        'bill_overdue',
+        Bill,
+        lambda now: Q(
+            status__in=['draft', 'pending_approval', 'approved'],
+            due_date__lt=now.date()
+        ),
+        lambda now: {'status': 'overdue', 'updated_at': now}
+    ),
+]
+
+APPROVAL_TRANSITIONS = [
+    Transition(
+        'approval_escalated',
+        ApprovalRequest,
+        lambda now: Q(status='pending', escalated_at__isnull=True) & (
+            Q(escalate_after__lte=now)
+            | Q(escalate_after__isnull=True, created_at__lt=now - timedelta(hours=ESCALATION_HOURS))
+        ),
+        lambda now: {
+            'status': 'escalated',
+            'escalated_at': now,
+            'escalated_to': ESCALATION_TARGET,
+            'updated_at': now
+        }
+    ),
+]
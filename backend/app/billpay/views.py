@@ -13,8 +13,11 @@ from .models import (
     Vendor, Bill, BillLineItem, ApprovalWorkflow, ApprovalRule,
     ApprovalRequest, RecurringSchedule, PaymentBatch, BillPayment
 )
+from .duplicates import check_duplicate
 from .serializers import (
-    VendorSerializer, BillSerializer, ApprovalWorkflowSerializer,
+    VendorSerializer, BillSerializer, BulkBillSubmitSerializer, BulkBillDecisionSerializer,
+    PaymentOptimizationSerializer,
+    ApprovalWorkflowSerializer,
     RecurringScheduleSerializer, PaymentBatchSerializer, BillPaymentSerializer
 )
 
@@ -35,14 +38,16 @@ class VendorViewSet(viewsets.ModelViewSet):
     def spending_report(self, request, org_id=None, pk=None):
         """Get vendor spending report"""
         vendor = self.get_object()
-        bills = vendor.bills.filter(status='paid')
         
         from datetime import date, timedelta
-        from django.db.models import Sum, Count
+        from .analytics import monthly_trend, vendor_spend
         
-        # Last 12 months
+        # Paid bills over the last 12 months, at their full amount
         twelve_months_ago = date.today() - timedelta(days=365)
-        recent_bills = bills.filter(bill_date__gte=twelve_months_ago)
+        recent = next(
+            iter(vendor_spend(org_id, since=twelve_months_ago, vendor_id=vendor.id, statuses=['paid'])),
+            {'total_billed': 0, 'bills': 0}
+        )
         
         return Response({
             'vendor_name': vendor.name,
@@ -50,12 +55,42 @@ class VendorViewSet(viewsets.ModelViewSet):
             'total_bills': vendor.total_bills,
             'average_bill': float(vendor.average_bill_amount),
             'last_12_months': {
-                'total_spent': float(recent_bills.aggregate(Sum('total_amount'))['total_amount__sum'] or 0),
-                'bill_count': recent_bills.count(),
+                'total_spent': float(recent['total_billed']),
+                'bill_count': recent['bills'],
             },
+            'monthly_trend': [
+                {**point, 'billed': float(point['billed']), 'paid': float(point['paid'])}
+                for point in monthly_trend(org_id, vendor_id=vendor.id)
+            ],
             'payment_terms': vendor.payment_terms,
             'on_time_rate': float(vendor.on_time_payment_rate)
         })
+    
+    @action(detail=False, methods=['get'])
+    def spend(self, request, org_id=None):
+        """Spend by vendor, largest first (optionally since=YYYY-MM-DD)"""
+        from datetime import date
+        from .analytics import vendor_spend
+        
+        since = request.query_params.get('since')
+        try:
+            since = date.fromisoformat(since) if since else None
+        except ValueError:
+            return Response({'error': 'since must be a YYYY-MM-DD date'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'vendors': [
+                {
+                    'vendor_id': str(row['vendor_id']),
+                    'vendor_name': row['vendor_name'],
+                    'bills': row['bills'],
+                    'total_billed': float(row['total_billed']),
+                    'total_paid': float(row['total_paid']),
+                    'outstanding': float(row['outstanding']),
+                }
+                for row in vendor_spend(org_id, since=since)
+            ]
+        })
 
 
 class BillViewSet(viewsets.ModelViewSet):
@@ -75,7 +110,40 @@ class BillViewSet(viewsets.ModelViewSet):
         return queryset
     
     def perform_create(self, serializer):
-        serializer.save(organization_id=self.kwargs['org_id'], created_by=self.request.user)
+        bill = serializer.save(organization_id=self.kwargs['org_id'], created_by=self.request.user)
+        check_duplicate(bill)
+    
+    def perform_update(self, serializer):
+        bill = serializer.save()
+        check_duplicate(bill)
+    
+    @action(detail=True, methods=['post'])
+    def dismiss_duplicate(self, request, org_id=None, pk=None):
+        """Mark a flagged bill as not a duplicate"""
+        bill = self.get_object()
+        bill.duplicate_of = None
+        bill.duplicate_reviewed = True
+        bill.save(update_fields=['duplicate_of', 'duplicate_reviewed', 'updated_at'])
+        
+        return Response({'success': True, 'bill': BillSerializer(bill).data})
+    
+    @action(detail=True, methods=['post'])
+    def scan(self, request, org_id=None, pk=None):
+        """Run OCR on the bill attachment (optionally uploading it as `file`)"""
+        bill = self.get_object()
+        
+        upload = request.FILES.get('file')
+        if upload:
+            bill.attachment = upload
+            bill.save(update_fields=['attachment', 'updated_at'])
+        
+        if not bill.attachment:
+            return Response({'error': 'Bill has no attachment to scan'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        from .tasks import process_bill_ocr
+        process_bill_ocr.delay(str(bill.id))
+        
+        return Response({'success': True, 'message': 'OCR processing started'}, status=status.HTTP_202_ACCEPTED)
     
     @action(detail=True, methods=['post'])
     def submit_for_approval(self, request, org_id=None, pk=None):
@@ -85,75 +153,106 @@ class BillViewSet(viewsets.ModelViewSet):
         if bill.status != 'draft':
             return Response({'error': 'Bill must be in draft status'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Create approval requests based on workflow
-        from .approval_engine import ApprovalEngine
-        engine = ApprovalEngine(bill)
-        approval_requests = engine.create_approval_requests()
+        if bill.duplicate_of_id:
+            return Response({
+                'error': 'Bill looks like a duplicate; dismiss the duplicate flag to submit it',
+                'duplicate_of': str(bill.duplicate_of_id)
+            }, status=status.HTTP_400_BAD_REQUEST)
         
-        bill.status = 'pending_approval'
-        bill.save()
+        # Create approval requests based on workflow
+        from .approval_engine import submit_bills_for_approval
+        result = submit_bills_for_approval(org_id, [bill.id])
+        bill.refresh_from_db()
         
         return Response({
             'success': True,
-            'message': f'Bill submitted for approval to {len(approval_requests)} approvers',
+            'message': f"Bill submitted for approval to {result['requests']} approvers",
             'bill': BillSerializer(bill).data
         })
     
+    @action(detail=False, methods=['post'], url_path='submit-for-approval')
+    def bulk_submit_for_approval(self, request, org_id=None):
+        """Submit many draft bills for approval in one request"""
+        serializer = BulkBillSubmitSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        bill_ids = serializer.validated_data['bill_ids']
+        
+        from .approval_engine import submit_bills_for_approval
+        result = submit_bills_for_approval(org_id, bill_ids)
+        
+        submitted = set(result['pending_approval']) | set(result['approved'])
+        return Response({
+            'pending_approval': [str(bill_id) for bill_id in result['pending_approval']],
+            'approved': [str(bill_id) for bill_id in result['approved']],
+            'skipped': [str(bill_id) for bill_id in bill_ids if bill_id not in submitted],
+            'approval_requests': result['requests'],
+        })
+    
     @action(detail=True, methods=['post'])
     def approve(self, request, org_id=None, pk=None):
         """Approve a bill"""
         bill = self.get_object()
-        comments = request.data.get('comments', '')
         
-        # Find pending approval request for this user
-        approval = bill.approval_requests.filter(
-            approver=request.user,
-            status='pending'
-        ).first()
+        from .approval_engine import decide_approvals
+        result = decide_approvals(
+            org_id, request.user, {bill.id: 'approve'},
+            comments=request.data.get('comments', ''),
+            ip_address=request.META.get('REMOTE_ADDR')
+        )
         
-        if not approval:
+        if bill.id not in result['approved'] and bill.id not in result['pending']:
             return Response({'error': 'No pending approval for this user'}, status=status.HTTP_400_BAD_REQUEST)
         
-        approval.status = 'approved'
-        approval.decision_date = timezone.now()
-        approval.comments = comments
-        approval.save()
-        
-        # Check if all approvals are complete
-        pending_count = bill.approval_requests.filter(status='pending').count()
-        if pending_count == 0:
-            bill.status = 'approved'
-            bill.save()
-        
         return Response({
             'success': True,
             'message': 'Bill approved',
-            'pending_approvals': pending_count
+            'pending_approvals': result['pending'].get(bill.id, 0)
         })
     
     @action(detail=True, methods=['post'])
     def reject(self, request, org_id=None, pk=None):
         """Reject a bill"""
         bill = self.get_object()
-        comments = request.data.get('comments', '')
         
-        approval = bill.approval_requests.filter(
-            approver=request.user,
-            status='pending'
-        ).first()
+        from .approval_engine import decide_approvals
+        result = decide_approvals(
+            org_id, request.user, {bill.id: 'reject'},
+            comments=request.data.get('comments', ''),
+            ip_address=request.META.get('REMOTE_ADDR')
+        )
         
-        if not approval:
+        if not result['rejected']:
             return Response({'error': 'No pending approval for this user'}, status=status.HTTP_400_BAD_REQUEST)
         
-        approval.status = 'rejected'
-        approval.decision_date = timezone.now()
-        approval.comments = comments
-        approval.save()
+        return Response({'success': True, 'message': 'Bill rejected'})
+    
+    @action(detail=False, methods=['post'])
+    def decide(self, request, org_id=None):
+        """
+        Approve or reject many bills in one request
         
-        bill.status = 'rejected'
-        bill.save()
+        Body: {"decisions": [{"bill_id": ..., "decision": "approve" | "reject"}], "comments": ""}
+        """
+        serializer = BulkBillDecisionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        decisions = {
+            item['bill_id']: item['decision'] for item in serializer.validated_data['decisions']
+        }
         
-        return Response({'success': True, 'message': 'Bill rejected'})
+        from .approval_engine import decide_approvals
+        result = decide_approvals(
+            org_id, request.user, decisions,
+            comments=serializer.validated_data['comments'],
+            ip_address=request.META.get('REMOTE_ADDR')
+        )
+        
+        decided = set(result['approved']) | set(result['rejected']) | set(result['pending'])
+        return Response({
+            'approved': [str(bill_id) for bill_id in result['approved']],
+            'rejected': [str(bill_id) for bill_id in result['rejected']],
+            'pending': {str(bill_id): count for bill_id, count in result['pending'].items()},
+            'skipped': [str(bill_id) for bill_id in decisions if bill_id not in decided],
+        })
     
     @action(detail=True, methods=['post'])
     def schedule_payment(self, request, org_id=None, pk=None):
@@ -170,41 +269,45 @@ class BillViewSet(viewsets.ModelViewSet):
         
         return Response({'success': True, 'bill': BillSerializer(bill).data})
     
+    @action(detail=False, methods=['post'], url_path='optimize-payments')
+    def optimize_payments(self, request, org_id=None):
+        """
+        Plan payment dates for approved bills, taking early-payment discounts
+        that beat the cost of cash while staying above the minimum balance.
+        Nothing is scheduled unless dry_run is false.
+        """
+        serializer = PaymentOptimizationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        
+        from .payment_optimizer import apply_payment_schedule, optimize_payment_schedule
+        plan = optimize_payment_schedule(
+            org_id,
+            cash_balance=params.get('cash_balance'),
+            minimum_balance=float(params['minimum_balance']),
+            cost_of_capital=float(params['cost_of_capital']) / 100
+        )
+        
+        plan['dry_run'] = params['dry_run']
+        if not params['dry_run']:
+            plan['scheduled'] = apply_payment_schedule(org_id, plan['payments'])
+        
+        return Response(plan)
+    
     @action(detail=False, methods=['get'])
     def ap_aging(self, request, org_id=None):
         """Generate AP aging report"""
-        from datetime import date
-        from decimal import Decimal
+        from .analytics import ap_aging, monthly_trend
         
-        bills = self.get_queryset().exclude(status__in=['paid', 'cancelled'])
-        today = date.today()
-        
-        aging = {
-            'current': Decimal('0'),
-            'days_1_30': Decimal('0'),
-            'days_31_60': Decimal('0'),
-            'days_61_90': Decimal('0'),
-            'days_over_90': Decimal('0'),
-        }
-        
-        for bill in bills:
-            days_until_due = (bill.due_date - today).days
-            amount = bill.amount_remaining()
-            
-            if days_until_due >= 0:
-                aging['current'] += amount
-            elif days_until_due >= -30:
-                aging['days_1_30'] += amount
-            elif days_until_due >= -60:
-                aging['days_31_60'] += amount
-            elif days_until_due >= -90:
-                aging['days_61_90'] += amount
-            else:
-                aging['days_over_90'] += amount
+        aging = ap_aging(org_id)
         
         return Response({
             'aging_buckets': {k: float(v) for k, v in aging.items()},
             'total_payable': float(sum(aging.values())),
+            'monthly_trend': [
+                {**point, 'billed': float(point['billed']), 'paid': float(point['paid'])}
+                for point in monthly_trend(org_id)
+            ],
             'generated_at': timezone.now()
         })
 
@@ -233,6 +336,15 @@ class RecurringScheduleViewSet(viewsets.ModelViewSet):
     
     def perform_create(self, serializer):
         serializer.save(organization_id=self.kwargs['org_id'], created_by=self.request.user)
+    
+    @action(detail=True, methods=['post'])
+    def confirm(self, request, org_id=None, pk=None):
+        """Confirm a detected schedule so it starts generating bills"""
+        schedule = self.get_object()
+        schedule.is_active = True
+        schedule.save(update_fields=['is_active', 'updated_at'])
+        
+        return Response({'success': True, 'schedule': RecurringScheduleSerializer(schedule).data})
 
 
 class PaymentBatchViewSet(viewsets.ModelViewSet):
@@ -5,6 +5,7 @@ import os
 from pathlib import Path
 from datetime import timedelta
 from decouple import config, Csv
+from celery.schedules import crontab
 
 # Build paths inside the project
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
@@ -114,6 +115,14 @@ STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
+# Media files (uploads, rendered documents)
+MEDIA_URL = '/media/'
+MEDIA_ROOT = config('MEDIA_ROOT', default=os.path.join(BASE_DIR, 'media'))
+
+# Email
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='billing@finpilot.com')
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -163,6 +172,52 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+	'update-invoice-statuses': {
+		'task': 'app.invoices.tasks.update_invoice_statuses',
+		'schedule': crontab(hour=1, minute=0),
+	},
+	'requeue-stale-webhook-events': {
+		'task': 'app.invoices.tasks.requeue_stale_webhook_events',
+		'schedule': crontab(minute='*/15'),
+	},
+	'check-bill-due-dates': {
+		'task': 'app.billpay.tasks.check_bill_due_dates',
+		'schedule': crontab(hour=1, minute=0),
+	},
+	'escalate-pending-approvals': {
+		'task': 'app.billpay.tasks.escalate_pending_approvals',
+		'schedule': crontab(minute=0),
+	},
+	'generate-recurring-invoices': {
+		'task': 'app.invoices.tasks.generate_recurring_invoices',
+		'schedule': crontab(hour=1, minute=0),
+	},
+	'detect-recurring-bills': {
+		'task': 'app.billpay.tasks.detect_recurring_bills',
+		'schedule': crontab(hour=2, minute=0, day_of_week=1),
+	},
+	'reconcile-payments': {
+		'task': 'app.billpay.tasks.reconcile_payments',
+		'schedule': crontab(minute='*/15'),
+	},
+	'generate-recurring-bills': {
+		'task': 'app.billpay.tasks.generate_recurring_bills',
+		'schedule': crontab(hour=1, minute=30),
+	},
+	'update-vendor-metrics': {
+		'task': 'app.billpay.tasks.update_vendor_metrics',
+		'schedule': crontab(hour=3, minute=0),
+	},
+	'run-scheduled-scenarios': {
+		'task': 'app.planning.tasks.run_scheduled_scenarios',
+		'schedule': crontab(hour=4, minute=0),
+	},
+	'purge-scenario-results': {
+		'task': 'app.planning.tasks.purge_scenario_results',
+		'schedule': crontab(hour=5, minute=0),
+	},
+}
 
 # External Service URLs
 ML_SERVICE_URL = config('ML_SERVICE_URL', default='http://ml_service:8080')
@@ -172,6 +227,52 @@ ML_INTERNAL_TOKEN = config('ML_INTERNAL_TOKEN', default='secure_local_token_chan
 STRIPE_API_KEY = config('STRIPE_API_KEY', default='')
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY', default='')  # Same as API key
 STRIPE_WEBHOOK_SECRET = config('STRIPE_WEBHOOK_SECRET', default='')
+STRIPE_API_BASE = config('STRIPE_API_BASE', default='https://api.stripe.com')  # Point at stripe-mock locally
+STRIPE_HTTP_POOL_SIZE = config('STRIPE_HTTP_POOL_SIZE', default=10, cast=int)
+STRIPE_HTTP_TIMEOUT = config('STRIPE_HTTP_TIMEOUT', default=30, cast=int)
+STRIPE_WEBHOOK_REQUEUE_AFTER = config('STRIPE_WEBHOOK_REQUEUE_AFTER', default=600, cast=int)  # Seconds before an unprocessed event is queued again
+STRIPE_WEBHOOK_MAX_ATTEMPTS = config('STRIPE_WEBHOOK_MAX_ATTEMPTS', default=20, cast=int)  # Failed attempts before the sweeper gives up
+
+# Invoice PDFs (content-addressed cache in default storage)
+INVOICE_PDF_STORAGE_PREFIX = 'invoice_pdfs'
+INVOICE_PDF_RENDER_CHUNK_SIZE = config('INVOICE_PDF_RENDER_CHUNK_SIZE', default=50, cast=int)
+
+# Bulk invoice creation and recurring invoices
+INVOICE_BULK_MAX_INVOICES = config('INVOICE_BULK_MAX_INVOICES', default=1000, cast=int)  # Per API request
+INVOICE_BULK_BATCH_SIZE = config('INVOICE_BULK_BATCH_SIZE', default=500, cast=int)  # Rows per INSERT
+RECURRING_INVOICE_BATCH_SIZE = config('RECURRING_INVOICE_BATCH_SIZE', default=1000, cast=int)  # Templates per transaction
+
+# Bill OCR (Tesseract; raw results cached in default storage by file hash)
+BILL_OCR_WORKERS = config('BILL_OCR_WORKERS', default=os.cpu_count() or 1, cast=int)  # Concurrent tesseract processes
+BILL_OCR_DPI = config('BILL_OCR_DPI', default=300, cast=int)
+BILL_OCR_LANG = config('BILL_OCR_LANG', default='eng')
+BILL_OCR_CACHE_PREFIX = 'bill_ocr'
+BILL_OCR_VENDOR_MATCH_THRESHOLD = config('BILL_OCR_VENDOR_MATCH_THRESHOLD', default=0.8, cast=float)
+
+# Bill approvals (compiled approval tables are cached per workflow revision)
+BILL_APPROVAL_TABLE_TTL = config('BILL_APPROVAL_TABLE_TTL', default=3600, cast=int)
+BILL_APPROVAL_BATCH_SIZE = config('BILL_APPROVAL_BATCH_SIZE', default=1000, cast=int)
+BILL_BULK_SUBMIT_MAX_BILLS = config('BILL_BULK_SUBMIT_MAX_BILLS', default=1000, cast=int)
+
+# Bill payments (batches run as parallel chunks, claimed before the rail is called)
+BILL_PAYMENT_RAIL = config('BILL_PAYMENT_RAIL', default='app.billpay.payment_rails.LocalPaymentRail')
+BILL_PAYMENT_CHUNK_SIZE = config('BILL_PAYMENT_CHUNK_SIZE', default=500, cast=int)
+BILL_PAYMENT_RECONCILE_AFTER = config('BILL_PAYMENT_RECONCILE_AFTER', default=900, cast=int)  # Seconds in processing before resubmission
+BILL_COST_OF_CAPITAL_PERCENT = config('BILL_COST_OF_CAPITAL_PERCENT', default=8, cast=float)  # Hurdle for early-payment discounts
+BILL_MINIMUM_CASH_BALANCE = config('BILL_MINIMUM_CASH_BALANCE', default=0, cast=float)
+
+# Recurring bills
+RECURRING_BILL_BATCH_SIZE = config('RECURRING_BILL_BATCH_SIZE', default=1000, cast=int)  # Schedules per transaction
+
+# Scenario planning (baseline snapshots are cached per transaction revision; results are thinned by age)
+PLANNING_BASELINE_TTL = config('PLANNING_BASELINE_TTL', default=86400, cast=int)
+PLANNING_SCENARIO_CHUNK_SIZE = config('PLANNING_SCENARIO_CHUNK_SIZE', default=100, cast=int)  # Scenarios per nightly task
+PLANNING_RESULT_KEEP_LATEST = config('PLANNING_RESULT_KEEP_LATEST', default=10, cast=int)  # Results kept in full per scenario
+PLANNING_RESULT_DAILY_DAYS = config('PLANNING_RESULT_DAILY_DAYS', default=30, cast=int)  # Then one per day for this long
+PLANNING_RESULT_WEEKLY_WEEKS = config('PLANNING_RESULT_WEEKLY_WEEKS', default=52, cast=int)  # Then one per week
+PLANNING_RESULT_PURGE_BATCH_SIZE = config('PLANNING_RESULT_PURGE_BATCH_SIZE', default=500, cast=int)
+SCENARIO_MONTE_CARLO_PATHS = config('SCENARIO_MONTE_CARLO_PATHS', default=10000, cast=int)
+SCENARIO_MONTE_CARLO_MAX_PATHS = config('SCENARIO_MONTE_CARLO_MAX_PATHS', default=100000, cast=int)
 
 # Plaid
 PLAID_CLIENT_ID = config('PLAID_CLIENT_ID', default='')
@@ -0,0 +1,119 @@
+"""
+Set-based status transitions
+
+A transition is one UPDATE ... RETURNING statement: it moves every matching
+row at once and hands back exactly the IDs it changed. Those IDs are
+broadcast through the status_transitioned signal after commit, so
+downstream work (notifications, audit entries) can be done in bulk for the
+rows that really moved instead of re-querying them.
+"""
+import logging
+from django.db import connections, router, transaction
+from django.db.models import sql
+from django.dispatch import Signal
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Sent once per transition with sender=<model>, transition=<name>, ids=[...]
+status_transitioned = Signal()
+
+# Backends that support UPDATE ... RETURNING
+RETURNING_VENDORS = ('postgresql', 'sqlite')
+
+
+class Transition:
+    """
+    A named status change applied to every row matching a condition
+
+    Args:
+        name: Transition name reported in counts and events
+        model: Model class
+        condition: callable(now) -> Q selecting the rows to move
+        values: callable(now) -> dict of field values to set
+    """
+
+    def __init__(self, name, model, condition, values):
+        self.name = name
+        self.model = model
+        self.condition = condition
+        self.values = values
+
+    def __repr__(self):
+        return f"<Transition {self.name} on {self.model.__name__}>"
+
+
+def update_returning(queryset, **values):
+    """
+    Update the rows in a queryset and return the primary keys it changed
+
+    Uses a single UPDATE ... RETURNING where the backend supports it, and
+    falls back to locking the rows, reading their keys and updating by key.
+
+    Returns:
+        list: Primary keys of the updated rows
+    """
+    model = queryset.model
+    using = queryset.db
+    connection = connections[using]
+    pk_field = model._meta.pk
+
+    if connection.vendor not in RETURNING_VENDORS:
+        with transaction.atomic(using=using):
+            pks = list(queryset.select_for_update().values_list('pk', flat=True))
+            model._base_manager.using(using).filter(pk__in=pks).update(**values)
+        return pks
+
+    # Same query construction as QuerySet.update(), plus RETURNING
+    query = queryset.query.chain(sql.UpdateQuery)
+    query.add_update_values(values)
+    query.annotations = {}
+    update_sql, params = query.get_compiler(using).as_sql()
+    if not update_sql:
+        return []
+
+    returning_sql = f"{update_sql} RETURNING {connection.ops.quote_name(pk_field.column)}"
+    with transaction.mark_for_rollback_on_error(using=using):
+        with connection.cursor() as cursor:
+            cursor.execute(returning_sql, params)
+            rows = cursor.fetchall()
+
+    return [pk_field.to_python(row[0]) for row in rows]
+
+
+def run_transitions(transitions, now=None):
+    """
+    Apply transitions in order, one statement each
+
+    Args:
+        transitions: Iterable of Transition
+        now: Reference time (defaults to timezone.now())
+
+    Returns:
+        dict: {transition name: number of rows moved}
+    """
+    now = now or timezone.now()
+    counts = {}
+
+    for transition in transitions:
+        model = transition.model
+        using = router.db_for_write(model)
+
+        with transaction.atomic(using=using):
+            ids = update_returning(
+                model._default_manager.using(using).filter(transition.condition(now)),
+                **transition.values(now)
+            )
+
+            if ids:
+                transaction.on_commit(
+                    lambda transition=transition, ids=ids: status_transitioned.send(
+                        sender=transition.model, transition=transition.name, ids=ids
+                    ),
+                    using=using
+                )
+
+        counts[transition.name] = len(ids)
+        logger.info("Transition %s moved %d %s rows", transition.name, len(ids), model.__name__)
+
+    return counts
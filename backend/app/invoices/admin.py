@@ -4,7 +4,8 @@ Django Admin configuration for Invoice Management
 from django.contrib import admin
 from .models import (
     Customer, Invoice, InvoiceLineItem, Payment,
-    InvoiceCommunication, PaymentPrediction, ReminderSchedule
+    InvoiceCommunication, PaymentPrediction, ReminderSchedule,
+    InvoiceNumberSequence, RecurringInvoice
 )
 
 
@@ -103,3 +104,18 @@ class ReminderScheduleAdmin(admin.ModelAdmin):
     list_filter = ['is_active', 'tone', 'use_email', 'use_sms']
     readonly_fields = ['id', 'created_at', 'updated_at']
 
+
+@admin.register(InvoiceNumberSequence)
+class InvoiceNumberSequenceAdmin(admin.ModelAdmin):
+    list_display = ['organization', 'prefix', 'padding', 'next_number', 'updated_at']
+    search_fields = ['organization__name', 'prefix']
+    readonly_fields = ['next_number', 'created_at', 'updated_at']
+
+
+@admin.register(RecurringInvoice)
+class RecurringInvoiceAdmin(admin.ModelAdmin):
+    list_display = ['customer', 'organization', 'frequency', 'next_issue_date',
+                    'auto_send', 'is_active', 'invoices_generated']
+    list_filter = ['frequency', 'auto_send', 'is_active']
+    search_fields = ['customer__name', 'customer__email']
+    readonly_fields = ['id', 'last_generated_at', 'invoices_generated', 'created_at', 'updated_at']
@@ -0,0 +1,162 @@
+"""
+Customer payment analytics
+
+Shared by the customer payment_history endpoint and the weekly
+update_customer_payment_metrics task. Everything is computed in the
+database: one grouped pass over a customer's invoices yields the monthly
+payment-timing histogram, and the overall metrics are rolled up from it.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from .models import Customer, Invoice
+
+# Days from issue to payment, as a duration
+DAYS_TO_PAY = ExpressionWrapper(
+    TruncDate('paid_at') - F('issue_date'),
+    output_field=DurationField()
+)
+
+PAID_WITH_DATE = Q(status='paid', paid_at__isnull=False)
+PAID_ON_TIME = PAID_WITH_DATE & Q(paid_at__date__lte=F('due_date'))
+
+# Late-payment buckets for the timing histogram: (label, max days late)
+LATE_BUCKETS = [
+    ('late_1_30', 30),
+    ('late_31_60', 60),
+]
+
+
+def _days(duration):
+    """Convert a duration (or None) to fractional days"""
+    return duration.total_seconds() / 86400 if duration else 0
+
+
+def customer_payment_history(customer):
+    """
+    Payment metrics and monthly timing histogram for one customer
+
+    Runs a single grouped query over the customer's invoices, bucketed by
+    issue month; the overall metrics are sums of the monthly rows.
+
+    Args:
+        customer: Customer object
+
+    Returns:
+        dict: {'metrics': {...}, 'monthly_payment_timing': [...]}
+    """
+    late_filters = {}
+    lower = 0
+    for label, upper in LATE_BUCKETS:
+        late_filters[label] = Count('id', filter=PAID_WITH_DATE & Q(
+            paid_at__date__gt=F('due_date') + timedelta(days=lower),
+            paid_at__date__lte=F('due_date') + timedelta(days=upper)
+        ))
+        lower = upper
+
+    rows = Invoice.objects.filter(customer=customer).annotate(
+        month=TruncMonth('issue_date')
+    ).values('month').annotate(
+        total=Count('id'),
+        paid=Count('id', filter=Q(status='paid')),
+        overdue=Count('id', filter=Q(status='overdue')),
+        paid_with_date=Count('id', filter=PAID_WITH_DATE),
+        on_time=Count('id', filter=PAID_ON_TIME),
+        days_to_pay=Sum(DAYS_TO_PAY, filter=PAID_WITH_DATE),
+        late_over_60=Count('id', filter=PAID_WITH_DATE & Q(
+            paid_at__date__gt=F('due_date') + timedelta(days=lower)
+        )),
+        **late_filters
+    ).order_by('month')
+
+    monthly = []
+    totals = {'total': 0, 'paid': 0, 'overdue': 0, 'paid_with_date': 0, 'days_to_pay': 0}
+
+    for row in rows:
+        days_to_pay = _days(row['days_to_pay'])
+        for key in ('total', 'paid', 'overdue', 'paid_with_date'):
+            totals[key] += row[key]
+        totals['days_to_pay'] += days_to_pay
+
+        monthly.append({
+            'month': row['month'].strftime('%Y-%m'),
+            'invoices': row['total'],
+            'paid': row['paid'],
+            'average_days_to_pay': round(days_to_pay / row['paid_with_date'], 1) if row['paid_with_date'] else None,
+            'on_time': row['on_time'],
+            **{label: row[label] for label, _ in LATE_BUCKETS},
+            'late_over_60': row['late_over_60'],
+        })
+
+    paid_with_date = totals['paid_with_date']
+    avg_days_to_pay = totals['days_to_pay'] / paid_with_date if paid_with_date else 0
+
+    return {
+        'metrics': {
+            'total_invoices': totals['total'],
+            'paid_invoices': totals['paid'],
+            'overdue_invoices': totals['overdue'],
+            'average_days_to_pay': round(avg_days_to_pay, 1),
+            'on_time_payment_rate': (totals['paid'] / totals['total'] * 100) if totals['total'] > 0 else 0
+        },
+        'monthly_payment_timing': monthly,
+    }
+
+
+def reliability_score(on_time_rate, avg_days):
+    """
+    Payment reliability score (0-100)
+    Based on: on-time payment rate (60%), average days to pay (40%)
+    """
+    # Penalize for slow payment (beyond 30 days)
+    days_score = max(0, 100 - (avg_days - 30) * 2) if avg_days > 30 else 100
+
+    reliability = (on_time_rate * 0.6) + (days_score * 0.4)
+    return Decimal(str(round(reliability, 2)))
+
+
+def refresh_customer_payment_metrics(customers=None, batch_size=1000):
+    """
+    Recompute average_days_to_pay and payment_reliability_score
+
+    One grouped query over paid invoices covers every customer; changed
+    customers are written back with bulk_update.
+
+    Args:
+        customers: Customer queryset (defaults to all customers)
+        batch_size: Rows per UPDATE
+
+    Returns:
+        int: Number of customers with paid invoices
+    """
+    invoices = Invoice.objects.filter(PAID_WITH_DATE)
+    if customers is not None:
+        invoices = invoices.filter(customer__in=customers)
+
+    stats = {
+        row['customer_id']: row
+        for row in invoices.values('customer_id').annotate(
+            paid=Count('id'),
+            on_time=Count('id', filter=PAID_ON_TIME),
+            avg_days=Avg(DAYS_TO_PAY),
+        )
+    }
+
+    to_update = []
+    for customer in Customer.objects.filter(id__in=stats.keys()).only(
+        'id', 'average_days_to_pay', 'payment_reliability_score'
+    ):
+        row = stats[customer.id]
+        avg_days = _days(row['avg_days'])
+        on_time_rate = (row['on_time'] / row['paid']) * 100
+
+        customer.average_days_to_pay = int(avg_days)
+        customer.payment_reliability_score = reliability_score(on_time_rate, avg_days)
+        to_update.append(customer)
+
+    Customer.objects.bulk_update(
+        to_update, ['average_days_to_pay', 'payment_reliability_score'], batch_size=batch_size
+    )
+
+    return len(stats)
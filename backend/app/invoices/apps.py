@@ -8,4 +8,7 @@ class InvoicesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app.invoices'
     verbose_name = 'Invoice Management'
+    
+    def ready(self):
+        from . import signals  # noqa: F401
 
@@ -0,0 +1,144 @@
+"""
+Customer balance counters
+
+Customer.total_invoiced, total_paid and outstanding_balance are maintained on
+write: every code path that creates, edits, pays, cancels or deletes an
+invoice computes how the invoice's contribution to those counters changed
+and applies the difference with F() increments in the same transaction.
+reconcile_customer_balances() recomputes them from the invoices to repair
+any drift (rows written outside these paths, e.g. demo data or raw SQL).
+"""
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Q, Sum, Value, When
+from .models import Customer, Invoice
+
+ZERO = Decimal('0.00')
+
+# Invoices in these statuses no longer count towards the outstanding balance
+CLOSED_STATUSES = ('paid', 'cancelled')
+
+BALANCE_FIELDS = ('total_invoiced', 'total_paid', 'outstanding_balance')
+
+
+def invoice_contribution(invoice):
+    """
+    What an invoice adds to its customer's counters
+
+    Returns:
+        tuple: (invoiced, paid, outstanding)
+    """
+    invoiced = ZERO if invoice.status == 'cancelled' else invoice.total_amount
+    outstanding = ZERO if invoice.status in CLOSED_STATUSES else invoice.total_amount - invoice.amount_paid
+    return (invoiced, invoice.amount_paid, outstanding)
+
+
+def add_delta(deltas, customer_id, contribution, sign=1):
+    """Accumulate a contribution (or its removal, sign=-1) into a per-customer delta map"""
+    current = deltas.get(customer_id, (ZERO, ZERO, ZERO))
+    deltas[customer_id] = tuple(total + sign * value for total, value in zip(current, contribution))
+    return deltas
+
+
+def adjust_customer_balances(deltas):
+    """
+    Apply per-customer counter deltas with F() increments
+
+    Args:
+        deltas: {customer_id: (invoiced, paid, outstanding)}
+    """
+    deltas = {customer_id: delta for customer_id, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+
+    if len(deltas) == 1:
+        (customer_id, delta), = deltas.items()
+        Customer.objects.filter(id=customer_id).update(**{
+            field: F(field) + value for field, value in zip(BALANCE_FIELDS, delta)
+        })
+        return
+
+    # Many customers: one UPDATE with a CASE per counter
+    output_field = DecimalField(max_digits=12, decimal_places=2)
+    Customer.objects.filter(id__in=deltas.keys()).update(**{
+        field: F(field) + Case(
+            *[When(id=customer_id, then=Value(delta[index])) for customer_id, delta in deltas.items()],
+            default=Value(ZERO),
+            output_field=output_field
+        )
+        for index, field in enumerate(BALANCE_FIELDS)
+    })
+
+
+def record_invoice_change(invoice, before_customer_id=None, before=None):
+    """
+    Apply the counter change caused by creating or editing one invoice
+
+    Args:
+        invoice: Invoice in its new state
+        before_customer_id: Customer the invoice belonged to before the change
+        before: invoice_contribution() taken before the change (None for a new invoice)
+    """
+    deltas = {}
+    if before is not None:
+        add_delta(deltas, before_customer_id, before, sign=-1)
+    add_delta(deltas, invoice.customer_id, invoice_contribution(invoice))
+    adjust_customer_balances(deltas)
+
+
+def reconcile_customer_balances(customers, dry_run=False, batch_size=1000):
+    """
+    Recompute counters from invoices and repair customers that drifted
+
+    Each batch locks its customers, aggregates their invoices in one grouped
+    query and writes the corrected rows with one bulk_update.
+
+    Args:
+        customers: Customer queryset to check
+        dry_run: Report drift without writing
+        batch_size: Customers per transaction
+
+    Returns:
+        list: (customer_id, stored counters, actual counters) for drifted customers
+    """
+    drifted = []
+    customer_ids = list(customers.order_by('id').values_list('id', flat=True))
+
+    for start in range(0, len(customer_ids), batch_size):
+        batch_ids = customer_ids[start:start + batch_size]
+
+        with transaction.atomic():
+            stored = {
+                customer.id: customer
+                for customer in Customer.objects.select_for_update().filter(id__in=batch_ids).only(
+                    'id', *BALANCE_FIELDS
+                )
+            }
+            actual = {
+                row['customer_id']: (row['invoiced'] or ZERO, row['paid'] or ZERO, row['outstanding'] or ZERO)
+                for row in Invoice.objects.filter(customer_id__in=batch_ids).values('customer_id').annotate(
+                    invoiced=Sum('total_amount', filter=~Q(status='cancelled')),
+                    paid=Sum('amount_paid'),
+                    outstanding=Sum(
+                        F('total_amount') - F('amount_paid'),
+                        filter=~Q(status__in=CLOSED_STATUSES)
+                    )
+                )
+            }
+
+            to_update = []
+            for customer_id, customer in stored.items():
+                current = tuple(getattr(customer, field) for field in BALANCE_FIELDS)
+                expected = actual.get(customer_id, (ZERO, ZERO, ZERO))
+                if current == expected:
+                    continue
+
+                drifted.append((customer_id, current, expected))
+                for field, value in zip(BALANCE_FIELDS, expected):
+                    setattr(customer, field, value)
+                to_update.append(customer)
+
+            if to_update and not dry_run:
+                Customer.objects.bulk_update(to_update, BALANCE_FIELDS)
+
+    return drifted
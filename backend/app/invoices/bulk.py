@@ -0,0 +1,64 @@
+"""
+Bulk invoice creation
+
+Writes a batch of invoices with one bulk INSERT for the invoices and one for
+their line items, inside a single transaction. Invoices without a number are
+numbered from one pre-allocated block, so the whole batch takes the
+organization's sequence lock once.
+"""
+from django.conf import settings
+from django.db import transaction
+from .balances import add_delta, adjust_customer_balances, invoice_contribution
+from .models import Invoice, InvoiceLineItem
+from .numbering import allocate_invoice_numbers
+
+
+def bulk_create_invoices(organization_id, invoices_data, created_by=None):
+    """
+    Create many invoices and their line items
+
+    Args:
+        organization_id: Organization ID
+        invoices_data: List of dicts of Invoice field values, each with an
+            optional 'line_items' list of InvoiceLineItem field dicts
+        created_by: User creating the invoices (optional)
+
+    Returns:
+        list: Created Invoice objects, in input order
+    """
+    invoices = []
+    line_items = []
+
+    for data in invoices_data:
+        data = dict(data)
+        items_data = data.pop('line_items', [])
+
+        invoice = Invoice(organization_id=organization_id, **data)
+        if created_by is not None:
+            invoice.created_by = created_by
+        invoices.append(invoice)
+
+        for sort_order, item_data in enumerate(items_data):
+            item_data = dict(item_data)
+            item_data.pop('id', None)
+            item_data.setdefault('sort_order', sort_order)
+            line_items.append(InvoiceLineItem(invoice=invoice, **item_data))
+
+    batch_size = settings.INVOICE_BULK_BATCH_SIZE
+
+    with transaction.atomic():
+        # Number last, right before the insert, to keep the lock window short
+        unnumbered = [invoice for invoice in invoices if not invoice.invoice_number]
+        numbers = allocate_invoice_numbers(organization_id, count=len(unnumbered))
+        for invoice, number in zip(unnumbered, numbers):
+            invoice.invoice_number = number
+
+        Invoice.objects.bulk_create(invoices, batch_size=batch_size)
+        InvoiceLineItem.objects.bulk_create(line_items, batch_size=batch_size)
+        
+        balance_deltas = {}
+        for invoice in invoices:
+            add_delta(balance_deltas, invoice.customer_id, invoice_contribution(invoice))
+        adjust_customer_balances(balance_deltas)
+
+    return invoices
@@ -0,0 +1,36 @@
+"""
+Detect and repair drift in customer balance counters
+"""
+from django.core.management.base import BaseCommand
+
+from app.invoices.balances import reconcile_customer_balances
+from app.invoices.models import Customer
+
+
+class Command(BaseCommand):
+    help = 'Recompute customer total_invoiced, total_paid and outstanding_balance from invoices'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--org', dest='org_id', help='Only reconcile customers of this organization')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without fixing it')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Customers per transaction')
+
+    def handle(self, *args, **options):
+        customers = Customer.objects.all()
+        if options['org_id']:
+            customers = customers.filter(organization_id=options['org_id'])
+
+        drifted = reconcile_customer_balances(
+            customers,
+            dry_run=options['dry_run'],
+            batch_size=options['batch_size']
+        )
+
+        for customer_id, stored, actual in drifted:
+            self.stdout.write(
+                f'{customer_id}: invoiced {stored[0]} -> {actual[0]}, '
+                f'paid {stored[1]} -> {actual[1]}, outstanding {stored[2]} -> {actual[2]}'
+            )
+
+        verb = 'Found' if options['dry_run'] else 'Repaired'
+        self.stdout.write(self.style.SUCCESS(f'✓ {verb} {len(drifted)} customers with drifted balances'))
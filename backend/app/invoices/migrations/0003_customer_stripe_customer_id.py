@@ -0,0 +1,19 @@
+# Generated migration for invoices app
+# Persists the Stripe customer ID so payment intents skip the Stripe customer lookup
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0002_stripe_webhook_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='stripe_customer_id',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
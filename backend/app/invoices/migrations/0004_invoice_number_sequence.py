@@ -0,0 +1,33 @@
+# Generated migration for invoices app
+# Adds the per-organization invoice number counter
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.core.validators
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('invoices', '0003_customer_stripe_customer_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceNumberSequence',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('prefix', models.CharField(blank=True, max_length=20)),
+                ('padding', models.IntegerField(default=0, validators=[django.core.validators.MinValueValidator(0)])),
+                ('next_number', models.BigIntegerField(default=1001)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('organization', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='invoice_number_sequence', to='users.organization')),
+            ],
+            options={
+                'db_table': 'invoice_number_sequences',
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated migration for invoices app
+# Adds recurring invoice templates
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+import django.core.validators
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('invoices', '0004_invoice_number_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecurringInvoice',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('frequency', models.CharField(choices=[('weekly', 'Weekly'), ('monthly', 'Monthly'), ('quarterly', 'Quarterly'), ('yearly', 'Yearly')], default='monthly', max_length=20)),
+                ('next_issue_date', models.DateField()),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('due_days', models.IntegerField(default=30, validators=[django.core.validators.MinValueValidator(0)])),
+                ('line_items', models.JSONField(default=list)),
+                ('tax_rate', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=5, validators=[django.core.validators.MinValueValidator(Decimal('0.00'))])),
+                ('discount_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('payment_terms', models.CharField(default='Net 30', max_length=100)),
+                ('notes', models.TextField(blank=True)),
+                ('footer_text', models.TextField(blank=True)),
+                ('template_id', models.CharField(default='default', max_length=50)),
+                ('auto_send', models.BooleanField(default=False)),
+                ('is_active', models.BooleanField(default=True)),
+                ('last_generated_at', models.DateTimeField(blank=True, null=True)),
+                ('invoices_generated', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='recurring_invoices_created', to='users.user')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='recurring_invoices', to='invoices.customer')),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recurring_invoices', to='users.organization')),
+            ],
+            options={
+                'db_table': 'recurring_invoices',
+                'ordering': ['next_issue_date'],
+                'indexes': [
+                    models.Index(fields=['is_active', 'next_issue_date'], name='recurring_inv_due_idx'),
+                    models.Index(fields=['organization', 'customer'], name='recurring_inv_org_cust_idx'),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated migration for invoices app
+# Adds the maintained outstanding balance counter to customers
+# Run `manage.py reconcile_customer_balances` once after migrating to backfill
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0005_recurring_invoice'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='outstanding_balance',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+    ]
@@ -45,6 +45,10 @@ class Customer(models.Model):
     average_days_to_pay = models.IntegerField(default=0)
     total_invoiced = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
     total_paid = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    outstanding_balance = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    
+    # Stripe integration (created lazily on first online payment)
+    stripe_customer_id = models.CharField(max_length=255, blank=True, null=True)
     
     notes = models.TextField(blank=True)
     tags = models.JSONField(default=list, blank=True)  # ['vip', 'slow-payer', etc.]
@@ -192,6 +196,39 @@ class Invoice(models.Model):
     def amount_remaining(self):
         """Calculate remaining amount to be paid"""
         return self.total_amount - self.amount_paid
+    
+    def apply_payment(self, amount):
+        """
+        Add a succeeded payment (or subtract a refund, when negative) to
+        amount_paid, advance the status and update the customer's balances.
+        
+        Must run inside transaction.atomic(): the invoice row is re-read
+        with SELECT ... FOR UPDATE so concurrent payments serialize instead
+        of overwriting each other's read-modify-write.
+        """
+        from .balances import invoice_contribution, record_invoice_change
+        
+        locked = Invoice.objects.select_for_update().get(pk=self.pk)
+        before = invoice_contribution(locked)
+        locked.amount_paid += amount
+        
+        if locked.amount_paid >= locked.total_amount:
+            locked.status = 'paid'
+            locked.paid_at = locked.paid_at or timezone.now()
+        elif locked.amount_paid > 0:
+            locked.status = 'partial'
+            locked.paid_at = None
+        elif locked.status in ('paid', 'partial'):
+            locked.status = 'sent'
+            locked.paid_at = None
+        
+        locked.save(update_fields=['amount_paid', 'status', 'paid_at', 'updated_at'])
+        record_invoice_change(locked, locked.customer_id, before)
+        
+        self.amount_paid = locked.amount_paid
+        self.status = locked.status
+        self.paid_at = locked.paid_at
+        return self
 
 
 class InvoiceLineItem(models.Model):
@@ -426,3 +463,138 @@ class ReminderSchedule(models.Model):
     def __str__(self):
         return f"Reminder Schedule for {self.organization.name}"
 
+
+
+class StripeWebhookEvent(models.Model):
+    """Ledger of received Stripe webhook events, keyed on Stripe event ID"""
+    STATUS_CHOICES = [
+        ('received', 'Received'),
+        ('processed', 'Processed'),
+        ('failed', 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    stripe_event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='received')
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.IntegerField(default=0)
+    
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'stripe_webhook_events'
+        ordering = ['-received_at']
+        indexes = [
+            models.Index(fields=['status', 'received_at'], name='stripe_evt_status_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.event_type} ({self.stripe_event_id}) - {self.status}"
+
+
+class InvoiceNumberSequence(models.Model):
+    """Per-organization invoice number counter"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    organization = models.OneToOneField(
+        Organization,
+        on_delete=models.CASCADE,
+        related_name='invoice_number_sequence'
+    )
+    
+    # Numbering format: {prefix}{number zero-padded to `padding` digits}
+    prefix = models.CharField(max_length=20, blank=True)
+    padding = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    next_number = models.BigIntegerField(default=1001)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'invoice_number_sequences'
+    
+    def __str__(self):
+        return f"Invoice numbering for {self.organization.name} (next: {self.format_number(self.next_number)})"
+    
+    def format_number(self, number):
+        """Format a sequence value as an invoice number"""
+        return f"{self.prefix}{number:0{self.padding}d}"
+
+
+class RecurringInvoice(models.Model):
+    """Template that issues an invoice to a customer every billing cycle"""
+    FREQUENCY_CHOICES = [
+        ('weekly', 'Weekly'),
+        ('monthly', 'Monthly'),
+        ('quarterly', 'Quarterly'),
+        ('yearly', 'Yearly'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    organization = models.ForeignKey(
+        Organization,
+        on_delete=models.CASCADE,
+        related_name='recurring_invoices'
+    )
+    customer = models.ForeignKey(
+        Customer,
+        on_delete=models.PROTECT,
+        related_name='recurring_invoices'
+    )
+    
+    # Schedule
+    frequency = models.CharField(max_length=20, choices=FREQUENCY_CHOICES, default='monthly')
+    next_issue_date = models.DateField()
+    end_date = models.DateField(null=True, blank=True)
+    due_days = models.IntegerField(default=30, validators=[MinValueValidator(0)])
+    
+    # Invoice contents
+    line_items = models.JSONField(default=list)  # [{description, quantity, unit_price}]
+    tax_rate = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        validators=[MinValueValidator(Decimal('0.00'))]
+    )
+    discount_amount = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=Decimal('0.00')
+    )
+    payment_terms = models.CharField(max_length=100, default='Net 30')
+    notes = models.TextField(blank=True)
+    footer_text = models.TextField(blank=True)
+    template_id = models.CharField(max_length=50, default='default')
+    
+    # Generated invoices go out immediately instead of staying in draft
+    auto_send = models.BooleanField(default=False)
+    is_active = models.BooleanField(default=True)
+    
+    # Tracking
+    last_generated_at = models.DateTimeField(null=True, blank=True)
+    invoices_generated = models.IntegerField(default=0)
+    
+    created_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='recurring_invoices_created'
+    )
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'recurring_invoices'
+        ordering = ['next_issue_date']
+        indexes = [
+            models.Index(fields=['is_active', 'next_issue_date'], name='recurring_inv_due_idx'),
+            models.Index(fields=['organization', 'customer'], name='recurring_inv_org_cust_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_frequency_display()} invoice for {self.customer.name}"
@@ -0,0 +1,65 @@
+"""
+Invoice number allocation
+
+Each organization has one InvoiceNumberSequence row. Numbers are taken by
+incrementing that row with an F() expression, which row-locks it until the
+surrounding transaction commits. Callers allocate inside the same
+transaction that inserts the invoices, so a rolled-back insert also rolls
+back its numbers and the sequence stays gapless. Allocate as late as
+possible in that transaction to keep the lock window short, and allocate
+bulk creations as one block so they take the lock once.
+"""
+from django.db import transaction
+from django.db.models import BigIntegerField, F, Max
+from django.db.models.functions import Cast
+from .models import Invoice, InvoiceNumberSequence
+
+DEFAULT_FIRST_NUMBER = 1001
+
+
+def allocate_invoice_numbers(organization_id, count=1):
+    """
+    Reserve a block of consecutive invoice numbers for an organization
+
+    Args:
+        organization_id: Organization ID
+        count: Number of invoice numbers to reserve
+
+    Returns:
+        list: Formatted invoice numbers, in order
+    """
+    if count < 1:
+        return []
+
+    with transaction.atomic():
+        ensure_invoice_number_sequence(organization_id)
+
+        # The UPDATE takes the row lock; the read below sees our own write
+        InvoiceNumberSequence.objects.filter(
+            organization_id=organization_id
+        ).update(next_number=F('next_number') + count)
+        sequence = InvoiceNumberSequence.objects.get(organization_id=organization_id)
+
+    first = sequence.next_number - count
+    return [sequence.format_number(number) for number in range(first, sequence.next_number)]
+
+
+def ensure_invoice_number_sequence(organization_id):
+    """Get the organization's sequence, creating it on first use"""
+    sequence = InvoiceNumberSequence.objects.filter(organization_id=organization_id).first()
+    if sequence:
+        return sequence
+
+    # Continue after the highest numeric invoice number already issued
+    highest = Invoice.objects.filter(
+        organization_id=organization_id,
+        invoice_number__regex=r'^[0-9]+$'
+    ).annotate(
+        number=Cast('invoice_number', BigIntegerField())
+    ).aggregate(highest=Max('number'))['highest']
+
+    sequence, _ = InvoiceNumberSequence.objects.get_or_create(
+        organization_id=organization_id,
+        defaults={'next_number': highest + 1 if highest else DEFAULT_FIRST_NUMBER}
+    )
+    return sequence
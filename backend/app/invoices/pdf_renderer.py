@@ -0,0 +1,194 @@
+"""
+PDF rendering for invoices
+
+Rendered PDFs are stored under a hash of everything that appears on the page,
+so previews and re-sends of an unchanged invoice are read from storage
+instead of being rendered again.
+"""
+import hashlib
+import io
+import json
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.units import inch
+from reportlab.pdfgen import canvas
+
+# Bump when the layout changes so previously cached PDFs are not reused
+RENDERER_VERSION = 1
+
+PAGE_WIDTH, PAGE_HEIGHT = letter
+MARGIN = 0.75 * inch
+LINE_HEIGHT = 14
+
+
+def invoice_content_hash(invoice):
+    """
+    Hash the invoice and line-item state that ends up on the PDF
+
+    Args:
+        invoice: Invoice object (line_items may be prefetched)
+
+    Returns:
+        str: SHA-256 hex digest
+    """
+    customer = invoice.customer
+    organization = invoice.organization
+
+    state = {
+        'renderer_version': RENDERER_VERSION,
+        'invoice': [
+            str(invoice.id), invoice.invoice_number, invoice.status,
+            invoice.issue_date, invoice.due_date, invoice.payment_terms,
+            invoice.subtotal, invoice.tax_rate, invoice.tax_amount,
+            invoice.discount_amount, invoice.total_amount, invoice.amount_paid,
+            invoice.notes, invoice.footer_text, invoice.template_id,
+        ],
+        'customer': [customer.name, customer.email, customer.company, customer.billing_address],
+        'organization': [organization.name, organization.currency],
+        'line_items': [
+            [item.description, item.quantity, item.unit_price, item.amount, item.sort_order]
+            for item in invoice.line_items.all()
+        ],
+    }
+
+    encoded = json.dumps(state, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def invoice_pdf_path(invoice, content_hash=None):
+    """Storage path of the cached PDF for the invoice's current state"""
+    content_hash = content_hash or invoice_content_hash(invoice)
+    return f"{settings.INVOICE_PDF_STORAGE_PREFIX}/{invoice.organization_id}/{content_hash}.pdf"
+
+
+def get_invoice_pdf(invoice):
+    """
+    Get the PDF for an invoice, rendering it only on a cache miss
+
+    Args:
+        invoice: Invoice object
+
+    Returns:
+        tuple: (storage path, PDF bytes)
+    """
+    path = invoice_pdf_path(invoice)
+
+    if default_storage.exists(path):
+        with default_storage.open(path, 'rb') as cached:
+            return path, cached.read()
+
+    pdf = render_invoice_pdf(invoice)
+    if not default_storage.exists(path):
+        default_storage.save(path, ContentFile(pdf))
+
+    return path, pdf
+
+
+def render_invoice_pdf(invoice):
+    """
+    Render an invoice to PDF
+
+    Args:
+        invoice: Invoice object
+
+    Returns:
+        bytes: PDF document
+    """
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=letter)
+    pdf.setTitle(f"Invoice {invoice.invoice_number}")
+
+    currency = invoice.organization.currency
+    customer = invoice.customer
+
+    # Header
+    y = PAGE_HEIGHT - MARGIN
+    pdf.setFont('Helvetica-Bold', 18)
+    pdf.drawString(MARGIN, y, invoice.organization.name)
+    pdf.drawRightString(PAGE_WIDTH - MARGIN, y, 'INVOICE')
+
+    y -= 2 * LINE_HEIGHT
+    pdf.setFont('Helvetica', 10)
+    for label, value in [
+        ('Invoice Number', invoice.invoice_number),
+        ('Issue Date', invoice.issue_date),
+        ('Due Date', invoice.due_date),
+        ('Terms', invoice.payment_terms),
+    ]:
+        pdf.drawRightString(PAGE_WIDTH - MARGIN, y, f"{label}: {value}")
+        y -= LINE_HEIGHT
+
+    # Bill to
+    y -= LINE_HEIGHT
+    pdf.setFont('Helvetica-Bold', 10)
+    pdf.drawString(MARGIN, y, 'Bill To')
+    pdf.setFont('Helvetica', 10)
+    address = customer.billing_address or {}
+    bill_to = [
+        customer.name,
+        customer.company,
+        address.get('street'),
+        ', '.join(filter(None, [address.get('city'), address.get('state'), address.get('zip')])),
+        address.get('country'),
+        customer.email,
+    ]
+    for line in filter(None, bill_to):
+        y -= LINE_HEIGHT
+        pdf.drawString(MARGIN, y, str(line))
+
+    # Line items
+    y -= 2 * LINE_HEIGHT
+    y = _draw_line_item_header(pdf, y)
+    for item in invoice.line_items.all():
+        if y < MARGIN + 6 * LINE_HEIGHT:
+            pdf.showPage()
+            pdf.setFont('Helvetica', 10)
+            y = _draw_line_item_header(pdf, PAGE_HEIGHT - MARGIN)
+        pdf.drawString(MARGIN, y, item.description[:60])
+        pdf.drawRightString(PAGE_WIDTH - MARGIN - 3.2 * inch, y, f"{item.quantity}")
+        pdf.drawRightString(PAGE_WIDTH - MARGIN - 1.6 * inch, y, f"{item.unit_price:,.2f}")
+        pdf.drawRightString(PAGE_WIDTH - MARGIN, y, f"{item.amount:,.2f}")
+        y -= LINE_HEIGHT
+
+    # Totals
+    y -= LINE_HEIGHT
+    for label, value in [
+        ('Subtotal', invoice.subtotal),
+        (f'Tax ({invoice.tax_rate}%)', invoice.tax_amount),
+        ('Discount', -invoice.discount_amount),
+        ('Total', invoice.total_amount),
+        ('Paid', invoice.amount_paid),
+        ('Amount Due', invoice.amount_remaining()),
+    ]:
+        pdf.setFont('Helvetica-Bold' if label in ('Total', 'Amount Due') else 'Helvetica', 10)
+        pdf.drawRightString(PAGE_WIDTH - MARGIN - 1.6 * inch, y, label)
+        pdf.drawRightString(PAGE_WIDTH - MARGIN, y, f"{value:,.2f} {currency}")
+        y -= LINE_HEIGHT
+
+    # Notes and footer
+    pdf.setFont('Helvetica', 9)
+    if invoice.notes:
+        y -= LINE_HEIGHT
+        for line in invoice.notes.splitlines():
+            pdf.drawString(MARGIN, y, line[:100])
+            y -= LINE_HEIGHT
+    if invoice.footer_text:
+        pdf.drawCentredString(PAGE_WIDTH / 2, MARGIN / 2, invoice.footer_text[:120])
+
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def _draw_line_item_header(pdf, y):
+    """Draw the line-item column headings and return the next baseline"""
+    pdf.setFont('Helvetica-Bold', 10)
+    pdf.drawString(MARGIN, y, 'Description')
+    pdf.drawRightString(PAGE_WIDTH - MARGIN - 3.2 * inch, y, 'Qty')
+    pdf.drawRightString(PAGE_WIDTH - MARGIN - 1.6 * inch, y, 'Unit Price')
+    pdf.drawRightString(PAGE_WIDTH - MARGIN, y, 'Amount')
+    pdf.line(MARGIN, y - 4, PAGE_WIDTH - MARGIN, y - 4)
+    pdf.setFont('Helvetica', 10)
+    return y - 1.5 * LINE_HEIGHT
@@ -2,17 +2,28 @@
 Serializers for Invoice Management
 """
 from rest_framework import serializers
-from decimal import Decimal
+from decimal import Decimal, ROUND_HALF_UP
+from django.conf import settings
+from django.db import transaction
 from .models import (
     Customer, Invoice, InvoiceLineItem, Payment,
-    InvoiceCommunication, PaymentPrediction, ReminderSchedule
+    InvoiceCommunication, PaymentPrediction, ReminderSchedule,
+    InvoiceNumberSequence, RecurringInvoice
 )
+from .numbering import allocate_invoice_numbers
+from .bulk import bulk_create_invoices
+from .balances import invoice_contribution, record_invoice_change
+
+# Line item columns written when reconciling an invoice update
+LINE_ITEM_FIELDS = ['description', 'quantity', 'unit_price', 'amount', 'sort_order']
+
+CENTS = Decimal('0.01')
 
 
 class CustomerSerializer(serializers.ModelSerializer):
     """Customer serializer"""
     invoice_count = serializers.SerializerMethodField()
-    outstanding_balance = serializers.SerializerMethodField()
+    outstanding_balance = serializers.FloatField(read_only=True)
     
     class Meta:
         model = Customer
@@ -28,21 +39,29 @@ class CustomerSerializer(serializers.ModelSerializer):
                             'total_invoiced', 'total_paid', 'created_at', 'updated_at']
     
     def get_invoice_count(self, obj):
+        # Annotated by CustomerViewSet for lists
+        if hasattr(obj, 'invoice_count'):
+            return obj.invoice_count
         return obj.invoices.count()
     
-    def get_outstanding_balance(self, obj):
-        unpaid_invoices = obj.invoices.exclude(status__in=['paid', 'cancelled'])
-        total = sum(invoice.amount_remaining() for invoice in unpaid_invoices)
-        return float(total)
+    def update(self, instance, validated_data):
+        # Balance counters are maintained with F() updates, so only write the
+        # edited columns back instead of the whole (possibly stale) row
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=[*validated_data, 'updated_at'])
+        return instance
 
 
 class InvoiceLineItemSerializer(serializers.ModelSerializer):
     """Line item serializer"""
+    # Writable so invoice updates can match incoming items to existing rows
+    id = serializers.UUIDField(required=False)
     
     class Meta:
         model = InvoiceLineItem
         fields = ['id', 'description', 'quantity', 'unit_price', 'amount', 'sort_order']
-        read_only_fields = ['id']
+        read_only_fields = ['amount']  # Calculated in validate()
     
     def validate(self, data):
         """Calculate amount from quantity and unit_price"""
@@ -150,42 +169,216 @@ class InvoiceSerializer(serializers.ModelSerializer):
         """Create invoice with line items"""
         line_items_data = validated_data.pop('line_items', [])
         
-        # Generate invoice number if not provided
-        if 'invoice_number' not in validated_data or not validated_data['invoice_number']:
-            org = validated_data['organization']
-            last_invoice = Invoice.objects.filter(organization=org).order_by('-created_at').first()
-            if last_invoice and last_invoice.invoice_number.isdigit():
-                next_number = int(last_invoice.invoice_number) + 1
-            else:
-                next_number = 1001
-            validated_data['invoice_number'] = str(next_number)
-        
-        invoice = Invoice.objects.create(**validated_data)
-        
-        # Create line items
-        for item_data in line_items_data:
-            InvoiceLineItem.objects.create(invoice=invoice, **item_data)
+        with transaction.atomic():
+            # Generate invoice number if not provided (same transaction as
+            # the insert, so a failed create doesn't leave a gap)
+            if not validated_data.get('invoice_number'):
+                org_id = validated_data.get('organization_id') or validated_data['organization'].id
+                validated_data['invoice_number'] = allocate_invoice_numbers(org_id)[0]
+            
+            invoice = Invoice.objects.create(**validated_data)
+            
+            # Create line items
+            InvoiceLineItem.objects.bulk_create([
+                InvoiceLineItem(invoice=invoice, **{k: v for k, v in item_data.items() if k != 'id'})
+                for item_data in line_items_data
+            ])
+            
+            record_invoice_change(invoice)
         
         return invoice
     
     def update(self, instance, validated_data):
-        """Update invoice and line items"""
+        """Update invoice and reconcile line items"""
         line_items_data = validated_data.pop('line_items', None)
         
-        # Update invoice fields
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-        
-        # Update line items if provided
-        if line_items_data is not None:
-            # Delete existing line items
-            instance.line_items.all().delete()
-            # Create new line items
-            for item_data in line_items_data:
-                InvoiceLineItem.objects.create(invoice=instance, **item_data)
+        with transaction.atomic():
+            before_customer_id = instance.customer_id
+            before = invoice_contribution(instance)
+            
+            # Update invoice fields
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            
+            # Update line items if provided, then derive totals from them
+            if line_items_data is not None:
+                line_items = self._reconcile_line_items(instance, line_items_data)
+                self._recalculate_totals(instance, line_items)
+            
+            instance.save()
+            record_invoice_change(instance, before_customer_id, before)
         
         return instance
+    
+    def _reconcile_line_items(self, instance, line_items_data):
+        """
+        Apply the incoming line items as a diff against the stored ones
+        
+        Items are matched by ID: matched rows that changed are written with
+        one bulk_update, items without a known ID with one bulk_create, and
+        stored rows missing from the request with one delete.
+        
+        Returns:
+            list: The invoice's line items after reconciliation
+        """
+        existing = {item.id: item for item in instance.line_items.all()}
+        
+        line_items = []
+        to_create = []
+        to_update = []
+        
+        for item_data in line_items_data:
+            item_data = dict(item_data)
+            item = existing.pop(item_data.pop('id', None), None)
+            
+            if item is None:
+                item = InvoiceLineItem(invoice=instance, **item_data)
+                item.amount = (item.quantity * item.unit_price).quantize(CENTS, ROUND_HALF_UP)
+                to_create.append(item)
+            else:
+                stored = [getattr(item, field) for field in LINE_ITEM_FIELDS]
+                for attr, value in item_data.items():
+                    setattr(item, attr, value)
+                item.amount = (item.quantity * item.unit_price).quantize(CENTS, ROUND_HALF_UP)
+                if [getattr(item, field) for field in LINE_ITEM_FIELDS] != stored:
+                    to_update.append(item)
+            
+            line_items.append(item)
+        
+        if existing:
+            InvoiceLineItem.objects.filter(invoice=instance, id__in=existing.keys()).delete()
+        if to_update:
+            InvoiceLineItem.objects.bulk_update(to_update, LINE_ITEM_FIELDS)
+        if to_create:
+            InvoiceLineItem.objects.bulk_create(to_create)
+        
+        return line_items
+    
+    def _recalculate_totals(self, instance, line_items):
+        """Recompute invoice totals from its line items in one pass"""
+        instance.subtotal = sum((item.amount for item in line_items), Decimal('0.00'))
+        instance.tax_amount = (instance.subtotal * (instance.tax_rate / Decimal('100'))).quantize(CENTS, ROUND_HALF_UP)
+        instance.total_amount = instance.subtotal + instance.tax_amount - instance.discount_amount
+
+
+class BulkInvoiceItemSerializer(serializers.ModelSerializer):
+    """One invoice in a bulk create request"""
+    customer = serializers.UUIDField()
+    line_items = InvoiceLineItemSerializer(many=True, required=False)
+    
+    class Meta:
+        model = Invoice
+        fields = [
+            'invoice_number', 'customer', 'issue_date', 'due_date',
+            'subtotal', 'tax_rate', 'tax_amount', 'discount_amount', 'total_amount',
+            'status', 'payment_terms', 'notes', 'footer_text', 'template_id',
+            'line_items'
+        ]
+        extra_kwargs = {
+            'invoice_number': {'required': False, 'allow_blank': True},
+        }
+    
+    def validate(self, data):
+        """Calculate totals"""
+        if 'subtotal' in data and 'tax_rate' in data:
+            data['tax_amount'] = data['subtotal'] * (data['tax_rate'] / Decimal('100'))
+        
+        if all(k in data for k in ['subtotal', 'tax_amount', 'discount_amount']):
+            data['total_amount'] = data['subtotal'] + data['tax_amount'] - data['discount_amount']
+        
+        return data
+
+
+class BulkInvoiceCreateSerializer(serializers.Serializer):
+    """
+    Bulk invoice creation
+    Customers and explicit invoice numbers are checked with one query each;
+    the invoices and line items are written with bulk inserts.
+    """
+    invoices = BulkInvoiceItemSerializer(
+        many=True,
+        allow_empty=False,
+        max_length=settings.INVOICE_BULK_MAX_INVOICES
+    )
+    
+    def validate_invoices(self, invoices):
+        org_id = self.context['org_id']
+        
+        customer_ids = {invoice['customer'] for invoice in invoices}
+        found = set(
+            Customer.objects.filter(
+                organization_id=org_id, id__in=customer_ids
+            ).values_list('id', flat=True)
+        )
+        missing = customer_ids - found
+        if missing:
+            raise serializers.ValidationError(
+                f"Unknown customers: {', '.join(sorted(str(customer_id) for customer_id in missing))}"
+            )
+        
+        numbers = [invoice['invoice_number'] for invoice in invoices if invoice.get('invoice_number')]
+        if len(numbers) != len(set(numbers)):
+            raise serializers.ValidationError("Invoice numbers must be unique within the request")
+        taken = list(
+            Invoice.objects.filter(
+                organization_id=org_id, invoice_number__in=numbers
+            ).values_list('invoice_number', flat=True)
+        )
+        if taken:
+            raise serializers.ValidationError(
+                f"Invoice numbers already in use: {', '.join(sorted(taken))}"
+            )
+        
+        return invoices
+    
+    def create(self, validated_data):
+        invoices_data = []
+        for invoice_data in validated_data['invoices']:
+            invoice_data = dict(invoice_data)
+            invoice_data['customer_id'] = invoice_data.pop('customer')
+            invoices_data.append(invoice_data)
+        
+        return bulk_create_invoices(
+            self.context['org_id'],
+            invoices_data,
+            created_by=self.context['request'].user
+        )
+
+
+class RecurringInvoiceLineItemSerializer(serializers.Serializer):
+    """Line item stored on a recurring invoice template"""
+    description = serializers.CharField()
+    quantity = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
+    unit_price = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=Decimal('0.00'))
+
+
+class RecurringInvoiceSerializer(serializers.ModelSerializer):
+    """Recurring invoice template serializer"""
+    customer_name = serializers.CharField(source='customer.name', read_only=True)
+    line_items = RecurringInvoiceLineItemSerializer(many=True, allow_empty=False)
+    
+    class Meta:
+        model = RecurringInvoice
+        fields = [
+            'id', 'customer', 'customer_name', 'frequency', 'next_issue_date',
+            'end_date', 'due_days', 'line_items', 'tax_rate', 'discount_amount',
+            'payment_terms', 'notes', 'footer_text', 'template_id',
+            'auto_send', 'is_active', 'last_generated_at', 'invoices_generated',
+            'created_at', 'updated_at'
+        ]
+        read_only_fields = ['id', 'last_generated_at', 'invoices_generated',
+                            'created_at', 'updated_at']
+    
+    def validate_line_items(self, line_items):
+        # Stored as JSON, so keep decimals as strings
+        return [
+            {
+                'description': item['description'],
+                'quantity': str(item['quantity']),
+                'unit_price': str(item['unit_price']),
+            }
+            for item in line_items
+        ]
 
 
 class InvoiceListSerializer(serializers.ModelSerializer):
@@ -233,6 +426,22 @@ class ReminderScheduleSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
 
 
+class InvoiceNumberSequenceSerializer(serializers.ModelSerializer):
+    """Invoice numbering settings serializer"""
+    next_invoice_number = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = InvoiceNumberSequence
+        fields = [
+            'id', 'prefix', 'padding', 'next_number', 'next_invoice_number',
+            'created_at', 'updated_at'
+        ]
+        read_only_fields = ['id', 'next_number', 'created_at', 'updated_at']
+    
+    def get_next_invoice_number(self, obj):
+        return obj.format_number(obj.next_number)
+
+
 class ARAgingReportSerializer(serializers.Serializer):
     """AR Aging Report serializer"""
     current = serializers.DecimalField(max_digits=12, decimal_places=2)
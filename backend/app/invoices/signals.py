@@ -0,0 +1,18 @@
+"""
+Signal handlers for Invoice Management
+
+Invoices the nightly transition marks overdue are handed to a task that
+sends each organization owner one digest.
+"""
+from django.dispatch import receiver
+from app.core.transitions import status_transitioned
+from .models import Invoice
+
+
+@receiver(status_transitioned, sender=Invoice)
+def invoices_overdue(sender, transition, ids, **kwargs):
+    if transition != 'invoice_overdue':
+        return
+
+    from .tasks import notify_overdue_invoices
+    notify_overdue_invoices.delay([str(invoice_id) for invoice_id in ids])
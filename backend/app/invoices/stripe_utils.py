@@ -1,13 +1,85 @@
 """
 Stripe integration utilities for invoice payments
 """
+import requests
 import stripe
+from datetime import timedelta
 from decimal import Decimal
 from django.conf import settings
-from .models import Payment, Invoice
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Customer, Payment, Invoice, StripeWebhookEvent
 
 # Initialize Stripe
 stripe.api_key = settings.STRIPE_SECRET_KEY if hasattr(settings, 'STRIPE_SECRET_KEY') else None
+stripe.api_base = settings.STRIPE_API_BASE
+stripe.max_network_retries = 2
+
+
+def build_http_client():
+    """
+    Build the HTTP client shared by every Stripe call in this process
+    
+    One pooled requests.Session keeps TLS connections to Stripe alive
+    between calls, so the public pay page doesn't pay a fresh handshake
+    on every payment intent.
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=settings.STRIPE_HTTP_POOL_SIZE
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return stripe.http_client.RequestsClient(
+        timeout=settings.STRIPE_HTTP_TIMEOUT,
+        session=session
+    )
+
+
+stripe.default_http_client = build_http_client()
+
+
+def get_or_create_stripe_customer(customer):
+    """
+    Get the Stripe customer ID for a Customer, creating it lazily
+    
+    The ID is persisted on the Customer, so only the first payment for a
+    customer talks to Stripe here; every later payment is a local read.
+    
+    Args:
+        customer: Customer object
+    
+    Returns:
+        str: Stripe customer ID
+    """
+    if customer.stripe_customer_id:
+        return customer.stripe_customer_id
+    
+    # Customers paid before the ID was persisted already exist in Stripe
+    existing = stripe.Customer.list(email=customer.email, limit=1)
+    if existing.data:
+        stripe_customer_id = existing.data[0].id
+    else:
+        stripe_customer_id = stripe.Customer.create(
+            email=customer.email,
+            name=customer.name,
+            metadata={
+                'customer_id': str(customer.id),
+                'organization_id': str(customer.organization_id)
+            },
+            # Concurrent first payments resolve to the same Stripe customer
+            idempotency_key=f'customer-{customer.id}',
+        ).id
+    
+    Customer.objects.filter(
+        pk=customer.pk,
+        stripe_customer_id__isnull=True
+    ).update(stripe_customer_id=stripe_customer_id)
+    customer.stripe_customer_id = stripe_customer_id
+    
+    return stripe_customer_id
 
 
 def create_payment_intent(invoice, customer_email=None):
@@ -28,26 +100,8 @@ def create_payment_intent(invoice, customer_email=None):
         # Convert amount to cents (Stripe uses smallest currency unit)
         amount_cents = int(invoice.amount_remaining() * 100)
         
-        # Create or get Stripe customer
-        stripe_customer = None
-        if customer_email or invoice.customer.email:
-            email = customer_email or invoice.customer.email
-            
-            # Search for existing customer
-            customers = stripe.Customer.list(email=email, limit=1)
-            if customers.data:
-                stripe_customer = customers.data[0].id
-            else:
-                # Create new customer
-                customer = stripe.Customer.create(
-                    email=email,
-                    name=invoice.customer.name,
-                    metadata={
-                        'customer_id': str(invoice.customer.id),
-                        'organization_id': str(invoice.organization.id)
-                    }
-                )
-                stripe_customer = customer.id
+        # Stripe customer ID is cached on our Customer after first use
+        stripe_customer = get_or_create_stripe_customer(invoice.customer)
         
         # Create Payment Intent
         intent = stripe.PaymentIntent.create(
@@ -142,17 +196,12 @@ def refund_payment(payment, amount=None):
             pass
         else:
             # Full refund
-            payment.status = 'refunded'
-            payment.save()
-            
-            # Update invoice
-            invoice = payment.invoice
-            invoice.amount_paid -= refund_amount
-            if invoice.amount_paid == 0:
-                invoice.status = 'sent'  # or 'overdue' based on date
-            elif invoice.amount_paid < invoice.total_amount:
-                invoice.status = 'partial'
-            invoice.save()
+            with transaction.atomic():
+                payment.status = 'refunded'
+                payment.save()
+                
+                # Update invoice and customer balances under a row lock
+                payment.invoice.apply_payment(-refund_amount)
         
         return {
             'refund_id': refund.id,
@@ -193,8 +242,22 @@ def handle_webhook_event(event):
 
 def handle_payment_success(payment_intent):
     """Handle successful payment"""
-    try:
-        payment = Payment.objects.get(stripe_payment_intent_id=payment_intent['id'])
+    with transaction.atomic():
+        try:
+            payment = Payment.objects.select_for_update().get(
+                stripe_payment_intent_id=payment_intent['id']
+            )
+        except Payment.DoesNotExist:
+            return {'status': 'error', 'message': 'Payment not found'}
+        
+        # A payment only counts towards the invoice once, however many
+        # times Stripe delivers the success for it
+        if payment.status == 'succeeded':
+            return {
+                'status': 'duplicate',
+                'payment_id': str(payment.id),
+                'invoice_id': str(payment.invoice_id)
+            }
         
         # Update payment
         payment.status = 'succeeded'
@@ -203,32 +266,21 @@ def handle_payment_success(payment_intent):
             payment.stripe_charge_id = payment_intent['charges']['data'][0]['id']
         payment.save()
         
-        # Update invoice
+        # Update invoice under a row lock
         invoice = payment.invoice
-        invoice.amount_paid += payment.amount
-        
-        if invoice.amount_paid >= invoice.total_amount:
-            invoice.status = 'paid'
-            from django.utils import timezone
-            invoice.paid_at = timezone.now()
-        elif invoice.amount_paid > 0:
-            invoice.status = 'partial'
+        invoice.apply_payment(payment.amount)
         
-        invoice.save()
-        
-        # Trigger thank you email task
+        # Trigger thank you email task once the payment is committed
         from .tasks import send_thank_you_email
-        send_thank_you_email.delay(str(invoice.id))
-        
-        return {
-            'status': 'success',
-            'payment_id': str(payment.id),
-            'invoice_id': str(invoice.id),
-            'invoice_status': invoice.status
-        }
+        invoice_id = str(invoice.id)
+        transaction.on_commit(lambda: send_thank_you_email.delay(invoice_id))
     
-    except Payment.DoesNotExist:
-        return {'status': 'error', 'message': 'Payment not found'}
+    return {
+        'status': 'success',
+        'payment_id': str(payment.id),
+        'invoice_id': str(invoice.id),
+        'invoice_status': invoice.status
+    }
 
 
 def handle_payment_failed(payment_intent):
@@ -272,6 +324,98 @@ def handle_refund(charge):
     return {'status': 'refund_processed', 'charge_id': charge['id']}
 
 
+def record_webhook_event(event):
+    """
+    Insert a verified Stripe event into the webhook ledger
+    
+    The unique stripe_event_id makes concurrent or retried deliveries of the
+    same event collapse onto one ledger row.
+    
+    Args:
+        event: Stripe Event object (or equivalent dict)
+    
+    Returns:
+        tuple: (StripeWebhookEvent, needs_processing)
+    """
+    ledger_entry, created = StripeWebhookEvent.objects.get_or_create(
+        stripe_event_id=event['id'],
+        defaults={
+            'event_type': event['type'],
+            'payload': event.to_dict_recursive() if hasattr(event, 'to_dict_recursive') else event,
+        }
+    )
+    
+    # A delivery of a known event (Stripe retrying after a non-2xx, or a manual
+    # resend) queues it again if it failed or has sat unprocessed too long,
+    # e.g. because queueing it the first time failed
+    stale = ledger_entry.received_at < timezone.now() - timedelta(seconds=settings.STRIPE_WEBHOOK_REQUEUE_AFTER)
+    needs_processing = created or ledger_entry.status == 'failed' or (ledger_entry.status == 'received' and stale)
+    return ledger_entry, needs_processing
+
+
+def stale_webhook_event_ids(now=None):
+    """
+    Ledger events to queue again: never processed, or failed after their
+    worker retries, STRIPE_WEBHOOK_REQUEUE_AFTER seconds after arriving
+    
+    Events that failed STRIPE_WEBHOOK_MAX_ATTEMPTS times are left for a person.
+    
+    Returns:
+        list: Stripe event IDs, oldest first
+    """
+    cutoff = (now or timezone.now()) - timedelta(seconds=settings.STRIPE_WEBHOOK_REQUEUE_AFTER)
+    return list(
+        StripeWebhookEvent.objects.filter(
+            status__in=('received', 'failed'),
+            received_at__lt=cutoff,
+            attempts__lt=settings.STRIPE_WEBHOOK_MAX_ATTEMPTS
+        ).order_by('received_at').values_list('stripe_event_id', flat=True)
+    )
+
+
+def process_webhook_event(stripe_event_id):
+    """
+    Process a ledgered webhook event exactly once
+    
+    The ledger row is locked for the duration of processing, so a second
+    worker picking up the same event skips it instead of double-applying.
+    
+    Args:
+        stripe_event_id: Stripe event ID of a StripeWebhookEvent row
+    
+    Returns:
+        dict: Processing result
+    """
+    try:
+        with transaction.atomic():
+            ledger_entry = StripeWebhookEvent.objects.select_for_update(
+                skip_locked=True
+            ).filter(stripe_event_id=stripe_event_id).first()
+            
+            if ledger_entry is None:
+                return {'status': 'skipped', 'message': 'Event missing or being processed'}
+            if ledger_entry.status == 'processed':
+                return {'status': 'duplicate', 'event_id': stripe_event_id}
+            
+            result = handle_webhook_event(ledger_entry.payload)
+            
+            ledger_entry.status = 'processed'
+            ledger_entry.result = result
+            ledger_entry.error = ''
+            ledger_entry.attempts += 1
+            ledger_entry.processed_at = timezone.now()
+            ledger_entry.save()
+            return result
+    
+    except Exception as e:
+        StripeWebhookEvent.objects.filter(stripe_event_id=stripe_event_id).update(
+            status='failed',
+            error=str(e),
+            attempts=F('attempts') + 1
+        )
+        raise
+
+
 def verify_webhook_signature(payload, signature, webhook_secret):
     """
     Verify Stripe webhook signature
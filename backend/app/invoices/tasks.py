@@ -1,11 +1,13 @@
 """
 Celery tasks for Invoice Management
 """
-from celery import shared_task
+from celery import shared_task, group
+from django.conf import settings
+from django.core.mail import EmailMessage
 from django.utils import timezone
-from datetime import timedelta
+from datetime import date, timedelta
 from decimal import Decimal
-from .models import Invoice, InvoiceCommunication, ReminderSchedule, Customer, Payment
+from .models import Invoice, InvoiceCommunication, ReminderSchedule
 
 
 @shared_task
@@ -125,62 +127,60 @@ def update_invoice_statuses():
     Daily task to update invoice statuses (mark as overdue)
     Runs at 1 AM daily
     """
-    today = timezone.now().date()
-    
-    # Mark overdue invoices
-    overdue_invoices = Invoice.objects.filter(
-        status__in=['sent', 'viewed', 'partial'],
-        due_date__lt=today
-    )
+    from app.core.transitions import run_transitions
+    from .transitions import INVOICE_TRANSITIONS
     
-    count = overdue_invoices.update(status='overdue')
+    counts = run_transitions(INVOICE_TRANSITIONS)
+    count = counts['invoice_overdue']
     
     return f"Marked {count} invoices as overdue"
 
 
+@shared_task
+def notify_overdue_invoices(invoice_ids):
+    """
+    Email each organization owner one digest of their newly overdue invoices
+    Customers hear about them from the organization's reminder schedule
+    """
+    from itertools import groupby
+    from django.core.mail import send_mass_mail
+    
+    invoices = Invoice.objects.filter(id__in=invoice_ids).select_related(
+        'customer', 'organization__owner'
+    ).order_by('organization_id', 'due_date')
+    
+    messages = []
+    for _, organization_invoices in groupby(invoices, key=lambda invoice: invoice.organization_id):
+        organization_invoices = list(organization_invoices)
+        owner = organization_invoices[0].organization.owner
+        lines = [
+            f"- {invoice.invoice_number} to {invoice.customer.name}: "
+            f"${invoice.total_amount - invoice.amount_paid} was due {invoice.due_date}"
+            for invoice in organization_invoices
+        ]
+        messages.append((
+            f"{len(organization_invoices)} invoices are now overdue",
+            f"Hi {owner.name},\n\nThese invoices passed their due date unpaid:\n\n" + "\n".join(lines),
+            settings.DEFAULT_FROM_EMAIL,
+            [owner.email]
+        ))
+    
+    send_mass_mail(messages, fail_silently=False)
+    
+    return f"Sent {len(messages)} overdue digests for {len(invoice_ids)} invoices"
+
+
 @shared_task
 def update_customer_payment_metrics():
     """
     Weekly task to update customer payment reliability scores
     Runs on Sunday at 3 AM
     """
-    customers = Customer.objects.all()
+    from .analytics import refresh_customer_payment_metrics
     
-    for customer in customers:
-        # Get all paid invoices
-        paid_invoices = customer.invoices.filter(status='paid')
-        
-        if paid_invoices.exists():
-            # Calculate average days to pay
-            days_to_pay_list = []
-            on_time_count = 0
-            
-            for invoice in paid_invoices:
-                if invoice.paid_at and invoice.issue_date:
-                    days_to_pay = (invoice.paid_at.date() - invoice.issue_date).days
-                    days_to_pay_list.append(days_to_pay)
-                    
-                    # Check if paid on time (before or on due date)
-                    if invoice.paid_at.date() <= invoice.due_date:
-                        on_time_count += 1
-            
-            if days_to_pay_list:
-                avg_days = sum(days_to_pay_list) / len(days_to_pay_list)
-                customer.average_days_to_pay = int(avg_days)
-                
-                # Calculate reliability score (0-100)
-                # Based on: on-time payment rate (60%), average days to pay (40%)
-                on_time_rate = (on_time_count / len(days_to_pay_list)) * 100
-                
-                # Penalize for slow payment (beyond 30 days)
-                days_score = max(0, 100 - (avg_days - 30) * 2) if avg_days > 30 else 100
-                
-                reliability = (on_time_rate * 0.6) + (days_score * 0.4)
-                customer.payment_reliability_score = Decimal(str(round(reliability, 2)))
-                
-                customer.save()
+    count = refresh_customer_payment_metrics()
     
-    return f"Updated metrics for {customers.count()} customers"
+    return f"Updated metrics for {count} customers"
 
 
 @shared_task
@@ -251,10 +251,9 @@ def send_invoice_email(invoice_id):
     Send invoice email to customer
     """
     try:
-        invoice = Invoice.objects.get(id=invoice_id)
-        
-        # TODO: Integrate with email service
-        # This is a placeholder for actual email sending
+        invoice = Invoice.objects.select_related(
+            'customer', 'organization'
+        ).prefetch_related('line_items').get(id=invoice_id)
         
         subject = f"Invoice {invoice.invoice_number} from {invoice.organization.name}"
         payment_link = f"https://app.finpilot.com/pay/{invoice.payment_link_token}"
@@ -277,6 +276,19 @@ def send_invoice_email(invoice_id):
         {invoice.organization.name}
         """
         
+        # Re-sends of an unchanged invoice reuse the cached PDF
+        from .pdf_renderer import get_invoice_pdf
+        _, pdf = get_invoice_pdf(invoice)
+        
+        email = EmailMessage(
+            subject=subject,
+            body=message,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[invoice.customer.email]
+        )
+        email.attach(f"invoice-{invoice.invoice_number}.pdf", pdf, 'application/pdf')
+        email.send()
+        
         # Log the communication
         InvoiceCommunication.objects.create(
             invoice=invoice,
@@ -293,56 +305,100 @@ def send_invoice_email(invoice_id):
 
 
 @shared_task
-def process_stripe_webhook(event_data):
+def render_invoice_pdfs(invoice_ids):
     """
-    Process Stripe webhook events for payments
+    Render (or reuse cached) PDFs for a chunk of invoices
     """
-    event_type = event_data.get('type')
+    from .pdf_renderer import get_invoice_pdf
     
-    if event_type == 'payment_intent.succeeded':
-        payment_intent = event_data['data']['object']
-        payment_intent_id = payment_intent['id']
-        
-        try:
-            payment = Payment.objects.get(stripe_payment_intent_id=payment_intent_id)
-            payment.status = 'succeeded'
-            payment.save()
-            
-            # Update invoice
-            invoice = payment.invoice
-            invoice.amount_paid += payment.amount
-            
-            if invoice.amount_paid >= invoice.total_amount:
-                invoice.status = 'paid'
-                invoice.paid_at = timezone.now()
-            elif invoice.amount_paid > 0:
-                invoice.status = 'partial'
-            
-            invoice.save()
-            
-            # Send thank you email
-            send_thank_you_email.delay(invoice.id)
-            
-            return f"Payment processed for invoice {invoice.invoice_number}"
-        
-        except Payment.DoesNotExist:
-            return f"Payment not found for intent {payment_intent_id}"
+    invoices = Invoice.objects.filter(id__in=invoice_ids).select_related(
+        'customer', 'organization'
+    ).prefetch_related('line_items')
     
-    elif event_type == 'payment_intent.payment_failed':
-        payment_intent = event_data['data']['object']
-        payment_intent_id = payment_intent['id']
-        
-        try:
-            payment = Payment.objects.get(stripe_payment_intent_id=payment_intent_id)
-            payment.status = 'failed'
-            payment.save()
-            
-            return f"Payment failed for intent {payment_intent_id}"
-        
-        except Payment.DoesNotExist:
-            return f"Payment not found for intent {payment_intent_id}"
+    rendered = 0
+    for invoice in invoices:
+        get_invoice_pdf(invoice)
+        rendered += 1
+    
+    return rendered
+
+
+@shared_task
+def render_monthly_invoice_pdfs(org_id, year, month):
+    """
+    Render a month's invoices in parallel
+    Splits the month into chunks and fans them out across the worker pool
+    """
+    invoice_ids = [
+        str(invoice_id) for invoice_id in Invoice.objects.filter(
+            organization_id=org_id,
+            issue_date__year=year,
+            issue_date__month=month
+        ).values_list('id', flat=True)
+    ]
+    
+    chunk_size = settings.INVOICE_PDF_RENDER_CHUNK_SIZE
+    chunks = [invoice_ids[i:i + chunk_size] for i in range(0, len(invoice_ids), chunk_size)]
+    
+    if chunks:
+        group(render_invoice_pdfs.s(chunk) for chunk in chunks).apply_async()
+    
+    return f"Queued {len(invoice_ids)} invoices in {len(chunks)} render chunks"
+
+
+@shared_task
+def generate_recurring_invoices(run_date=None):
+    """
+    Issue this billing cycle's invoices for every due recurring template
+    Templates are processed in chunks of RECURRING_INVOICE_BATCH_SIZE, each
+    written with bulk inserts in its own transaction
+    """
+    from .recurring import generate_invoice_chunk
+    
+    run_date = date.fromisoformat(run_date) if run_date else timezone.now().date()
+    batch_size = settings.RECURRING_INVOICE_BATCH_SIZE
+    
+    templates_processed = 0
+    send_ids = []
+    while True:
+        processed, chunk_send_ids = generate_invoice_chunk(run_date, batch_size)
+        if not processed:
+            break
+        templates_processed += processed
+        send_ids.extend(chunk_send_ids)
+    
+    for invoice_id in send_ids:
+        send_invoice_email.delay(invoice_id)
+    
+    return f"Generated {templates_processed} recurring invoices ({len(send_ids)} sent)"
+
+
+@shared_task(bind=True, max_retries=5, default_retry_delay=30)
+def process_stripe_webhook(self, stripe_event_id):
+    """
+    Process a Stripe webhook event recorded in the webhook ledger
+    Enqueued by StripeWebhookView once the event is stored
+    """
+    from .stripe_utils import process_webhook_event
+    
+    try:
+        result = process_webhook_event(stripe_event_id)
+    except Exception as exc:
+        raise self.retry(exc=exc)
+    
+    return f"Processed webhook event {stripe_event_id}: {result.get('status')}"
+
+
+@shared_task
+def requeue_stale_webhook_events():
+    """Queue ledger events that were never processed or ran out of worker retries"""
+    from .stripe_utils import stale_webhook_event_ids
+    
+    event_ids = stale_webhook_event_ids()
+    for event_id in event_ids:
+        process_stripe_webhook.delay(event_id)
     
-    return f"Unhandled event type: {event_type}"
+    return f"Requeued {len(event_ids)} webhook events"
 
 
 @shared_task
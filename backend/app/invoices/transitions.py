@@ -0,0 +1,15 @@
+"""
+Nightly invoice status transitions
+"""
+from django.db.models import Q
+from app.core.transitions import Transition
+from .models import Invoice
+
+INVOICE_TRANSITIONS = [
+    Transition(
+        'invoice_overdue',
+        Invoice,
+        lambda now: Q(status__in=['sent', 'viewed', 'partial'], due_date__lt=now.date()),
+        lambda now: {'status': 'overdue', 'updated_at': now}
+    ),
+]
@@ -13,6 +13,8 @@ router.register(r'customers', views.CustomerViewSet, basename='customer')
 router.register(r'invoices', views.InvoiceViewSet, basename='invoice')
 router.register(r'ar-aging', views.ARAgingViewSet, basename='ar-aging')
 router.register(r'reminder-schedule', views.ReminderScheduleViewSet, basename='reminder-schedule')
+router.register(r'recurring-invoices', views.RecurringInvoiceViewSet, basename='recurring-invoice')
+router.register(r'invoice-numbering', views.InvoiceNumberSequenceViewSet, basename='invoice-numbering')
 
 # Nested route for payments under invoices
 app_name = 'invoices'
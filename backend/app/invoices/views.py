@@ -1,35 +1,47 @@
 """
 Invoice Management Views
 """
+import logging
 import secrets
 from datetime import timedelta
 from decimal import Decimal
 from django.utils import timezone
+from django.db import transaction
 from django.db.models import Q, Sum, Count, Avg
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.http import HttpResponse
-from rest_framework import viewsets, status, views
+from rest_framework import mixins, viewsets, status, views
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 
 from .models import (
     Customer, Invoice, Payment, InvoiceCommunication,
-    PaymentPrediction, ReminderSchedule
+    PaymentPrediction, ReminderSchedule, InvoiceNumberSequence, RecurringInvoice
+)
+from .numbering import ensure_invoice_number_sequence
+from .analytics import customer_payment_history
+from .balances import (
+    add_delta, adjust_customer_balances, invoice_contribution, record_invoice_change
 )
 from .serializers import (
     CustomerSerializer, InvoiceSerializer, InvoiceListSerializer,
     PaymentSerializer, InvoiceCommunicationSerializer,
     PaymentPredictionSerializer, ReminderScheduleSerializer,
-    ARAgingReportSerializer
+    InvoiceNumberSequenceSerializer, ARAgingReportSerializer,
+    BulkInvoiceCreateSerializer, RecurringInvoiceSerializer
 )
 from .stripe_utils import (
-    create_payment_intent, verify_webhook_signature, 
-    handle_webhook_event, refund_payment
+    create_payment_intent, verify_webhook_signature,
+    record_webhook_event, refund_payment
 )
+from .tasks import process_stripe_webhook, render_monthly_invoice_pdfs
+from .pdf_renderer import get_invoice_pdf
 from django.conf import settings
 
+logger = logging.getLogger(__name__)
+
 
 class CustomerViewSet(viewsets.ModelViewSet):
     """Customer CRUD operations"""
@@ -39,7 +51,10 @@ class CustomerViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         # Get organization from request context (set by middleware or view)
         org_id = self.kwargs.get('org_id')
-        return Customer.objects.filter(organization_id=org_id)
+        queryset = Customer.objects.filter(organization_id=org_id)
+        if self.action == 'list':
+            queryset = queryset.annotate(invoice_count=Count('invoices'))
+        return queryset
     
     def perform_create(self, serializer):
         org_id = self.kwargs.get('org_id')
@@ -50,32 +65,16 @@ class CustomerViewSet(viewsets.ModelViewSet):
         """Get customer payment history and analytics"""
         customer = self.get_object()
         
-        invoices = customer.invoices.all()
         payments = Payment.objects.filter(invoice__customer=customer, status='succeeded')
         
-        # Calculate metrics
-        total_invoices = invoices.count()
-        paid_invoices = invoices.filter(status='paid').count()
-        overdue_invoices = invoices.filter(status='overdue').count()
-        
-        # Payment timing analysis
-        paid_invoice_data = []
-        for invoice in invoices.filter(status='paid'):
-            if invoice.paid_at and invoice.issue_date:
-                days_to_pay = (invoice.paid_at.date() - invoice.issue_date).days
-                paid_invoice_data.append(days_to_pay)
-        
-        avg_days_to_pay = sum(paid_invoice_data) / len(paid_invoice_data) if paid_invoice_data else 0
+        # Metrics and monthly timing histogram from one grouped query
+        history = customer_payment_history(customer)
+        customer.invoice_count = history['metrics']['total_invoices']
         
         return Response({
             'customer': CustomerSerializer(customer).data,
-            'metrics': {
-                'total_invoices': total_invoices,
-                'paid_invoices': paid_invoices,
-                'overdue_invoices': overdue_invoices,
-                'average_days_to_pay': round(avg_days_to_pay, 1),
-                'on_time_payment_rate': (paid_invoices / total_invoices * 100) if total_invoices > 0 else 0
-            },
+            'metrics': history['metrics'],
+            'monthly_payment_timing': history['monthly_payment_timing'],
             'recent_payments': PaymentSerializer(payments[:10], many=True).data
         })
 
@@ -129,6 +128,31 @@ class InvoiceViewSet(viewsets.ModelViewSet):
             created_by=self.request.user
         )
     
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            adjust_customer_balances(add_delta(
+                {}, instance.customer_id, invoice_contribution(instance), sign=-1
+            ))
+            instance.delete()
+    
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request, org_id=None):
+        """Create many invoices in one request using bulk inserts"""
+        serializer = BulkInvoiceCreateSerializer(
+            data=request.data,
+            context={'request': request, 'org_id': org_id}
+        )
+        serializer.is_valid(raise_exception=True)
+        invoices = serializer.save()
+        
+        return Response({
+            'created': len(invoices),
+            'invoices': [
+                {'id': str(invoice.id), 'invoice_number': invoice.invoice_number}
+                for invoice in invoices
+            ]
+        }, status=status.HTTP_201_CREATED)
+    
     @action(detail=True, methods=['post'])
     def send(self, request, org_id=None, pk=None):
         """Send invoice to customer"""
@@ -198,10 +222,38 @@ class InvoiceViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['get'])
     def preview(self, request, org_id=None, pk=None):
-        """Generate invoice preview (PDF or HTML)"""
+        """Generate invoice PDF preview (served from cache when unchanged)"""
         invoice = self.get_object()
-        # TODO: Generate PDF preview
-        return Response(InvoiceSerializer(invoice).data)
+        _, pdf = get_invoice_pdf(invoice)
+        
+        response = HttpResponse(pdf, content_type='application/pdf')
+        response['Content-Disposition'] = f'inline; filename="invoice-{invoice.invoice_number}.pdf"'
+        return response
+    
+    @action(detail=False, methods=['post'])
+    def render_pdfs(self, request, org_id=None):
+        """Render PDFs for a whole month of invoices in the background"""
+        try:
+            year = int(request.data.get('year'))
+            month = int(request.data.get('month'))
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'year and month are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if not 1 <= month <= 12:
+            return Response(
+                {'error': 'month must be between 1 and 12'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        render_monthly_invoice_pdfs.delay(str(org_id), year, month)
+        
+        return Response(
+            {'message': f'Rendering invoices for {year}-{month:02d}'},
+            status=status.HTTP_202_ACCEPTED
+        )
     
     @action(detail=True, methods=['post'])
     def mark_viewed(self, request, org_id=None, pk=None):
@@ -221,8 +273,11 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         invoice = self.get_object()
         
         if invoice.status not in ['paid', 'cancelled']:
-            invoice.status = 'cancelled'
-            invoice.save()
+            with transaction.atomic():
+                before = invoice_contribution(invoice)
+                invoice.status = 'cancelled'
+                invoice.save()
+                record_invoice_change(invoice, invoice.customer_id, before)
             return Response({'message': 'Invoice cancelled successfully'})
         else:
             return Response(
@@ -249,21 +304,14 @@ class PaymentViewSet(viewsets.ModelViewSet):
         invoice_id = self.kwargs.get('invoice_id')
         invoice = Invoice.objects.get(id=invoice_id)
         
-        payment = serializer.save(invoice=invoice)
+        with transaction.atomic():
+            payment = serializer.save(invoice=invoice)
+            
+            # Update invoice amounts under a row lock
+            if payment.status == 'succeeded':
+                invoice.apply_payment(payment.amount)
         
-        # Update invoice amounts
         if payment.status == 'succeeded':
-            invoice.amount_paid += payment.amount
-            
-            # Update invoice status
-            if invoice.amount_paid >= invoice.total_amount:
-                invoice.status = 'paid'
-                invoice.paid_at = timezone.now()
-            elif invoice.amount_paid > 0:
-                invoice.status = 'partial'
-            
-            invoice.save()
-            
             # Send thank you communication
             InvoiceCommunication.objects.create(
                 invoice=invoice,
@@ -367,6 +415,67 @@ class ReminderScheduleViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
+class RecurringInvoiceViewSet(viewsets.ModelViewSet):
+    """Recurring invoice templates"""
+    permission_classes = [IsAuthenticated]
+    serializer_class = RecurringInvoiceSerializer
+    
+    def get_queryset(self):
+        org_id = self.kwargs.get('org_id')
+        queryset = RecurringInvoice.objects.filter(organization_id=org_id).select_related('customer')
+        
+        customer_id = self.request.query_params.get('customer')
+        if customer_id:
+            queryset = queryset.filter(customer_id=customer_id)
+        
+        return queryset
+    
+    def perform_create(self, serializer):
+        org_id = self.kwargs.get('org_id')
+        serializer.save(
+            organization_id=org_id,
+            created_by=self.request.user
+        )
+
+
+class InvoiceNumberSequenceViewSet(mixins.ListModelMixin, mixins.UpdateModelMixin, viewsets.GenericViewSet):
+    """
+    Invoice numbering settings (prefix and padding)
+    
+    Only list and update are exposed: the sequence is created on first use
+    and its counter is never written here.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = InvoiceNumberSequenceSerializer
+    
+    def get_queryset(self):
+        org_id = self.kwargs.get('org_id')
+        return InvoiceNumberSequence.objects.filter(organization_id=org_id)
+    
+    def get_object(self):
+        """Get or create the numbering sequence for organization"""
+        return ensure_invoice_number_sequence(self.kwargs.get('org_id'))
+    
+    def list(self, request, org_id=None):
+        """Get numbering settings (single object)"""
+        sequence = self.get_object()
+        serializer = self.get_serializer(sequence)
+        return Response(serializer.data)
+    
+    def update(self, request, org_id=None, pk=None, **kwargs):
+        """Update numbering settings"""
+        sequence = self.get_object()
+        serializer = self.get_serializer(sequence, data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        
+        # Only the settings columns: writing the whole row would put back a stale next_number
+        InvoiceNumberSequence.objects.filter(id=sequence.id).update(
+            updated_at=timezone.now(), **serializer.validated_data
+        )
+        sequence.refresh_from_db()
+        return Response(self.get_serializer(sequence).data)
+
+
 class PaymentIntentView(views.APIView):
     """Create Stripe Payment Intent for invoice payment"""
     permission_classes = [AllowAny]  # Public endpoint for payment page
@@ -380,7 +489,9 @@ class PaymentIntentView(views.APIView):
         """
         try:
             # Get invoice by payment link token
-            invoice = Invoice.objects.get(payment_link_token=token)
+            invoice = Invoice.objects.select_related(
+                'customer', 'organization'
+            ).get(payment_link_token=token)
             
             # Check if invoice can be paid
             if invoice.status in ['paid', 'cancelled']:
@@ -502,20 +613,19 @@ class StripeWebhookView(views.APIView):
         except Exception as e:
             return HttpResponse(f'Invalid signature: {str(e)}', status=400)
         
-        # Handle the event
+        # Record the event and hand it off to a worker; Stripe only needs
+        # the acknowledgement, so nothing else happens on the request path
         try:
-            result = handle_webhook_event(event)
-            
-            # Log the webhook processing
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.info(f"Stripe webhook processed: {event['type']} - Result: {result}")
-            
-            return HttpResponse(status=200)
-        
+            ledger_entry, needs_processing = record_webhook_event(event)
         except Exception as e:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f"Error processing webhook: {str(e)}")
+            logger.error(f"Error recording webhook: {str(e)}")
             return HttpResponse(f'Webhook processing error: {str(e)}', status=500)
-
+        
+        if needs_processing:
+            event_id = ledger_entry.stripe_event_id
+            transaction.on_commit(lambda: process_stripe_webhook.delay(event_id))
+            logger.info(f"Stripe webhook queued: {event['type']} ({event_id})")
+        else:
+            logger.info(f"Stripe webhook duplicate ignored: {event['type']} ({ledger_entry.stripe_event_id})")
+        
+        return HttpResponse(status=200)
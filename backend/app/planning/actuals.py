@@ -0,0 +1,98 @@
+"""
+Budget actuals from transactions
+
+Actuals for every line item of a set of budgets come from one grouped
+aggregate per budget period: expense totals per organization and
+transaction category over the period's dates. A transaction category counts
+toward the line item of the same name, or toward the category an
+organization's BudgetCategoryMapping sends it to. Changed line items are
+written back with one bulk_update.
+
+Transactions carry no department, so line items split by department each
+track their category's full spend.
+"""
+from collections import defaultdict
+from decimal import Decimal
+from django.db.models import Q, Sum
+from django.utils import timezone
+from app.api.models import Transaction
+from .models import BudgetCategoryMapping, BudgetLineItem
+
+ACTUALS_FIELDS = ['actual_amount', 'variance_amount', 'variance_percent', 'updated_at']
+
+
+def category_mappings(organization_ids):
+    """
+    Budget category each mapped transaction category counts toward
+
+    Returns:
+        dict: {(organization ID, transaction category): budget category name}
+    """
+    return {
+        (organization_id, transaction_category): category_name
+        for organization_id, transaction_category, category_name in BudgetCategoryMapping.objects.filter(
+            organization_id__in=organization_ids
+        ).values_list('organization_id', 'transaction_category', 'category_name')
+    }
+
+
+def period_spending(organization_ids, start_date, end_date, mappings):
+    """
+    Expenses per organization and budget category over one period
+
+    Returns:
+        dict: {(organization ID, budget category name): Decimal, positive}
+    """
+    rows = Transaction.objects.filter(
+        org_id__in=organization_ids,
+        date__gte=start_date,
+        date__lte=end_date
+    ).values('org_id', 'category').annotate(
+        spent=Sum('amount', filter=Q(amount__lt=0))
+    ).values_list('org_id', 'category', 'spent')
+
+    spending = defaultdict(Decimal)
+    for organization_id, category, spent in rows:
+        if spent:
+            category_name = mappings.get((organization_id, category), category)
+            spending[(organization_id, category_name)] += abs(spent)
+    return spending
+
+
+def update_budget_actuals(budgets):
+    """
+    Recompute actuals for every line item of `budgets`
+
+    Args:
+        budgets: Budget instances or queryset
+
+    Returns:
+        int: Line items whose actuals changed
+    """
+    periods = defaultdict(set)
+    budget_periods = {}
+    for budget in budgets:
+        period = (budget.start_date, budget.end_date)
+        periods[period].add(budget.organization_id)
+        budget_periods[budget.id] = (budget.organization_id, period)
+    if not budget_periods:
+        return 0
+
+    mappings = category_mappings({organization_id for organization_id, _ in budget_periods.values()})
+    spending = {
+        period: period_spending(organization_ids, *period, mappings)
+        for period, organization_ids in periods.items()
+    }
+
+    now = timezone.now()
+    changed = []
+    for line_item in BudgetLineItem.objects.filter(budget_id__in=budget_periods.keys()):
+        organization_id, period = budget_periods[line_item.budget_id]
+        before = (line_item.actual_amount, line_item.variance_amount, line_item.variance_percent)
+        line_item.set_actuals(spending[period].get((organization_id, line_item.category_name), Decimal('0')))
+        if (line_item.actual_amount, line_item.variance_amount, line_item.variance_percent) != before:
+            line_item.updated_at = now
+            changed.append(line_item)
+
+    BudgetLineItem.objects.bulk_update(changed, ACTUALS_FIELDS, batch_size=500)
+    return len(changed)
@@ -4,7 +4,7 @@ Django admin for Scenario Planning & Budgets
 from django.contrib import admin
 from .models import (
     Scenario, ScenarioAdjustment, ScenarioResult,
-    Budget, BudgetLineItem, Goal
+    Budget, BudgetLineItem, BudgetCategoryMapping, Goal
 )
 
 
@@ -79,6 +79,13 @@ class BudgetLineItemAdmin(admin.ModelAdmin):
     readonly_fields = ['id', 'actual_amount', 'variance_amount', 'variance_percent', 'created_at', 'updated_at']
 
 
+@admin.register(BudgetCategoryMapping)
+class BudgetCategoryMappingAdmin(admin.ModelAdmin):
+    list_display = ['transaction_category', 'category_name', 'organization']
+    search_fields = ['transaction_category', 'category_name', 'organization__name']
+    readonly_fields = ['id', 'created_at', 'updated_at']
+
+
 @admin.register(Goal)
 class GoalAdmin(admin.ModelAdmin):
     list_display = ['name', 'organization', 'goal_type', 'target_value', 'current_value', 'progress_percent', 'status', 'target_date']
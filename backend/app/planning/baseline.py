@@ -0,0 +1,120 @@
+"""
+Organization baseline snapshots for scenario runs
+
+Every scenario of an organization starts from the same baseline: average
+monthly revenue and expenses over the last 90 days, starting cash, and the
+monthly history Monte Carlo runs bootstrap from. The snapshot is computed
+once and cached under a stamp of the organization's transactions (latest
+updated_at plus count) and latest forecast, so every scenario, request and
+nightly run shares it until a transaction changes. The stamp costs one
+query; a snapshot miss costs three more.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict
+import numpy as np
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import TruncMonth
+from app.api.models import Forecast, Transaction
+from app.users.models import Organization
+
+BASELINE_CACHE_PREFIX = 'planning:baseline:v1'
+
+BASELINE_DAYS = 90
+HISTORY_MONTHS = 24  # Months of transactions Monte Carlo residuals are fitted to
+
+# Used when the organization has no transactions or forecast yet
+DEFAULT_MONTHLY_REVENUE = Decimal('10000')
+DEFAULT_MONTHLY_EXPENSES = Decimal('8000')
+DEFAULT_STARTING_CASH = Decimal('50000')
+
+
+def baseline_revision(organization_id) -> str:
+    """Stamp that changes whenever the organization's transactions or forecast change"""
+    stamp = Organization.objects.filter(id=organization_id).values('id').annotate(
+        changed=Max('transactions__updated_at'),
+        count=Count('transactions'),
+        forecast=Subquery(
+            Forecast.objects.filter(org_id=OuterRef('id')).order_by('-generated_at').values('id')[:1]
+        ),
+    ).first() or {}
+    changed = stamp['changed'].isoformat() if stamp.get('changed') else 'none'
+    return f"{changed}:{stamp.get('count', 0)}:{stamp.get('forecast')}"
+
+
+def monthly_history(organization_id, months: int = HISTORY_MONTHS, today: date = None) -> Dict:
+    """
+    Revenue and expense totals for each complete month with transactions
+
+    Returns:
+        dict: {'revenue': ndarray, 'expenses': ndarray} oldest month first
+    """
+    this_month = (today or date.today()).replace(day=1)
+    rows = Transaction.objects.filter(
+        org_id=organization_id,
+        date__gte=this_month - relativedelta(months=months),
+        date__lt=this_month
+    ).annotate(month=TruncMonth('date')).values('month').annotate(
+        revenue=Sum('amount', filter=Q(amount__gt=0)),
+        expenses=Sum('amount', filter=Q(amount__lt=0)),
+    ).order_by('month')
+
+    totals = [(float(row['revenue'] or 0), -float(row['expenses'] or 0)) for row in rows]
+    return {
+        'revenue': np.array([revenue for revenue, _ in totals]),
+        'expenses': np.array([expenses for _, expenses in totals]),
+    }
+
+
+def compute_baseline(organization_id, today: date = None) -> Dict:
+    """
+    Baseline for an organization's scenarios
+
+    Starting cash is the opening balance of the latest cash flow forecast,
+    since transactions carry no balance.
+
+    Returns:
+        dict: {'avg_monthly_revenue', 'avg_monthly_expenses', 'starting_cash', 'history'}
+    """
+    today = today or date.today()
+    months = Decimal(BASELINE_DAYS) / 30
+
+    totals = Transaction.objects.filter(
+        org_id=organization_id,
+        date__gte=today - timedelta(days=BASELINE_DAYS)
+    ).aggregate(
+        revenue=Sum('amount', filter=Q(amount__gt=0)),
+        expenses=Sum('amount', filter=Q(amount__lt=0)),
+    )
+
+    forecast = Forecast.objects.filter(org_id=organization_id).order_by('-generated_at').values(
+        'forecast_points'
+    ).first()
+    points = sorted(forecast['forecast_points'], key=lambda point: point['date']) if forecast else []
+
+    return {
+        'avg_monthly_revenue': (totals['revenue'] or DEFAULT_MONTHLY_REVENUE * months) / months,
+        'avg_monthly_expenses': abs(totals['expenses'] or DEFAULT_MONTHLY_EXPENSES * months) / months,
+        'starting_cash': Decimal(str(points[0]['balance'])) if points else DEFAULT_STARTING_CASH,
+        'history': monthly_history(organization_id, today=today),
+    }
+
+
+def get_baseline(organization_id, today: date = None) -> Dict:
+    """
+    Baseline snapshot for an organization, computed once per transaction revision and day
+
+    Returns:
+        dict: compute_baseline() fields plus 'revision', the stamp it was computed at
+    """
+    today = today or date.today()
+    revision = baseline_revision(organization_id)
+    key = f"{BASELINE_CACHE_PREFIX}:{organization_id}:{today.isoformat()}:{revision}"
+    baseline = cache.get(key)
+    if baseline is None:
+        baseline = dict(compute_baseline(organization_id, today), revision=revision)
+        cache.set(key, baseline, settings.PLANNING_BASELINE_TTL)
+    return baseline
@@ -3,11 +3,47 @@ Database models for Scenario Planning & Budget Simulator
 Feature 3
 """
 import uuid
+import numpy as np
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
 from app.users.models import Organization, User
 
+# Monthly result series stored packed in ScenarioResult.series, in this order
+PACKED_SERIES = ('monthly_revenue', 'monthly_expenses', 'monthly_profit', 'monthly_cash_balance')
+
+
+def pack_series(series):
+    """Pack named float series as little-endian uint32 lengths followed by float64 values"""
+    arrays = [np.asarray(series.get(name, []), dtype='<f8') for name in PACKED_SERIES]
+    lengths = np.array([len(array) for array in arrays], dtype='<u4')
+    return lengths.tobytes() + b''.join(array.tobytes() for array in arrays)
+
+
+def unpack_series(data):
+    """Inverse of pack_series(): {name: [floats]}"""
+    if not data:
+        return {name: [] for name in PACKED_SERIES}
+    data = bytes(data)
+    lengths = np.frombuffer(data, dtype='<u4', count=len(PACKED_SERIES))
+    values = np.frombuffer(data, dtype='<f8', offset=lengths.nbytes)
+    return {
+        name: part.tolist() for name, part in zip(PACKED_SERIES, np.split(values, np.cumsum(lengths)[:-1]))
+    }
+
+
+def _series_property(name):
+    """Read/write one packed series as a list; usable as a model constructor kwarg"""
+    def getter(self):
+        return unpack_series(self.series)[name]
+    
+    def setter(self, values):
+        series = unpack_series(self.series)
+        series[name] = values
+        self.series = pack_series(series)
+    
+    return property(getter, setter)
+
 
 class Scenario(models.Model):
     """Financial scenario for what-if analysis"""
@@ -41,6 +77,9 @@ class Scenario(models.Model):
     # Tracking
     is_active = models.BooleanField(default=True)
     last_simulated_at = models.DateTimeField(null=True, blank=True)
+    latest_result = models.ForeignKey(
+        'ScenarioResult', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
     version = models.IntegerField(default=1)
     
     class Meta:
@@ -104,15 +143,21 @@ class ScenarioAdjustment(models.Model):
 class ScenarioResult(models.Model):
     """Cached simulation results for a scenario"""
     
+    SIMULATION_MODE_CHOICES = [
+        ('deterministic', 'Deterministic'),
+        ('monte_carlo', 'Monte Carlo'),
+    ]
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     scenario = models.ForeignKey(Scenario, on_delete=models.CASCADE, related_name='results')
     
-    # Monthly results (stored as JSON arrays)
+    # Monthly results; the numeric series are packed float64 arrays (see pack_series)
     month_labels = models.JSONField(default=list)  # ["Jan 2024", "Feb 2024", ...]
-    monthly_revenue = models.JSONField(default=list)  # [10000, 11000, ...]
-    monthly_expenses = models.JSONField(default=list)
-    monthly_profit = models.JSONField(default=list)
-    monthly_cash_balance = models.JSONField(default=list)
+    series = models.BinaryField(default=bytes)
+    monthly_revenue = _series_property('monthly_revenue')  # [10000.0, 11000.0, ...]
+    monthly_expenses = _series_property('monthly_expenses')
+    monthly_profit = _series_property('monthly_profit')
+    monthly_cash_balance = _series_property('monthly_cash_balance')
     
     # Summary metrics
     total_revenue = models.DecimalField(max_digits=15, decimal_places=2, default=0)
@@ -132,10 +177,22 @@ class ScenarioResult(models.Model):
     # Simulation metadata
     simulated_at = models.DateTimeField(auto_now=True)
     confidence_level = models.DecimalField(max_digits=5, decimal_places=2, default=75)  # AI confidence
+    simulation_mode = models.CharField(max_length=20, choices=SIMULATION_MODE_CHOICES, default='deterministic')
+    input_fingerprint = models.CharField(max_length=64, blank=True)  # Hash of the adjustments and baseline simulated
+    
+    # Monte Carlo distribution (empty for deterministic runs)
+    paths = models.IntegerField(null=True, blank=True)
+    seed = models.BigIntegerField(null=True, blank=True)  # Re-running with this seed reproduces the result
+    cash_percentiles = models.JSONField(default=dict, blank=True)  # {"p5": [...], "p50": [...], "p95": [...]}
+    cash_out_probability = models.JSONField(default=list, blank=True)  # Share of paths out of cash by each month
+    runway_distribution = models.JSONField(default=dict, blank=True)  # Runway percentiles in months
     
     class Meta:
         db_table = 'planning_scenario_result'
         ordering = ['-simulated_at']
+        indexes = [
+            models.Index(fields=['scenario', '-simulated_at']),
+        ]
     
     def __str__(self):
         return f"Results for {self.scenario.name}"
@@ -238,15 +295,42 @@ class BudgetLineItem(models.Model):
     def __str__(self):
         return f"{self.category_name} - {self.budget.name}"
     
-    def update_actuals(self, actual_amount):
-        """Update actual amount and calculate variance"""
+    def set_actuals(self, actual_amount):
+        """Set actual amount and variance without saving"""
         self.actual_amount = actual_amount
         self.variance_amount = self.actual_amount - self.budgeted_amount
         if self.budgeted_amount > 0:
-            self.variance_percent = (self.variance_amount / self.budgeted_amount) * 100
+            # Clamped to what variance_percent can store
+            percent = (self.variance_amount / self.budgeted_amount) * 100
+            self.variance_percent = max(min(percent, Decimal('999.99')), Decimal('-999.99')).quantize(Decimal('0.01'))
+    
+    def update_actuals(self, actual_amount):
+        """Update actual amount and calculate variance"""
+        self.set_actuals(actual_amount)
         self.save()
 
 
+class BudgetCategoryMapping(models.Model):
+    """Transaction category counted toward a differently named budget category"""
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='budget_category_mappings')
+    
+    transaction_category = models.CharField(max_length=50)
+    category_name = models.CharField(max_length=100)  # BudgetLineItem.category_name
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'planning_budget_category_mapping'
+        ordering = ['transaction_category']
+        unique_together = ['organization', 'transaction_category']
+    
+    def __str__(self):
+        return f"{self.transaction_category} -> {self.category_name}"
+
+
 class Goal(models.Model):
     """Financial goals tracking"""
     
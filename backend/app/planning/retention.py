@@ -0,0 +1,92 @@
+"""
+Scenario result retention
+
+Each scenario keeps its latest results in full detail and thins out older
+ones: the newest PLANNING_RESULT_KEEP_LATEST results, then the newest result
+of each day for PLANNING_RESULT_DAILY_DAYS days, then the newest of each week
+for PLANNING_RESULT_WEEKLY_WEEKS weeks. Anything older is purged. The result
+a scenario's latest_result points at is always kept.
+
+The purge walks scenarios in batches: one query reads a batch's result
+timestamps, the keep set is decided in memory and the rest are deleted by
+primary key.
+"""
+from datetime import timedelta
+from itertools import groupby
+from django.conf import settings
+from django.utils import timezone
+from .models import Scenario, ScenarioResult
+
+
+def results_to_purge(results, now, keep_latest, daily_days, weekly_weeks):
+    """
+    Results of one scenario that fall outside the retention policy
+
+    Args:
+        results: (result ID, simulated_at) pairs, newest first
+        now: Reference time
+
+    Returns:
+        list: Result IDs to delete
+    """
+    daily_since = now - timedelta(days=daily_days)
+    weekly_since = now - timedelta(weeks=weekly_weeks)
+    seen_days, seen_weeks = set(), set()
+    purge = []
+
+    for index, (result_id, simulated_at) in enumerate(results):
+        day = simulated_at.date()
+        week = day.isocalendar()[:2]
+        if index < keep_latest:
+            keep = True
+        elif simulated_at >= daily_since:
+            keep = day not in seen_days
+        elif simulated_at >= weekly_since:
+            keep = week not in seen_weeks
+        else:
+            keep = False
+        seen_days.add(day)
+        seen_weeks.add(week)
+
+        if not keep:
+            purge.append(result_id)
+
+    return purge
+
+
+def purge_scenario_results(now=None, batch_size=None):
+    """
+    Apply the retention policy to every scenario's results
+
+    Returns:
+        int: Results deleted
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or settings.PLANNING_RESULT_PURGE_BATCH_SIZE
+    policy = {
+        'keep_latest': settings.PLANNING_RESULT_KEEP_LATEST,
+        'daily_days': settings.PLANNING_RESULT_DAILY_DAYS,
+        'weekly_weeks': settings.PLANNING_RESULT_WEEKLY_WEEKS,
+    }
+
+    scenarios = list(Scenario.objects.order_by('id').values_list('id', 'latest_result_id'))
+    deleted = 0
+
+    for start in range(0, len(scenarios), batch_size):
+        batch = dict(scenarios[start:start + batch_size])
+        rows = ScenarioResult.objects.filter(scenario_id__in=batch.keys()).order_by(
+            'scenario_id', '-simulated_at'
+        ).values_list('scenario_id', 'id', 'simulated_at')
+
+        purge = []
+        for scenario_id, results in groupby(rows, key=lambda row: row[0]):
+            purge.extend(
+                result_id
+                for result_id in results_to_purge([row[1:] for row in results], now, **policy)
+                if result_id != batch[scenario_id]
+            )
+
+        for offset in range(0, len(purge), batch_size):
+            deleted += ScenarioResult.objects.filter(id__in=purge[offset:offset + batch_size]).delete()[0]
+
+    return deleted
@@ -0,0 +1,125 @@
+"""
+Nightly scenario re-simulation
+
+Due scenarios are split into chunks that never span organizations, so each
+chunk reads its organization's baseline snapshot once. A chunk simulates
+its scenarios in memory, skips those whose inputs fingerprint matches their
+latest deterministic result, then writes every new ScenarioResult with one
+bulk_create and points last_simulated_at and latest_result at them with one
+UPDATE. Failures are reported per scenario instead of stopping the chunk.
+"""
+from itertools import groupby
+import logging
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+from .baseline import get_baseline
+from .models import Scenario, ScenarioResult
+from .simulator import ScenarioSimulator
+
+logger = logging.getLogger(__name__)
+
+# Error entries kept in a run's report
+MAX_REPORTED_ERRORS = 50
+
+
+def due_scenario_chunks(cutoff, chunk_size):
+    """
+    Active scenarios not simulated since `cutoff`, chunked per organization
+
+    Returns:
+        list: [(organization ID, [scenario IDs])] as strings
+    """
+    rows = Scenario.objects.filter(
+        Q(last_simulated_at__lt=cutoff) | Q(last_simulated_at__isnull=True),
+        is_active=True
+    ).order_by('organization_id', 'id').values_list('organization_id', 'id')
+
+    chunks = []
+    for organization_id, scenarios in groupby(rows, key=lambda row: row[0]):
+        scenario_ids = [str(scenario_id) for _, scenario_id in scenarios]
+        chunks.extend(
+            (str(organization_id), scenario_ids[start:start + chunk_size])
+            for start in range(0, len(scenario_ids), chunk_size)
+        )
+    return chunks
+
+
+def simulate_scenario_chunk(organization_id, scenario_ids):
+    """
+    Re-simulate one organization's scenarios from a shared baseline
+
+    Returns:
+        dict: {'organization_id', 'simulated': int, 'skipped': int, 'failed': int,
+               'errors': [{'scenario_id', 'error'}]}
+    """
+    summary = {'organization_id': organization_id, 'simulated': 0, 'skipped': 0, 'failed': 0, 'errors': []}
+    baseline = get_baseline(organization_id)
+
+    scenarios = Scenario.objects.filter(
+        id__in=scenario_ids, organization_id=organization_id, is_active=True
+    ).annotate(
+        last_fingerprint=Subquery(
+            ScenarioResult.objects.filter(
+                scenario=OuterRef('pk'), simulation_mode='deterministic'
+            ).order_by('-simulated_at').values('input_fingerprint')[:1]
+        )
+    ).prefetch_related('adjustments')
+
+    results = []
+    for scenario in scenarios:
+        try:
+            simulator = ScenarioSimulator(scenario)
+            fingerprint = simulator.fingerprint(baseline)
+            if fingerprint == scenario.last_fingerprint:
+                summary['skipped'] += 1
+                continue
+            results.append(ScenarioResult(
+                scenario=scenario,
+                input_fingerprint=fingerprint,
+                **simulator.simulate(baseline)
+            ))
+        except Exception as e:
+            logger.exception("Scenario %s failed to simulate", scenario.id)
+            summary['failed'] += 1
+            if len(summary['errors']) < MAX_REPORTED_ERRORS:
+                summary['errors'].append({'scenario_id': str(scenario.id), 'error': str(e)})
+
+    with transaction.atomic():
+        ScenarioResult.objects.bulk_create(results)
+        Scenario.objects.filter(id__in=[result.scenario_id for result in results]).update(
+            last_simulated_at=timezone.now(),
+            latest_result=Subquery(
+                ScenarioResult.objects.filter(scenario=OuterRef('pk')).order_by('-simulated_at').values('id')[:1]
+            )
+        )
+
+    summary['simulated'] = len(results)
+    return summary
+
+
+def fail_scenario_chunk(organization_id, scenario_ids, error):
+    """Report every scenario of a chunk that failed as a whole"""
+    return {
+        'organization_id': organization_id,
+        'simulated': 0,
+        'skipped': 0,
+        'failed': len(scenario_ids),
+        'errors': [{'scenario_id': None, 'error': error}],
+    }
+
+
+def summarize_chunks(chunk_results):
+    """Aggregate per-chunk summaries into a run report"""
+    report = {'simulated': 0, 'skipped': 0, 'failed': 0, 'chunks': len(chunk_results), 'errors': []}
+
+    for chunk in chunk_results:
+        report['simulated'] += chunk['simulated']
+        report['skipped'] += chunk['skipped']
+        report['failed'] += chunk['failed']
+        report['errors'].extend(
+            dict(error, organization_id=chunk['organization_id'])
+            for error in chunk['errors'][:MAX_REPORTED_ERRORS - len(report['errors'])]
+        )
+
+    return report
@@ -1,6 +1,7 @@
 """
 Serializers for Scenario Planning & Budget Simulator
 """
+from django.conf import settings
 from rest_framework import serializers
 from .models import (
     Scenario, ScenarioAdjustment, ScenarioResult,
@@ -32,11 +33,23 @@ class ScenarioResultSerializer(serializers.ModelSerializer):
             'total_expenses', 'total_profit', 'profit_margin',
             'ending_cash', 'lowest_cash', 'runway_days',
             'break_even_month', 'break_even_revenue',
-            'simulated_at', 'confidence_level'
+            'simulated_at', 'confidence_level', 'simulation_mode',
+            'paths', 'seed', 'cash_percentiles', 'cash_out_probability',
+            'runway_distribution'
         ]
         read_only_fields = fields
 
 
+class ScenarioSimulationSerializer(serializers.Serializer):
+    """Options for running a scenario simulation"""
+    mode = serializers.ChoiceField(choices=ScenarioResult.SIMULATION_MODE_CHOICES, default='deterministic')
+    paths = serializers.IntegerField(
+        min_value=100, max_value=settings.SCENARIO_MONTE_CARLO_MAX_PATHS,
+        default=settings.SCENARIO_MONTE_CARLO_PATHS
+    )
+    seed = serializers.IntegerField(min_value=0, max_value=2 ** 63 - 1, required=False)
+
+
 class ScenarioSerializer(serializers.ModelSerializer):
     """Serializer for scenarios"""
     adjustments = ScenarioAdjustmentSerializer(many=True, read_only=True)
@@ -54,9 +67,8 @@ class ScenarioSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at', 'last_simulated_at', 'version']
     
     def get_latest_result(self, obj):
-        latest = obj.results.first()
-        if latest:
-            return ScenarioResultSerializer(latest).data
+        if obj.latest_result_id:
+            return ScenarioResultSerializer(obj.latest_result).data
         return None
 
 
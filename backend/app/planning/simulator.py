@@ -1,10 +1,236 @@
 """
 Scenario simulation engine
+
+Adjustments are compiled once into per-month arrays: revenue and expense
+adjustments fold into a multiplier and an offset per month (applied in
+adjustment order, so amount = base * multiplier + offset), and one-time
+events into a per-month cash array. A projection is then a handful of NumPy
+operations over the month axis, and any leading axes broadcast, so batches
+of perturbed inputs are projected in the same pass. Values are floats until
+the result is built, where money is rounded to cents as Decimal.
+
+Monte Carlo mode perturbs the deterministic revenue and expense paths with
+residuals bootstrapped from the organization's monthly history (revenue and
+expense residuals are drawn from the same month, keeping their correlation)
+and projects every path at once as a (paths x months) array.
 """
 from datetime import datetime, timedelta
-from decimal import Decimal
-from typing import Dict, List, Tuple
-import calendar
+from decimal import Decimal, ROUND_HALF_UP
+import hashlib
+import json
+from typing import Dict, List
+import numpy as np
+from .actuals import update_budget_actuals
+from .baseline import get_baseline, monthly_history
+
+CENTS = Decimal('0.01')
+DAYS_PER_MONTH = 30
+
+# Natural monthly growth applied to the baseline before adjustments
+REVENUE_GROWTH = 0.02
+EXPENSE_GROWTH = 0.01  # Expenses grow slightly slower
+
+# Sensitivity variable -> project() input it scales
+SENSITIVITY_VARIABLES = {
+    'revenue': 'base_revenue',
+    'expenses': 'base_expenses',
+    'starting_cash': 'starting_cash',
+    'revenue_growth': 'revenue_growth',
+    'expense_growth': 'expense_growth',
+}
+DEFAULT_VARIATIONS = [-50, -25, -10, 0, 10, 25, 50]
+
+MIN_HISTORY_MONTHS = 4  # Fewer months than this fall back to DEFAULT_VOLATILITY
+DEFAULT_VOLATILITY = 0.10  # Std. dev. of relative monthly deviations without history
+PERCENTILES = (5, 50, 95)
+
+
+def _money(value) -> Decimal:
+    return Decimal(str(float(value))).quantize(CENTS, rounding=ROUND_HALF_UP)
+
+
+def _fold(factor: np.ndarray, addend: np.ndarray) -> tuple:
+    """
+    Compose per-adjustment steps into one affine map per month
+    
+    Row j of `factor`/`addend` is step j: amount = amount * factor[j] + addend[j].
+    Applied in order, the result is base * prod(factor) + sum_j addend[j] * prod(factor[j+1:]).
+    """
+    months = factor.shape[1]
+    if not len(factor):
+        return np.ones(months), np.zeros(months)
+    
+    # Product of the factors after each step (1 after the last one)
+    later = np.cumprod(factor[::-1], axis=0)[::-1]
+    after = np.vstack([later[1:], np.ones((1, months))])
+    return later[0], (addend * after).sum(axis=0)
+
+
+def compile_adjustments(adjustments, months: int) -> Dict:
+    """
+    Compile scenario adjustments into per-month arrays
+    
+    Args:
+        adjustments: ScenarioAdjustment instances in application order
+        months: Forecast length
+    
+    Returns:
+        dict: {
+            'revenue': (multiplier, offset),
+            'expense': (multiplier, offset),
+            'one_time': cash added per month,
+        } with arrays of length `months`
+    """
+    month = np.arange(1, months + 1)
+    compiled = {}
+    
+    for adjustment_type in ('revenue', 'expense'):
+        rows = [adj for adj in adjustments if adj.adjustment_type == adjustment_type]
+        start = np.array([adj.start_month for adj in rows], dtype=int).reshape(-1, 1)
+        end = np.array([adj.end_month or months for adj in rows], dtype=int).reshape(-1, 1)
+        value = np.array([float(adj.value) for adj in rows]).reshape(-1, 1)
+        change_type = np.array([adj.change_type for adj in rows]).reshape(-1, 1)
+        
+        active = (month >= start) & (month <= end)
+        rate = 1 + value / 100
+        factor = np.where(change_type == 'percentage', rate, 1.0)
+        # Growth compounds from the adjustment's start month
+        factor = np.where(change_type == 'growth_rate', rate ** np.maximum(month - start, 0), factor)
+        factor = np.where(active, factor, 1.0)
+        addend = np.where(active & (change_type == 'absolute'), value, 0.0)
+        
+        compiled[adjustment_type] = _fold(factor, addend)
+    
+    events = [adj for adj in adjustments if adj.adjustment_type == 'one_time' and 1 <= adj.start_month <= months]
+    compiled['one_time'] = np.bincount(
+        [adj.start_month - 1 for adj in events],
+        weights=[float(adj.value) for adj in events],
+        minlength=months
+    ).astype(float)
+    
+    return compiled
+
+
+def project(compiled: Dict, starting_cash, base_revenue, base_expenses,
+            revenue_growth=REVENUE_GROWTH, expense_growth=EXPENSE_GROWTH) -> Dict:
+    """
+    Project monthly revenue, expenses, profit and cash balance
+    
+    Inputs may be scalars or arrays of any shape; results have that shape
+    plus a trailing month axis.
+    
+    Returns:
+        dict: {'revenue', 'expenses', 'profit', 'cash'} float arrays
+    """
+    revenue_multiplier, revenue_offset = compiled['revenue']
+    expense_multiplier, expense_offset = compiled['expense']
+    elapsed = np.arange(len(revenue_multiplier))
+    
+    def path(base, growth):
+        return np.asarray(base, dtype=float)[..., None] * (1 + np.asarray(growth, dtype=float)[..., None]) ** elapsed
+    
+    revenue = path(base_revenue, revenue_growth) * revenue_multiplier + revenue_offset
+    expenses = path(base_expenses, expense_growth) * expense_multiplier + expense_offset
+    profit = revenue - expenses
+    cash = np.asarray(starting_cash, dtype=float)[..., None] + np.cumsum(profit + compiled['one_time'], axis=-1)
+    
+    return {'revenue': revenue, 'expenses': expenses, 'profit': profit, 'cash': cash}
+
+
+def runway_days(cash: np.ndarray, expenses: np.ndarray) -> np.ndarray:
+    """Days the ending cash lasts at the average burn (NaN when nothing is spent)"""
+    daily_burn = expenses.mean(axis=-1) / DAYS_PER_MONTH
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(daily_burn > 0, np.floor(cash[..., -1] / daily_burn), np.nan)
+
+
+def summarize(projection: Dict, month_labels: List[str]) -> Dict:
+    """Result fields for one projected path, with money rounded to cents"""
+    revenue = projection['revenue']
+    expenses = projection['expenses']
+    profit = projection['profit']
+    cash = projection['cash']
+    
+    total_revenue = revenue.sum()
+    total_profit = profit.sum()
+    runway = runway_days(cash, expenses)
+    
+    break_even = np.flatnonzero(revenue >= expenses)
+    
+    def cents(values):
+        return [float(_money(value)) for value in values]
+    
+    return {
+        'month_labels': month_labels,
+        'monthly_revenue': cents(revenue),
+        'monthly_expenses': cents(expenses),
+        'monthly_profit': cents(profit),
+        'monthly_cash_balance': cents(cash),
+        'total_revenue': _money(total_revenue),
+        'total_expenses': _money(expenses.sum()),
+        'total_profit': _money(total_profit),
+        'profit_margin': _money(total_profit / total_revenue * 100) if total_revenue > 0 else Decimal('0.00'),
+        'ending_cash': _money(cash[-1]),
+        'lowest_cash': _money(cash.min()),
+        'runway_days': None if np.isnan(runway) else int(runway),
+        'break_even_month': int(break_even[0]) + 1 if len(break_even) else None,
+        'break_even_revenue': _money(revenue[break_even[0]]) if len(break_even) else None,
+        'confidence_level': Decimal('75.00'),  # Default confidence
+    }
+
+
+def trend_residuals(series: np.ndarray) -> np.ndarray:
+    """Relative deviations of a monthly series from its linear trend"""
+    elapsed = np.arange(len(series))
+    trend = np.polyval(np.polyfit(elapsed, series, 1), elapsed)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(trend > 0, series / trend - 1, 0.0)
+
+
+def sample_residuals(history: Dict, rng: np.random.Generator, shape: tuple) -> tuple:
+    """
+    Monthly relative revenue and expense shocks for `shape` (paths, months)
+    
+    Residuals are bootstrapped in pairs from the history's months; short
+    histories draw from a normal distribution with DEFAULT_VOLATILITY.
+    """
+    if len(history['revenue']) < MIN_HISTORY_MONTHS:
+        return (
+            rng.normal(0, DEFAULT_VOLATILITY, shape),
+            rng.normal(0, DEFAULT_VOLATILITY, shape),
+        )
+    
+    draws = rng.integers(0, len(history['revenue']), shape)
+    return trend_residuals(history['revenue'])[draws], trend_residuals(history['expenses'])[draws]
+
+
+def summarize_paths(cash: np.ndarray) -> Dict:
+    """Distribution fields for a (paths x months) array of cash balances"""
+    months = cash.shape[1]
+    out_of_cash = np.maximum.accumulate(cash < 0, axis=1)
+    cash_out_probability = out_of_cash.mean(axis=0)
+    
+    # Month cash first runs out on each path; months + 1 when it never does
+    runway_months = np.where(out_of_cash[:, -1], out_of_cash.argmax(axis=1) + 1, months + 1)
+    runway_percentiles = np.percentile(runway_months, PERCENTILES, method='lower')
+    
+    bands = np.percentile(cash, PERCENTILES, axis=0)
+    return {
+        'cash_percentiles': {
+            f'p{percentile}': [float(_money(value)) for value in band]
+            for percentile, band in zip(PERCENTILES, bands)
+        },
+        'cash_out_probability': [round(float(share), 4) for share in cash_out_probability],
+        'runway_distribution': {
+            # Months until cash runs out; None when it lasts the whole forecast
+            **{
+                f'p{percentile}': int(value) if value <= months else None
+                for percentile, value in zip(PERCENTILES, runway_percentiles)
+            },
+            'beyond_horizon': round(1 - float(cash_out_probability[-1]), 4),
+        },
+        'confidence_level': _money((1 - cash_out_probability[-1]) * 100),
+    }
 
 
 class ScenarioSimulator:
@@ -13,119 +239,81 @@ class ScenarioSimulator:
     def __init__(self, scenario):
         self.scenario = scenario
         self.adjustments = list(scenario.adjustments.all())
+        self.compiled = compile_adjustments(self.adjustments, scenario.forecast_months)
     
-    def simulate(self) -> Dict:
-        """Run the scenario simulation"""
-        # Get base data from organization's historical transactions
-        base_data = self._get_base_data()
-        
-        # Generate month labels
-        month_labels = self._generate_month_labels()
-        
-        # Initialize arrays
-        monthly_revenue = []
-        monthly_expenses = []
-        monthly_profit = []
-        monthly_cash_balance = []
-        
-        # Starting cash (get from organization's current cash balance)
-        current_cash = base_data['starting_cash']
-        
-        # Run simulation for each month
-        for month_idx in range(1, self.scenario.forecast_months + 1):
-            # Calculate base revenue and expenses
-            revenue = self._calculate_revenue(month_idx, base_data['avg_monthly_revenue'])
-            expenses = self._calculate_expenses(month_idx, base_data['avg_monthly_expenses'])
-            
-            # Apply adjustments
-            revenue = self._apply_adjustments(revenue, month_idx, 'revenue')
-            expenses = self._apply_adjustments(expenses, month_idx, 'expense')
-            
-            # Apply one-time events
-            one_time_amount = self._apply_one_time_events(month_idx)
-            current_cash += one_time_amount
-            
-            # Calculate profit and cash
-            profit = revenue - expenses
-            current_cash += profit
-            
-            # Store results
-            monthly_revenue.append(float(revenue))
-            monthly_expenses.append(float(expenses))
-            monthly_profit.append(float(profit))
-            monthly_cash_balance.append(float(current_cash))
-        
-        # Calculate summary metrics
-        total_revenue = sum(monthly_revenue)
-        total_expenses = sum(monthly_expenses)
-        total_profit = sum(monthly_profit)
-        profit_margin = (total_profit / total_revenue * 100) if total_revenue > 0 else 0
-        
-        # Cash metrics
-        ending_cash = monthly_cash_balance[-1]
-        lowest_cash = min(monthly_cash_balance)
-        runway_days = self._calculate_runway(monthly_cash_balance, monthly_expenses)
-        
-        # Break-even analysis
-        break_even_month, break_even_revenue = self._calculate_break_even(
-            monthly_revenue, monthly_expenses
-        )
+    def simulate(self, base_data: Dict = None) -> Dict:
+        """
+        Run the scenario simulation
         
-        return {
-            'month_labels': month_labels,
-            'monthly_revenue': monthly_revenue,
-            'monthly_expenses': monthly_expenses,
-            'monthly_profit': monthly_profit,
-            'monthly_cash_balance': monthly_cash_balance,
-            'total_revenue': total_revenue,
-            'total_expenses': total_expenses,
-            'total_profit': total_profit,
-            'profit_margin': round(profit_margin, 2),
-            'ending_cash': ending_cash,
-            'lowest_cash': lowest_cash,
-            'runway_days': runway_days,
-            'break_even_month': break_even_month,
-            'break_even_revenue': break_even_revenue,
-            'confidence_level': Decimal('75.00'),  # Default confidence
+        Args:
+            base_data: Baseline from _get_base_data() (fetched when omitted)
+        """
+        base_data = base_data or self._get_base_data()
+        projection = self.project(base_data)
+        return summarize(projection, self._generate_month_labels())
+    
+    def fingerprint(self, base_data: Dict) -> str:
+        """Hash of everything a deterministic run depends on: the scenario, its adjustments and the baseline"""
+        inputs = {
+            'period': [self.scenario.base_year, self.scenario.base_month, self.scenario.forecast_months],
+            'adjustments': [
+                [adj.adjustment_type, adj.change_type, str(adj.value), adj.start_month, adj.end_month]
+                for adj in self.adjustments
+            ],
+            # The values, not the baseline's revision: its 90-day window moves daily with no transaction changing
+            'baseline': [
+                str(base_data[field]) for field in ('avg_monthly_revenue', 'avg_monthly_expenses', 'starting_cash')
+            ],
         }
+        return hashlib.sha256(json.dumps(inputs).encode()).hexdigest()
     
-    def _get_base_data(self) -> Dict:
-        """Get base financial data from organization"""
-        from app.finance.models import Transaction
-        from django.db.models import Avg, Sum
-        from datetime import datetime, timedelta
-        
-        # Get last 3 months of data for baseline
-        three_months_ago = datetime.now() - timedelta(days=90)
-        
-        transactions = Transaction.objects.filter(
-            organization=self.scenario.organization,
-            date__gte=three_months_ago
-        )
-        
-        # Calculate averages
-        revenue_txns = transactions.filter(amount__gt=0)
-        expense_txns = transactions.filter(amount__lt=0)
-        
-        avg_monthly_revenue = revenue_txns.aggregate(
-            total=Sum('amount')
-        )['total'] or Decimal('10000')
-        avg_monthly_revenue = avg_monthly_revenue / 3  # Average over 3 months
-        
-        avg_monthly_expenses = abs(expense_txns.aggregate(
-            total=Sum('amount')
-        )['total'] or Decimal('8000'))
-        avg_monthly_expenses = avg_monthly_expenses / 3
+    def project(self, base_data: Dict, **overrides) -> Dict:
+        """Project the scenario from a baseline; keyword overrides replace project() inputs"""
+        inputs = {
+            'starting_cash': float(base_data['starting_cash']),
+            'base_revenue': float(base_data['avg_monthly_revenue']),
+            'base_expenses': float(base_data['avg_monthly_expenses']),
+        }
+        inputs.update(overrides)
+        return project(self.compiled, **inputs)
+    
+    def simulate_monte_carlo(self, paths: int, seed: int = None, base_data: Dict = None, history: Dict = None) -> Dict:
+        """
+        Run the scenario as `paths` randomized paths
         
-        # Get current cash balance (latest transaction balance or default)
-        latest_txn = transactions.order_by('-date').first()
-        starting_cash = latest_txn.balance if latest_txn else Decimal('50000')
+        Monthly figures and totals are the deterministic projection; the
+        result adds cash percentile bands, the probability of having run out
+        of cash by each month and the runway distribution.
         
-        return {
-            'avg_monthly_revenue': avg_monthly_revenue,
-            'avg_monthly_expenses': avg_monthly_expenses,
-            'starting_cash': starting_cash,
-        }
+        Args:
+            paths: Number of paths
+            seed: RNG seed (a random one is drawn and stored when omitted)
+            base_data: Baseline from _get_base_data() (fetched when omitted)
+            history: Monthly totals from monthly_history() (the baseline's when omitted)
+        """
+        base_data = base_data or self._get_base_data()
+        if history is None:
+            history = base_data.get('history') or monthly_history(self.scenario.organization_id)
+        if seed is None:
+            seed = int(np.random.SeedSequence().generate_state(1)[0])
+        rng = np.random.default_rng(seed)
+        
+        projection = self.project(base_data)
+        months = projection['revenue'].shape[-1]
+        revenue_shocks, expense_shocks = sample_residuals(history, rng, (paths, months))
+        
+        revenue = np.maximum(projection['revenue'] * (1 + revenue_shocks), 0)
+        expenses = np.maximum(projection['expenses'] * (1 + expense_shocks), 0)
+        cash = float(base_data['starting_cash']) + np.cumsum(revenue - expenses + self.compiled['one_time'], axis=1)
+        
+        result = summarize(projection, self._generate_month_labels())
+        result.update(summarize_paths(cash))
+        result.update(simulation_mode='monte_carlo', paths=paths, seed=seed)
+        return result
+    
+    def _get_base_data(self) -> Dict:
+        """Organization baseline, shared by all its scenarios until its transactions change"""
+        return get_baseline(self.scenario.organization_id)
     
     def _generate_month_labels(self) -> List[str]:
         """Generate month labels for the forecast period"""
@@ -137,140 +325,93 @@ class ScenarioSimulator:
             labels.append(current_date.strftime('%b %Y'))
         
         return labels
-    
-    def _calculate_revenue(self, month: int, base_revenue: Decimal) -> Decimal:
-        """Calculate revenue for a given month"""
-        # Apply natural growth (default 2% monthly)
-        growth_rate = Decimal('1.02')
-        return base_revenue * (growth_rate ** (month - 1))
-    
-    def _calculate_expenses(self, month: int, base_expenses: Decimal) -> Decimal:
-        """Calculate expenses for a given month"""
-        # Expenses grow slightly slower (1% monthly)
-        growth_rate = Decimal('1.01')
-        return base_expenses * (growth_rate ** (month - 1))
-    
-    def _apply_adjustments(self, base_amount: Decimal, month: int, adj_type: str) -> Decimal:
-        """Apply adjustments to revenue or expenses"""
-        amount = base_amount
-        
-        for adj in self.adjustments:
-            if adj.adjustment_type != adj_type:
-                continue
-            
-            # Check if adjustment applies to this month
-            if month < adj.start_month:
-                continue
-            if adj.end_month and month > adj.end_month:
-                continue
-            
-            # Apply the adjustment
-            if adj.change_type == 'percentage':
-                # Percentage change
-                multiplier = Decimal('1') + (adj.value / Decimal('100'))
-                amount *= multiplier
-            elif adj.change_type == 'absolute':
-                # Absolute amount change
-                amount += adj.value
-            elif adj.change_type == 'growth_rate':
-                # Apply monthly growth rate
-                months_since_start = month - adj.start_month
-                multiplier = (Decimal('1') + adj.value / Decimal('100')) ** months_since_start
-                amount *= multiplier
-        
-        return amount
-    
-    def _apply_one_time_events(self, month: int) -> Decimal:
-        """Apply one-time events for a specific month"""
-        total = Decimal('0')
-        
-        for adj in self.adjustments:
-            if adj.adjustment_type == 'one_time' and adj.start_month == month:
-                total += adj.value
-        
-        return total
-    
-    def _calculate_runway(self, cash_balances: List[float], expenses: List[float]) -> int:
-        """Calculate runway in days"""
-        if not expenses:
-            return None
-        
-        avg_daily_burn = sum(expenses) / len(expenses) / 30
-        ending_cash = cash_balances[-1]
-        
-        if avg_daily_burn > 0:
-            return int(ending_cash / avg_daily_burn)
-        return None
-    
-    def _calculate_break_even(
-        self, revenue: List[float], expenses: List[float]
-    ) -> Tuple[int, float]:
-        """Calculate break-even point"""
-        for month_idx, (rev, exp) in enumerate(zip(revenue, expenses), start=1):
-            if rev >= exp:
-                return month_idx, rev
-        return None, None
 
 
 class SensitivityAnalyzer:
-    """Perform sensitivity analysis on scenarios"""
+    """
+    Perform sensitivity analysis on scenarios
     
-    def __init__(self, scenario):
+    Each variable scales one projection input by each variation percentage.
+    The baseline is fetched once and the whole (variables x variations x
+    months) grid is projected in a single broadcast pass.
+    """
+    
+    def __init__(self, scenario, base_data: Dict = None):
         self.scenario = scenario
+        self.simulator = ScenarioSimulator(scenario)
+        self.base_data = base_data
     
     def analyze(self, variables: List[str], variations: List[float] = None) -> Dict:
         """
         Analyze sensitivity to key variables
-        variables: List of variable names to test (e.g., ['revenue', 'expenses'])
+        variables: Names from SENSITIVITY_VARIABLES (e.g., ['revenue', 'expenses'])
         variations: Percentage variations to test (e.g., [-25, -10, 0, 10, 25])
+        
+        Returns:
+            dict: {
+                'base': baseline metrics,
+                'variables': {variable: [{'variation', 'ending_cash', 'total_profit', 'runway_days'}, ...]},
+                'tornado': [{'variable', 'low', 'high', 'swing'}, ...] by ending cash swing, largest first,
+            }
         """
+        unknown = [variable for variable in variables if variable not in SENSITIVITY_VARIABLES]
+        if unknown:
+            raise ValueError(f"Unknown sensitivity variables: {', '.join(unknown)}")
         if variations is None:
-            variations = [-50, -25, -10, 0, 10, 25, 50]
-        
-        results = {}
-        
-        for variable in variables:
-            var_results = []
-            
-            for variation in variations:
-                # Create temporary scenario with this variation
-                impact = self._test_variation(variable, variation)
-                var_results.append({
-                    'variation': variation,
-                    'ending_cash': impact['ending_cash'],
-                    'total_profit': impact['total_profit'],
-                    'runway_days': impact['runway_days'],
-                })
-            
-            results[variable] = var_results
+            variations = DEFAULT_VARIATIONS
+        
+        base_data = self.base_data or self.simulator._get_base_data()
+        baseline = {
+            'starting_cash': float(base_data['starting_cash']),
+            'base_revenue': float(base_data['avg_monthly_revenue']),
+            'base_expenses': float(base_data['avg_monthly_expenses']),
+            'revenue_growth': REVENUE_GROWTH,
+            'expense_growth': EXPENSE_GROWTH,
+        }
         
-        return results
-    
-    def _test_variation(self, variable: str, variation_pct: float) -> Dict:
-        """Test a specific variation"""
-        # This would temporarily modify the scenario and run simulation
-        # For now, return mock data
-        simulator = ScenarioSimulator(self.scenario)
-        base_result = simulator.simulate()
+        # One row per variable plus an unperturbed row for the baseline
+        targets = np.array([SENSITIVITY_VARIABLES[variable] for variable in variables] + [None])[:, None]
+        scale = 1 + np.asarray(variations, dtype=float) / 100
+        inputs = {
+            name: value * np.where(targets == name, scale, 1.0)
+            for name, value in baseline.items()
+        }
+        projection = project(self.simulator.compiled, **inputs)
         
-        # Apply the variation impact
-        multiplier = 1 + (variation_pct / 100)
+        ending_cash = projection['cash'][..., -1]
+        total_profit = projection['profit'].sum(axis=-1)
+        runway = runway_days(projection['cash'], projection['expenses'])
         
-        if variable == 'revenue':
+        def metrics(row, column):
             return {
-                'ending_cash': base_result['ending_cash'] * multiplier,
-                'total_profit': base_result['total_profit'] * multiplier,
-                'runway_days': base_result['runway_days'],
+                'ending_cash': _money(ending_cash[row, column]),
+                'total_profit': _money(total_profit[row, column]),
+                'runway_days': None if np.isnan(runway[row, column]) else int(runway[row, column]),
             }
-        elif variable == 'expenses':
-            inverse_multiplier = 2 - multiplier  # Inverse effect
-            return {
-                'ending_cash': base_result['ending_cash'] * inverse_multiplier,
-                'total_profit': base_result['total_profit'] * inverse_multiplier,
-                'runway_days': int(base_result['runway_days'] * inverse_multiplier) if base_result['runway_days'] else None,
+        
+        low, high = int(np.argmin(variations)), int(np.argmax(variations))
+        tornado = [
+            {
+                'variable': variable,
+                'low': metrics(row, low),
+                'high': metrics(row, high),
+                'swing': _money(abs(ending_cash[row, high] - ending_cash[row, low])),
             }
+            for row, variable in enumerate(variables)
+        ]
+        tornado.sort(key=lambda bar: bar['swing'], reverse=True)
         
-        return base_result
+        return {
+            'base': metrics(-1, 0),
+            'variables': {
+                variable: [
+                    {'variation': variation, **metrics(row, column)}
+                    for column, variation in enumerate(variations)
+                ]
+                for row, variable in enumerate(variables)
+            },
+            'tornado': tornado,
+        }
 
 
 class BudgetCalculator:
@@ -279,35 +420,7 @@ class BudgetCalculator:
     @staticmethod
     def update_budget_actuals(budget):
         """Update actual amounts for all budget line items"""
-        from app.finance.models import Transaction
-        from django.db.models import Sum
-        
-        # Get transactions in budget period
-        transactions = Transaction.objects.filter(
-            organization=budget.organization,
-            date__gte=budget.start_date,
-            date__lte=budget.end_date
-        )
-        
-        # Update each line item
-        for line_item in budget.line_items.all():
-            # Get transactions matching this category
-            category_txns = transactions.filter(
-                category__icontains=line_item.category_name
-            )
-            
-            if line_item.department:
-                # Further filter by department if applicable
-                pass
-            
-            # Sum expenses (negative amounts)
-            actual_amount = abs(category_txns.filter(amount__lt=0).aggregate(
-                total=Sum('amount')
-            )['total'] or Decimal('0'))
-            
-            # Update line item
-            line_item.update_actuals(actual_amount)
-        
+        update_budget_actuals([budget])
         return budget
     
     @staticmethod
@@ -9,20 +9,13 @@ from decimal import Decimal
 @shared_task
 def update_budget_actuals():
     """Update actual amounts for all active budgets"""
+    from .actuals import update_budget_actuals as update_actuals
     from .models import Budget
-    from .simulator import BudgetCalculator
-    
-    active_budgets = Budget.objects.filter(is_active=True)
     
-    updated_count = 0
-    for budget in active_budgets:
-        try:
-            BudgetCalculator.update_budget_actuals(budget)
-            updated_count += 1
-        except Exception as e:
-            print(f"Error updating budget {budget.id}: {e}")
+    active_budgets = list(Budget.objects.filter(is_active=True).only('id', 'organization_id', 'start_date', 'end_date'))
+    changed = update_actuals(active_budgets)
     
-    return f"Updated {updated_count} budgets"
+    return f"Updated {len(active_budgets)} budgets ({changed} line items changed)"
 
 
 @shared_task
@@ -106,42 +99,61 @@ def update_goal_progress():
 
 @shared_task
 def run_scheduled_scenarios():
-    """Run simulations for scenarios that need updates"""
-    from .models import Scenario
-    from .simulator import ScenarioSimulator
+    """Re-simulate scenarios not run in 24 hours as parallel per-organization chunks"""
+    from celery import chord
     from datetime import timedelta
+    from django.conf import settings
+    from .scheduling import due_scenario_chunks
     
-    # Find scenarios that haven't been simulated in 24 hours
     cutoff = timezone.now() - timedelta(hours=24)
-    scenarios = Scenario.objects.filter(
-        is_active=True
-    ).filter(
-        last_simulated_at__lt=cutoff
-    ) | Scenario.objects.filter(
-        is_active=True,
-        last_simulated_at__isnull=True
-    )
-    
-    simulated_count = 0
-    for scenario in scenarios:
-        try:
-            simulator = ScenarioSimulator(scenario)
-            results = simulator.simulate()
-            
-            from .models import ScenarioResult
-            ScenarioResult.objects.create(
-                scenario=scenario,
-                **results
-            )
-            
-            scenario.last_simulated_at = timezone.now()
-            scenario.save()
-            
-            simulated_count += 1
-        except Exception as e:
-            print(f"Error simulating scenario {scenario.id}: {e}")
+    chunks = due_scenario_chunks(cutoff, settings.PLANNING_SCENARIO_CHUNK_SIZE)
+    
+    if not chunks:
+        return finalize_scheduled_scenarios([])
+    
+    chord(
+        simulate_scenario_chunk.s(organization_id, scenario_ids) for organization_id, scenario_ids in chunks
+    )(finalize_scheduled_scenarios.s())
+    
+    return f"Dispatched {len(chunks)} scenario chunks"
+
+
+@shared_task
+def simulate_scenario_chunk(organization_id, scenario_ids):
+    """Simulate one organization's chunk of scenarios and write the results in bulk"""
+    import logging
+    from .scheduling import fail_scenario_chunk, simulate_scenario_chunk as simulate_chunk
+    
+    try:
+        return simulate_chunk(organization_id, scenario_ids)
+    except Exception as e:
+        logging.getLogger(__name__).exception(
+            "Scenario chunk of %d scenarios for organization %s failed", len(scenario_ids), organization_id
+        )
+        return fail_scenario_chunk(organization_id, scenario_ids, str(e))
+
+
+@shared_task
+def finalize_scheduled_scenarios(chunk_results):
+    """Aggregate chunk summaries into the run's report; failures are logged with it"""
+    import logging
+    from .scheduling import summarize_chunks
+    
+    report = summarize_chunks(chunk_results)
+    if report['failed']:
+        logging.getLogger(__name__).warning("Scheduled scenario run had %d failures: %s", report['failed'], report['errors'])
+    
+    return report
+
+
+@shared_task
+def purge_scenario_results():
+    """Thin out old scenario results per the retention policy"""
+    from .retention import purge_scenario_results as purge
+    
+    deleted = purge()
     
-    return f"Simulated {simulated_count} scenarios"
+    return f"Purged {deleted} scenario results"
 
 
 @shared_task
@@ -15,9 +15,10 @@ from .models import (
 from .serializers import (
     ScenarioSerializer, ScenarioAdjustmentSerializer, ScenarioResultSerializer,
     BudgetSerializer, BudgetLineItemSerializer, GoalSerializer,
-    ScenarioComparisonSerializer
+    ScenarioComparisonSerializer, ScenarioSimulationSerializer
 )
-from .simulator import ScenarioSimulator, SensitivityAnalyzer, BudgetCalculator
+from .baseline import get_baseline
+from .simulator import ScenarioSimulator, SensitivityAnalyzer, BudgetCalculator, SENSITIVITY_VARIABLES
 
 
 class ScenarioViewSet(viewsets.ModelViewSet):
@@ -27,7 +28,7 @@ class ScenarioViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         org_id = self.kwargs.get('org_id')
-        return Scenario.objects.filter(organization_id=org_id).prefetch_related('adjustments', 'results')
+        return Scenario.objects.filter(organization_id=org_id).select_related('latest_result').prefetch_related('adjustments')
     
     def perform_create(self, serializer):
         org_id = self.kwargs.get('org_id')
@@ -38,13 +39,29 @@ class ScenarioViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['post'])
     def simulate(self, request, org_id=None, pk=None):
-        """Run simulation for this scenario"""
+        """
+        Run simulation for this scenario
+        
+        Body (optional): {"mode": "deterministic" | "monte_carlo", "paths": 10000, "seed": 42}
+        """
         scenario = self.get_object()
+        options = ScenarioSimulationSerializer(data=request.data)
+        options.is_valid(raise_exception=True)
         
         try:
             # Run simulation
             simulator = ScenarioSimulator(scenario)
-            results = simulator.simulate()
+            base_data = get_baseline(scenario.organization_id)
+            if options.validated_data['mode'] == 'monte_carlo':
+                results = simulator.simulate_monte_carlo(
+                    options.validated_data['paths'],
+                    seed=options.validated_data.get('seed'),
+                    base_data=base_data
+                )
+            else:
+                results = simulator.simulate(base_data)
+                # Lets the nightly run skip this scenario until its inputs change
+                results['input_fingerprint'] = simulator.fingerprint(base_data)
             
             # Save results
             result = ScenarioResult.objects.create(
@@ -54,6 +71,7 @@ class ScenarioViewSet(viewsets.ModelViewSet):
             
             # Update scenario
             scenario.last_simulated_at = timezone.now()
+            scenario.latest_result = result
             scenario.save()
             
             return Response({
@@ -73,17 +91,30 @@ class ScenarioViewSet(viewsets.ModelViewSet):
         """Perform sensitivity analysis on this scenario"""
         scenario = self.get_object()
         
-        # Get variables to test from query params
+        # Get variables and variations to test from query params
         variables = request.query_params.getlist('variables', ['revenue', 'expenses'])
+        unknown = [variable for variable in variables if variable not in SENSITIVITY_VARIABLES]
+        if unknown:
+            return Response({
+                'error': f"Unknown variables: {', '.join(unknown)}",
+                'variables': list(SENSITIVITY_VARIABLES)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            variations = [float(value) for value in request.query_params.getlist('variations')] or None
+        except ValueError:
+            return Response({'error': 'variations must be numbers'}, status=status.HTTP_400_BAD_REQUEST)
         
         try:
             analyzer = SensitivityAnalyzer(scenario)
-            results = analyzer.analyze(variables)
+            results = analyzer.analyze(variables, variations)
             
             return Response({
                 'success': True,
                 'scenario_name': scenario.name,
-                'analysis': results
+                'base': results['base'],
+                'analysis': results['variables'],
+                'tornado': results['tornado']
             })
         
         except Exception as e:
@@ -102,7 +133,7 @@ class ScenarioViewSet(viewsets.ModelViewSet):
         scenarios = Scenario.objects.filter(
             id__in=scenario_ids,
             organization_id=org_id
-        ).prefetch_related('results')
+        ).select_related('latest_result')
         
         if scenarios.count() != len(scenario_ids):
             return Response({
@@ -111,7 +142,7 @@ class ScenarioViewSet(viewsets.ModelViewSet):
         
         comparison_data = []
         for scenario in scenarios:
-            latest_result = scenario.results.first()
+            latest_result = scenario.latest_result
             comparison_data.append({
                 'id': str(scenario.id),
                 'name': scenario.name,
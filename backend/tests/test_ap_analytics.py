@@ -0,0 +1,96 @@
+"""
+Accounts payable analytics tests (Feature 4)
+"""
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+from app.users.models import Organization
+from app.billpay.models import Bill, Vendor
+from app.billpay.analytics import ap_aging, monthly_trend, refresh_vendor_metrics
+
+User = get_user_model()
+
+TODAY = date(2024, 6, 15)
+
+
+class APAnalyticsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test User'
+        )
+        self.org = Organization.objects.create(owner=self.user, name='Test Org')
+        self.vendor = Vendor.objects.create(organization=self.org, name='Acme Supplies')
+    
+    def make_bill(self, number, due_date, total, amount_paid='0.00', status='approved', paid_at=None):
+        return Bill.objects.create(
+            organization=self.org,
+            vendor=self.vendor,
+            bill_number=number,
+            bill_date=due_date - timedelta(days=30),
+            due_date=due_date,
+            subtotal=Decimal(total),
+            total_amount=Decimal(total),
+            amount_paid=Decimal(amount_paid),
+            status=status,
+            paid_at=paid_at
+        )
+    
+    def test_aging_buckets_and_trend(self):
+        """Remaining amounts land in days-past-due buckets in one query"""
+        self.make_bill('B-1', TODAY, '100.00')
+        self.make_bill('B-2', TODAY - timedelta(days=1), '200.00', amount_paid='50.00')
+        self.make_bill('B-3', TODAY - timedelta(days=45), '300.00', status='overdue')
+        self.make_bill('B-4', TODAY - timedelta(days=120), '400.00', status='overdue')
+        self.make_bill('B-5', TODAY - timedelta(days=10), '500.00', amount_paid='500.00', status='paid')
+        
+        with self.assertNumQueries(1):
+            aging = ap_aging(self.org.id, today=TODAY)
+        
+        self.assertEqual(aging, {
+            'current': Decimal('100.00'),
+            'days_1_30': Decimal('150.00'),
+            'days_31_60': Decimal('300.00'),
+            'days_61_90': Decimal('0.00'),
+            'days_over_90': Decimal('400.00'),
+        })
+        
+        trend = monthly_trend(self.org.id, today=TODAY)
+        self.assertEqual(len(trend), 12)
+        self.assertEqual(trend[-1], {'month': '2024-06', 'bills': 0, 'billed': Decimal('0.00'), 'paid': Decimal('0.00')})
+        self.assertEqual(trend[-2]['billed'], Decimal('800.00'))  # B-1, B-2 and B-5 are dated May
+    
+    def test_refresh_vendor_metrics(self):
+        """Vendor counters are recomputed from bills"""
+        on_time = datetime(2024, 5, 1, tzinfo=dt_timezone.utc)
+        self.make_bill('B-1', date(2024, 5, 10), '100.00', amount_paid='100.00', status='paid', paid_at=on_time)
+        self.make_bill('B-2', date(2024, 4, 10), '300.00', amount_paid='300.00', status='paid', paid_at=on_time)
+        self.make_bill('B-3', date(2024, 7, 10), '200.00')
+        
+        self.assertEqual(refresh_vendor_metrics(), 1)
+        
+        self.vendor.refresh_from_db()
+        self.assertEqual(self.vendor.total_paid, Decimal('400.00'))
+        self.assertEqual(self.vendor.total_bills, 3)
+        self.assertEqual(self.vendor.average_bill_amount, Decimal('200.00'))
+        self.assertEqual(self.vendor.on_time_payment_rate, Decimal('50.00'))
+        
+        # Nothing changed, nothing written
+        self.assertEqual(refresh_vendor_metrics(), 0)
+    
+    def test_spending_report_counts_paid_bills(self):
+        """last_12_months covers paid bills at their total amount"""
+        recent = date.today() - timedelta(days=30)
+        self.make_bill('B-1', recent, '100.00', amount_paid='100.00', status='paid')
+        self.make_bill('B-2', recent, '300.00', amount_paid='120.00')
+        
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.get(f'/api/orgs/{self.org.id}/billpay/vendors/{self.vendor.id}/spending_report/')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['last_12_months'], {'total_spent': 100.0, 'bill_count': 1})
@@ -0,0 +1,189 @@
+"""
+Bill approval routing tests (Feature 4)
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core import mail
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+from app.users.models import Organization
+from app.billpay.models import ApprovalRequest, ApprovalRule, ApprovalWorkflow, Bill, BillAuditLog, Vendor
+from app.billpay.approval_engine import decide_approvals, submit_bills_for_approval
+from app.billpay.transitions import APPROVAL_TRANSITIONS
+from app.core.transitions import run_transitions
+
+User = get_user_model()
+
+
+class BillApprovalRoutingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test User'
+        )
+        self.manager = User.objects.create_user(
+            email='manager@example.com',
+            password='testpass123',
+            name='Manager'
+        )
+        self.org = Organization.objects.create(owner=self.user, name='Test Org')
+        self.vendor = Vendor.objects.create(organization=self.org, name='Acme Supplies')
+        
+        self.workflow = ApprovalWorkflow.objects.create(organization=self.org, name='Standard', is_default=True)
+        self.rule = ApprovalRule.objects.create(
+            workflow=self.workflow,
+            condition_type='amount_gt',
+            condition_value='1000',
+            approval_type='sequential'
+        )
+        self.rule.approvers.add(self.user, self.manager)
+        
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+    
+    def make_bills(self, count, amount, start=0):
+        return Bill.objects.bulk_create([
+            Bill(
+                organization=self.org,
+                vendor=self.vendor,
+                bill_number=f'B-{start + index}',
+                bill_date=date(2024, 3, 1),
+                due_date=date(2024, 3, 1) + timedelta(days=30),
+                subtotal=amount,
+                total_amount=amount
+            )
+            for index in range(count)
+        ])
+    
+    def test_bulk_submit_uses_fixed_queries(self):
+        """Submitting more bills costs no more queries"""
+        few = [bill.id for bill in self.make_bills(2, Decimal('5000.00'))]
+        many = [bill.id for bill in self.make_bills(20, Decimal('5000.00'), start=100)]
+        
+        submit_bills_for_approval(self.org.id, few)
+        # Table is cached: savepoint, lock bills, revision, bulk insert, update, release
+        with self.assertNumQueries(6):
+            result = submit_bills_for_approval(self.org.id, many)
+        
+        self.assertEqual(len(result['pending_approval']), 20)
+        self.assertEqual(result['requests'], 40)
+        # Sequential rule: one approver per step
+        self.assertEqual(
+            sorted(ApprovalRequest.objects.filter(bill_id=many[0]).values_list('sequence', flat=True)),
+            [1, 2]
+        )
+    
+    def test_bulk_submit_endpoint(self):
+        """Bills below the threshold are approved, non-drafts are skipped"""
+        large, = self.make_bills(1, Decimal('5000.00'))
+        small, = self.make_bills(1, Decimal('50.00'), start=1)
+        paid, = self.make_bills(1, Decimal('5000.00'), start=2)
+        Bill.objects.filter(id=paid.id).update(status='paid')
+        
+        response = self.client.post(
+            f'/api/orgs/{self.org.id}/billpay/bills/submit-for-approval/',
+            {'bill_ids': [str(large.id), str(small.id), str(paid.id)]},
+            format='json'
+        )
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['pending_approval'], [str(large.id)])
+        self.assertEqual(response.data['approved'], [str(small.id)])
+        self.assertEqual(response.data['skipped'], [str(paid.id)])
+        self.assertEqual(Bill.objects.get(id=small.id).status, 'approved')
+    
+    def test_workflow_edit_invalidates_table(self):
+        """Changing a rule's approvers is picked up by the next submission"""
+        first, second = self.make_bills(2, Decimal('5000.00'))
+        submit_bills_for_approval(self.org.id, [first.id])
+        
+        self.rule.approvers.remove(self.manager)
+        result = submit_bills_for_approval(self.org.id, [second.id])
+        
+        self.assertEqual(result['requests'], 1)
+    
+    def test_escalation_follows_workflow_sla(self):
+        """Requests escalate on their workflow's deadline to its owner, one digest per recipient"""
+        ApprovalWorkflow.objects.filter(id=self.workflow.id).update(escalation_hours=4, created_by=self.manager)
+        bills = self.make_bills(2, Decimal('5000.00'))
+        submit_bills_for_approval(self.org.id, [bill.id for bill in bills])
+        
+        self.assertEqual(run_transitions(APPROVAL_TRANSITIONS, timezone.now() + timedelta(hours=3)), {'approval_escalated': 0})
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            counts = run_transitions(APPROVAL_TRANSITIONS, timezone.now() + timedelta(hours=5))
+        
+        self.assertEqual(counts, {'approval_escalated': 4})
+        # The workflow owner can't be escalated to themselves; theirs go to the org owner
+        routed = set(ApprovalRequest.objects.values_list('approver__email', 'escalated_to__email'))
+        self.assertEqual(routed, {('test@example.com', 'manager@example.com'), ('manager@example.com', 'test@example.com')})
+        
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['manager@example.com', 'test@example.com'])
+        self.assertIn('B-0', mail.outbox[0].body)
+        self.assertIn('B-1', mail.outbox[0].body)
+    
+    def test_bulk_decisions(self):
+        """One call records every decision; bills approve once nothing is open"""
+        bills = self.make_bills(4, Decimal('5000.00'))
+        submit_bills_for_approval(self.org.id, [bill.id for bill in bills])
+        decide_approvals(self.org.id, self.user, {bills[0].id: 'approve'})
+        
+        self.client.force_authenticate(user=self.manager)
+        with self.assertNumQueries(9):
+            response = self.client.post(
+                f'/api/orgs/{self.org.id}/billpay/bills/decide/',
+                {
+                    'decisions': [
+                        {'bill_id': str(bills[0].id), 'decision': 'approve'},
+                        {'bill_id': str(bills[1].id), 'decision': 'approve'},
+                        {'bill_id': str(bills[2].id), 'decision': 'reject'},
+                    ],
+                    'comments': 'Reviewed'
+                },
+                format='json'
+            )
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['approved'], [str(bills[0].id)])
+        self.assertEqual(response.data['rejected'], [str(bills[2].id)])
+        self.assertEqual(response.data['pending'], {str(bills[1].id): 1})
+        self.assertEqual(
+            dict(Bill.objects.values_list('bill_number', 'status')),
+            {'B-0': 'approved', 'B-1': 'pending_approval', 'B-2': 'rejected', 'B-3': 'pending_approval'}
+        )
+        self.assertEqual(BillAuditLog.objects.filter(performed_by=self.manager).count(), 3)
+    
+    def test_escalation_target_can_decide(self):
+        """Requests escalated to someone else are theirs to decide"""
+        outsider = User.objects.create_user(email='cfo@example.com', password='testpass123', name='CFO')
+        bill, = self.make_bills(1, Decimal('5000.00'))
+        submit_bills_for_approval(self.org.id, [bill.id])
+        ApprovalRequest.objects.update(status='escalated', escalated_to=outsider)
+        
+        result = decide_approvals(self.org.id, outsider, {bill.id: 'approve'})
+        
+        self.assertEqual(result['approved'], [bill.id])
+        self.assertEqual(Bill.objects.get(id=bill.id).status, 'approved')
+    
+    def test_approval_after_rejection_does_not_approve(self):
+        """Once one approver rejects, a later approval leaves the bill rejected"""
+        ApprovalRule.objects.filter(id=self.rule.id).update(approval_type='parallel')
+        bill, = self.make_bills(1, Decimal('5000.00'))
+        submit_bills_for_approval(self.org.id, [bill.id])
+        
+        self.assertEqual(decide_approvals(self.org.id, self.user, {bill.id: 'reject'})['rejected'], [bill.id])
+        result = decide_approvals(self.org.id, self.manager, {bill.id: 'approve'})
+        
+        self.assertEqual(result, {'approved': [], 'rejected': [], 'pending': {}})
+        self.assertEqual(Bill.objects.get(id=bill.id).status, 'rejected')
+        
+        # Even a bill put back in pending_approval stays unapproved while a rejection stands
+        Bill.objects.filter(id=bill.id).update(status='pending_approval')
+        result = decide_approvals(self.org.id, self.manager, {bill.id: 'approve'})
+        self.assertEqual((result['approved'], Bill.objects.get(id=bill.id).status), ([], 'pending_approval'))
@@ -0,0 +1,72 @@
+"""
+Budget actuals tests
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from app.users.models import Organization
+from app.api.models import Transaction
+from app.planning.actuals import update_budget_actuals
+from app.planning.models import Budget, BudgetCategoryMapping, BudgetLineItem
+
+User = get_user_model()
+
+
+class BudgetActualsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test User'
+        )
+        self.orgs = [
+            Organization.objects.create(owner=self.user, name=f'Org {index}') for index in range(2)
+        ]
+
+    def add_budget(self, org, start_date, end_date, **line_items):
+        budget = Budget.objects.create(
+            organization=org, name='Budget', start_date=start_date, end_date=end_date, created_by=self.user
+        )
+        for category_name, amount in line_items.items():
+            budget.line_items.create(category_name=category_name, budgeted_amount=Decimal(amount))
+        return budget
+
+    def spend(self, org, day, amount, category):
+        Transaction.objects.create(org=org, date=day, amount=Decimal(amount), category=category, description=category)
+
+    def test_actuals_use_exact_or_mapped_categories(self):
+        """All budgets are updated from one aggregate per period; categories never match by substring"""
+        first, second = self.orgs
+        q1 = [self.add_budget(org, date(2024, 1, 1), date(2024, 3, 31), Software='1000', Travel='500') for org in self.orgs]
+        april = self.add_budget(first, date(2024, 4, 1), date(2024, 4, 30), Software='100')
+        BudgetCategoryMapping.objects.create(organization=first, transaction_category='SaaS', category_name='Software')
+
+        self.spend(first, date(2024, 1, 5), '-300', 'Software')
+        self.spend(first, date(2024, 2, 5), '-200', 'SaaS')
+        self.spend(first, date(2024, 2, 6), '-900', 'Software Licenses')
+        self.spend(first, date(2024, 2, 7), '5000', 'Software')
+        self.spend(first, date(2024, 4, 2), '-250', 'Software')
+        self.spend(second, date(2024, 3, 1), '-700', 'Travel')
+        self.spend(second, date(2024, 3, 2), '-50', 'SaaS')
+
+        # Mappings, two period aggregates, line items and one bulk_update
+        with self.assertNumQueries(5):
+            self.assertEqual(update_budget_actuals(q1 + [april]), 5)
+
+        actuals = {
+            (item.budget_id, item.category_name): item
+            for item in BudgetLineItem.objects.all()
+        }
+        software = actuals[(q1[0].id, 'Software')]
+        self.assertEqual(software.actual_amount, Decimal('500'))
+        self.assertEqual(software.variance_amount, Decimal('-500'))
+        self.assertEqual(software.variance_percent, Decimal('-50'))
+        self.assertEqual(actuals[(q1[0].id, 'Travel')].actual_amount, 0)
+        self.assertEqual(actuals[(q1[1].id, 'Software')].actual_amount, 0)
+        self.assertEqual(actuals[(q1[1].id, 'Travel')].actual_amount, Decimal('700'))
+        self.assertEqual(actuals[(april.id, 'Software')].variance_percent, Decimal('150'))
+
+        with self.assertNumQueries(4):
+            self.assertEqual(update_budget_actuals(q1 + [april]), 0)
@@ -0,0 +1,109 @@
+"""
+Duplicate bill detection tests (Feature 4)
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+from app.users.models import Organization
+from app.billpay.models import Bill, RecurringSchedule, Vendor
+from app.billpay.duplicates import backscan_duplicates, normalize_bill_number
+from app.billpay.tasks import generate_recurring_bills
+
+User = get_user_model()
+
+
+class DuplicateBillTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test User'
+        )
+        self.org = Organization.objects.create(owner=self.user, name='Test Org')
+        self.vendor = Vendor.objects.create(organization=self.org, name='Acme Supplies')
+        
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = f'/api/orgs/{self.org.id}/billpay/bills/'
+    
+    def bill_data(self, number, amount, bill_date=date(2024, 3, 1)):
+        return {
+            'vendor': str(self.vendor.id),
+            'bill_number': number,
+            'bill_date': bill_date.isoformat(),
+            'due_date': (bill_date + timedelta(days=30)).isoformat(),
+            'subtotal': amount,
+            'total_amount': amount,
+        }
+    
+    def test_normalize_bill_number(self):
+        for raw in ['INV-00123', 'Invoice #123', 'inv 123', '123', 'No. 0123']:
+            self.assertEqual(normalize_bill_number(raw), '123', raw)
+        self.assertEqual(normalize_bill_number('NORTH-7'), 'NORTH7')
+    
+    def test_duplicates_are_flagged_on_write_and_blocked_from_approval(self):
+        """Same number in another format, or an unnumbered bill of the same amount days apart, is flagged"""
+        original = self.client.post(self.url, self.bill_data('INV-00123', '500.00'), format='json').data
+        renumbered = self.client.post(self.url, self.bill_data('Invoice #123', '480.00'), format='json').data
+        other_number = self.client.post(
+            self.url, self.bill_data('A-77', '500.00', date(2024, 3, 4)), format='json'
+        ).data
+        unnumbered = self.client.post(self.url, self.bill_data('#', '500.00', date(2024, 3, 3)), format='json').data
+        weekly = self.client.post(self.url, self.bill_data('A-78', '500.00', date(2024, 4, 1)), format='json').data
+        week_later = self.client.post(self.url, self.bill_data('-', '500.00', date(2024, 4, 8)), format='json').data
+        
+        self.assertIsNone(original['duplicate_of'])
+        self.assertEqual(str(renumbered['duplicate_of']), original['id'])
+        self.assertIsNone(other_number['duplicate_of'])
+        self.assertEqual(str(unnumbered['duplicate_of']), original['id'])
+        self.assertIsNone(weekly['duplicate_of'])
+        self.assertIsNone(week_later['duplicate_of'])
+        self.assertEqual(backscan_duplicates(Bill.objects.all()), [])
+        
+        response = self.client.post(f"{self.url}{renumbered['id']}/submit_for_approval/")
+        self.assertEqual(response.status_code, 400)
+        
+        self.client.post(f"{self.url}{renumbered['id']}/dismiss_duplicate/")
+        response = self.client.post(f"{self.url}{renumbered['id']}/submit_for_approval/")
+        self.assertEqual(response.status_code, 200)
+    
+    def test_backscan(self):
+        """Existing bills are normalized and flagged in bulk"""
+        first, second, third = [
+            Bill.objects.create(
+                organization=self.org, vendor=self.vendor, bill_number=number,
+                bill_date=date(2024, 3, 1), due_date=date(2024, 3, 31),
+                subtotal=Decimal(amount), total_amount=Decimal(amount)
+            )
+            for number, amount in [('INV-9', '10.00'), ('9', '12.00'), ('X-1', '99.00')]
+        ]
+        
+        self.assertEqual(backscan_duplicates(Bill.objects.all()), [(second.id, first.id)])
+        self.assertEqual(Bill.objects.get(id=third.id).normalized_bill_number, 'X1')
+        self.assertEqual(backscan_duplicates(Bill.objects.all()), [])
+    
+    def test_real_bills_supersede_recurring_placeholders(self):
+        """A generated draft is never the original: the real bill wins in either order"""
+        schedule = RecurringSchedule.objects.create(
+            organization=self.org, vendor=self.vendor, name='Hosting', frequency='monthly',
+            start_date=date(2024, 3, 1), expected_amount=Decimal('99.00')
+        )
+        generate_recurring_bills(run_date='2024-03-01')
+        placeholder = Bill.objects.get(recurring_schedule=schedule)
+        
+        real = self.client.post(self.url, self.bill_data('H-301', '99.00', date(2024, 3, 2)), format='json').data
+        
+        self.assertIsNone(real['duplicate_of'])
+        self.assertEqual(str(Bill.objects.get(id=placeholder.id).duplicate_of_id), real['id'])
+        self.assertEqual(self.client.post(f"{self.url}{real['id']}/submit_for_approval/").status_code, 200)
+        
+        # The next cycle's real bill arrives before the generator runs
+        april = self.client.post(self.url, self.bill_data('H-401', '99.00', date(2024, 3, 30)), format='json').data
+        generate_recurring_bills(run_date='2024-04-01')
+        
+        generated = Bill.objects.get(recurring_schedule=schedule, bill_date=date(2024, 4, 1))
+        self.assertEqual(str(generated.duplicate_of_id), april['id'])
+        self.assertEqual(backscan_duplicates(Bill.objects.all()), [])
@@ -0,0 +1,81 @@
+"""
+Invoice PDF rendering tests (Feature 1)
+"""
+import shutil
+import tempfile
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from app.users.models import Organization
+from app.invoices.models import Customer, Invoice, InvoiceLineItem
+from app.invoices import pdf_renderer
+
+User = get_user_model()
+
+
+class InvoicePDFTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test User'
+        )
+        self.org = Organization.objects.create(owner=self.user, name='Test Org')
+        self.customer = Customer.objects.create(
+            organization=self.org,
+            name='Test Customer',
+            email='customer@test.com'
+        )
+        self.invoice = Invoice.objects.create(
+            organization=self.org,
+            customer=self.customer,
+            invoice_number='INV-001',
+            issue_date=date(2024, 1, 1),
+            due_date=date(2024, 1, 31),
+            subtotal=Decimal('150.00'),
+            total_amount=Decimal('150.00'),
+            status='sent'
+        )
+        self.line_item = InvoiceLineItem.objects.create(
+            invoice=self.invoice,
+            description='Consulting',
+            quantity=Decimal('3.00'),
+            unit_price=Decimal('50.00'),
+            amount=Decimal('150.00')
+        )
+
+    def test_render_produces_pdf(self):
+        """Rendered output is a PDF document"""
+        pdf = pdf_renderer.render_invoice_pdf(self.invoice)
+        self.assertTrue(pdf.startswith(b'%PDF'))
+
+    def test_unchanged_invoice_is_served_from_cache(self):
+        """A second request for the same invoice state does not re-render"""
+        with mock.patch.object(
+            pdf_renderer, 'render_invoice_pdf', wraps=pdf_renderer.render_invoice_pdf
+        ) as render:
+            first_path, first_pdf = pdf_renderer.get_invoice_pdf(self.invoice)
+            second_path, second_pdf = pdf_renderer.get_invoice_pdf(self.invoice)
+
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(first_path, second_path)
+        self.assertEqual(first_pdf, second_pdf)
+
+    def test_line_item_change_invalidates_cache(self):
+        """Editing a line item moves the invoice to a new cache key"""
+        before = pdf_renderer.invoice_content_hash(self.invoice)
+
+        self.line_item.description = 'Consulting (revised)'
+        self.line_item.save()
+
+        after = pdf_renderer.invoice_content_hash(self.invoice)
+        self.assertNotEqual(before, after)
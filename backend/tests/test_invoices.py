@@ -1,11 +1,25 @@
 """
 Integration tests for Invoice Management (Feature 1)
 """
+from unittest import mock
+
 import pytest
 from django.test import TestCase, Client
 from django.contrib.auth import get_user_model
 from app.users.models import Organization
-from app.invoices.models import Customer, Invoice
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from app.invoices.models import (
+    Customer, Invoice, InvoiceLineItem, InvoiceNumberSequence, RecurringInvoice
+)
+from app.invoices.analytics import customer_payment_history, refresh_customer_payment_metrics
+from app.invoices.balances import reconcile_customer_balances
+from app.invoices.bulk import bulk_create_invoices
+from app.invoices.numbering import allocate_invoice_numbers
+from app.invoices.serializers import InvoiceNumberSequenceSerializer, InvoiceSerializer
+from app.invoices.tasks import generate_recurring_invoices
+from datetime import date, datetime, timedelta, timezone as dt_timezone
 from decimal import Decimal
 
 User = get_user_model()
@@ -48,5 +62,395 @@ class InvoiceIntegrationTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn('aging_buckets', response.json())
 
+
+class InvoiceNumberingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test User'
+        )
+        self.org = Organization.objects.create(
+            owner=self.user,
+            name='Test Org'
+        )
+        self.customer = Customer.objects.create(
+            organization=self.org,
+            name='Test Customer',
+            email='customer@test.com'
+        )
+    
+    def test_blocks_are_consecutive(self):
+        """Single and block allocations continue one sequence without gaps"""
+        self.assertEqual(allocate_invoice_numbers(self.org.id), ['1001'])
+        self.assertEqual(allocate_invoice_numbers(self.org.id, count=3), ['1002', '1003', '1004'])
+        self.assertEqual(allocate_invoice_numbers(self.org.id), ['1005'])
+    
+    def test_prefix_and_padding(self):
+        """Numbers use the organization's prefix and zero padding"""
+        InvoiceNumberSequence.objects.create(
+            organization=self.org, prefix='INV-', padding=6, next_number=42
+        )
+        self.assertEqual(allocate_invoice_numbers(self.org.id, count=2), ['INV-000042', 'INV-000043'])
+    
+    def test_sequence_continues_existing_numbers(self):
+        """A new sequence starts after the highest numeric number already issued"""
+        for number in ['1500', '998', 'LEGACY-7']:
+            Invoice.objects.create(
+                organization=self.org,
+                customer=self.customer,
+                invoice_number=number,
+                issue_date=date(2024, 1, 1),
+                due_date=date(2024, 1, 31),
+                subtotal=Decimal('100.00'),
+                total_amount=Decimal('100.00')
+            )
+        self.assertEqual(allocate_invoice_numbers(self.org.id), ['1501'])
+
+    def test_settings_update_keeps_counter(self):
+        """Editing prefix and padding never writes next_number; the sequence can't be created or deleted"""
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        url = f'/api/orgs/{self.org.id}/invoices/invoice-numbering/'
+        allocate_invoice_numbers(self.org.id)
+        sequence = InvoiceNumberSequence.objects.get()
+        
+        def allocate_during_request(attrs):
+            # An invoice numbered after the view read the sequence
+            allocate_invoice_numbers(self.org.id)
+            return attrs
+        
+        with mock.patch.object(InvoiceNumberSequenceSerializer, 'validate', side_effect=allocate_during_request):
+            response = client.patch(f'{url}{sequence.id}/', {'prefix': 'INV-', 'next_number': 1}, format='json')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['next_invoice_number'], 'INV-1003')
+        self.assertEqual(allocate_invoice_numbers(self.org.id), ['INV-1003'])
+        self.assertEqual(client.post(url, {'prefix': 'X-'}, format='json').status_code, 405)
+        self.assertEqual(client.delete(f'{url}{sequence.id}/').status_code, 405)
+
+
+class BulkInvoiceTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test User'
+        )
+        self.org = Organization.objects.create(
+            owner=self.user,
+            name='Test Org'
+        )
+        self.customer = Customer.objects.create(
+            organization=self.org,
+            name='Test Customer',
+            email='customer@test.com'
+        )
+        self.client.force_authenticate(self.user)
+    
+    def test_bulk_create_invoices(self):
+        """Invoices and line items are created in one request with consecutive numbers"""
+        payload = {'invoices': [
+            {
+                'customer': str(self.customer.id),
+                'issue_date': '2024-01-01',
+                'due_date': '2024-01-31',
+                'subtotal': '100.00',
+                'total_amount': '100.00',
+                'line_items': [
+                    {'description': 'Retainer', 'quantity': '1.00', 'unit_price': '100.00'}
+                ],
+            }
+            for _ in range(3)
+        ]}
+        response = self.client.post(
+            f'/api/orgs/{self.org.id}/invoices/invoices/bulk/', payload, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [invoice['invoice_number'] for invoice in response.json()['invoices']],
+            ['1001', '1002', '1003']
+        )
+        self.assertEqual(InvoiceLineItem.objects.filter(invoice__organization=self.org).count(), 3)
+    
+    def test_bulk_create_rejects_foreign_customer(self):
+        """Customers from another organization fail validation"""
+        other_org = Organization.objects.create(owner=self.user, name='Other Org')
+        other_customer = Customer.objects.create(
+            organization=other_org, name='Other', email='other@test.com'
+        )
+        response = self.client.post(f'/api/orgs/{self.org.id}/invoices/invoices/bulk/', {'invoices': [{
+            'customer': str(other_customer.id),
+            'issue_date': '2024-01-01',
+            'due_date': '2024-01-31',
+            'subtotal': '100.00',
+            'total_amount': '100.00',
+        }]}, format='json')
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Invoice.objects.exists())
+    
+    def test_recurring_invoices_bill_each_cycle_once(self):
+        """The generator issues each due cycle once and advances the template"""
+        template = RecurringInvoice.objects.create(
+            organization=self.org,
+            customer=self.customer,
+            frequency='monthly',
+            next_issue_date=date(2024, 1, 31),
+            tax_rate=Decimal('10.00'),
+            line_items=[{'description': 'Hosting', 'quantity': '2', 'unit_price': '25.00'}]
+        )
+        
+        generate_recurring_invoices('2024-02-15')
+        generate_recurring_invoices('2024-02-15')
+        
+        invoice = Invoice.objects.get(organization=self.org)
+        self.assertEqual(invoice.issue_date, date(2024, 1, 31))
+        self.assertEqual(invoice.due_date, date(2024, 3, 1))
+        self.assertEqual(invoice.total_amount, Decimal('55.00'))
+        self.assertEqual(invoice.line_items.count(), 1)
+        
+        template.refresh_from_db()
+        self.assertEqual(template.next_issue_date, date(2024, 2, 29))
+        self.assertEqual(template.invoices_generated, 1)
+
+
+class InvoiceLineItemUpdateTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test User'
+        )
+        self.org = Organization.objects.create(
+            owner=self.user,
+            name='Test Org'
+        )
+        self.customer = Customer.objects.create(
+            organization=self.org,
+            name='Test Customer',
+            email='customer@test.com'
+        )
+        self.invoice = Invoice.objects.create(
+            organization=self.org,
+            customer=self.customer,
+            invoice_number='INV-001',
+            issue_date=date(2024, 1, 1),
+            due_date=date(2024, 1, 31),
+            subtotal=Decimal('2000.00'),
+            tax_rate=Decimal('10.00'),
+            total_amount=Decimal('2200.00')
+        )
+        InvoiceLineItem.objects.bulk_create([
+            InvoiceLineItem(
+                invoice=self.invoice,
+                description=f'Line {n}',
+                quantity=Decimal('1.00'),
+                unit_price=Decimal('10.00'),
+                amount=Decimal('10.00'),
+                sort_order=n
+            )
+            for n in range(200)
+        ])
+    
+    def test_edit_one_line_keeps_ids_and_recomputes_totals(self):
+        """Editing one line updates that row only, removes dropped rows and adds new ones"""
+        items = list(self.invoice.line_items.all())
+        payload = [
+            {
+                'id': str(item.id),
+                'description': item.description,
+                'quantity': '1.00',
+                'unit_price': '10.00',
+                'sort_order': item.sort_order,
+            }
+            for item in items[:-1]
+        ]
+        payload[0]['quantity'] = '3.00'
+        payload.append({'description': 'New line', 'quantity': '2.00', 'unit_price': '5.00', 'sort_order': 999})
+        
+        serializer = InvoiceSerializer(self.invoice, data={'line_items': payload}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        with CaptureQueriesContext(connection) as queries:
+            serializer.save()
+        
+        self.assertLessEqual(len(queries), 10)
+        remaining_ids = set(self.invoice.line_items.values_list('id', flat=True))
+        self.assertTrue({item.id for item in items[:-1]} <= remaining_ids)
+        self.assertNotIn(items[-1].id, remaining_ids)
+        self.assertEqual(len(remaining_ids), 200)
+        
+        self.invoice.refresh_from_db()
+        self.assertEqual(InvoiceLineItem.objects.get(id=items[0].id).amount, Decimal('30.00'))
+        self.assertEqual(self.invoice.subtotal, Decimal('2020.00'))
+        self.assertEqual(self.invoice.total_amount, Decimal('2222.00'))
+    
+    def test_removing_every_line_zeroes_totals(self):
+        """An empty line_items list clears the lines and the totals derived from them"""
+        serializer = InvoiceSerializer(self.invoice, data={'line_items': []}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        
+        self.invoice.refresh_from_db()
+        self.assertFalse(self.invoice.line_items.exists())
+        self.assertEqual((self.invoice.subtotal, self.invoice.total_amount), (Decimal('0.00'), Decimal('0.00')))
+    
+    def test_amounts_round_to_cents_and_unchanged_lines_are_not_rewritten(self):
+        """Line amounts and totals are rounded to cents, so re-sending a line issues no UPDATE"""
+        payload = [
+            {
+                'id': str(item.id),
+                'description': item.description,
+                'quantity': str(item.quantity),
+                'unit_price': str(item.unit_price),
+                'sort_order': item.sort_order,
+            }
+            for item in self.invoice.line_items.all()
+        ]
+        payload[0].update(quantity='1.50', unit_price='3.33')
+        
+        serializer = InvoiceSerializer(self.invoice, data={'line_items': payload}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.assertEqual(
+            (serializer.data['subtotal'], serializer.data['tax_amount'], serializer.data['total_amount']),
+            ('1995.00', '199.50', '2194.50')
+        )
+        
+        self.invoice.refresh_from_db()
+        serializer = InvoiceSerializer(self.invoice, data={'line_items': payload}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        with CaptureQueriesContext(connection) as queries:
+            serializer.save()
+        
+        line_item_table = InvoiceLineItem._meta.db_table
+        self.assertFalse([
+            query['sql'] for query in queries
+            if query['sql'].startswith('UPDATE') and line_item_table in query['sql']
+        ])
+        self.assertEqual(InvoiceLineItem.objects.get(id=payload[0]['id']).amount, Decimal('5.00'))
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.total_amount, Decimal('2194.50'))
+
+
+class CustomerBalanceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test User'
+        )
+        self.org = Organization.objects.create(
+            owner=self.user,
+            name='Test Org'
+        )
+        self.customer = Customer.objects.create(
+            organization=self.org,
+            name='Test Customer',
+            email='customer@test.com'
+        )
+        self.invoices = bulk_create_invoices(self.org.id, [
+            {
+                'customer_id': self.customer.id,
+                'issue_date': date(2024, 1, 1),
+                'due_date': date(2024, 1, 31),
+                'subtotal': Decimal('100.00'),
+                'total_amount': Decimal('100.00'),
+                'status': 'sent',
+            }
+            for _ in range(2)
+        ])
+    
+    def assertBalances(self, invoiced, paid, outstanding):
+        self.customer.refresh_from_db()
+        self.assertEqual(
+            (self.customer.total_invoiced, self.customer.total_paid, self.customer.outstanding_balance),
+            (Decimal(invoiced), Decimal(paid), Decimal(outstanding))
+        )
+    
+    def test_counters_follow_payments_and_refunds(self):
+        """Creating, paying and refunding invoices keeps the counters in step"""
+        self.assertBalances('200.00', '0.00', '200.00')
+        
+        with transaction.atomic():
+            self.invoices[0].apply_payment(Decimal('100.00'))
+        self.assertBalances('200.00', '100.00', '100.00')
+        
+        with transaction.atomic():
+            self.invoices[0].apply_payment(Decimal('-100.00'))
+        self.assertBalances('200.00', '0.00', '200.00')
+        self.invoices[0].refresh_from_db()
+        self.assertEqual(self.invoices[0].status, 'sent')
+    
+    def test_reconcile_repairs_drift(self):
+        """Drifted counters are detected and recomputed from invoices"""
+        Customer.objects.filter(id=self.customer.id).update(total_invoiced=0, outstanding_balance=5)
+        
+        drifted = reconcile_customer_balances(Customer.objects.all())
+        
+        self.assertEqual([customer_id for customer_id, _, _ in drifted], [self.customer.id])
+        self.assertBalances('200.00', '0.00', '200.00')
+        self.assertEqual(reconcile_customer_balances(Customer.objects.all()), [])
+
+
+class CustomerPaymentHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test User'
+        )
+        self.org = Organization.objects.create(
+            owner=self.user,
+            name='Test Org'
+        )
+        self.customer = Customer.objects.create(
+            organization=self.org,
+            name='Test Customer',
+            email='customer@test.com'
+        )
+        # (issue date, status, paid on): one on time, one 40 days late, one overdue
+        for number, (issue_date, status, paid_on) in enumerate([
+            (date(2024, 1, 1), 'paid', date(2024, 1, 21)),
+            (date(2024, 1, 15), 'paid', date(2024, 3, 25)),
+            (date(2024, 2, 1), 'overdue', None),
+        ]):
+            Invoice.objects.create(
+                organization=self.org,
+                customer=self.customer,
+                invoice_number=f'INV-{number}',
+                issue_date=issue_date,
+                due_date=issue_date + timedelta(days=30),
+                subtotal=Decimal('100.00'),
+                total_amount=Decimal('100.00'),
+                status=status,
+                paid_at=datetime(paid_on.year, paid_on.month, paid_on.day, 12, tzinfo=dt_timezone.utc) if paid_on else None
+            )
+    
+    def test_history_from_one_query(self):
+        """Metrics and the monthly histogram come from a single query"""
+        with self.assertNumQueries(1):
+            history = customer_payment_history(self.customer)
+        
+        self.assertEqual(history['metrics']['total_invoices'], 3)
+        self.assertEqual(history['metrics']['paid_invoices'], 2)
+        self.assertEqual(history['metrics']['overdue_invoices'], 1)
+        self.assertEqual(history['metrics']['average_days_to_pay'], 45.0)
+        
+        january, february = history['monthly_payment_timing']
+        self.assertEqual(january['month'], '2024-01')
+        self.assertEqual((january['on_time'], january['late_31_60']), (1, 1))
+        self.assertEqual((february['invoices'], february['paid']), (1, 0))
+    
+    def test_refresh_customer_payment_metrics(self):
+        """The weekly task's scores come from the shared analytics"""
+        self.assertEqual(refresh_customer_payment_metrics(), 1)
+        
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.average_days_to_pay, 45)
+        # 50% on time, 45 days average: 0.6 * 50 + 0.4 * 70
+        self.assertEqual(self.customer.payment_reliability_score, Decimal('58.00'))
+
 # Add more tests...
 
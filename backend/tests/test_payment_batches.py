@@ -0,0 +1,197 @@
+"""
+Payment batch execution and payment scheduling tests (Feature 4)
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from django.contrib.auth import get_user_model
+from app.users.models import Organization
+from app.billpay.models import Bill, BillPayment, PaymentBatch, Vendor
+from app.billpay.payment_rails import LocalPaymentRail, RailResult
+from app.billpay.payments import reconcile_payments
+from app.billpay.tasks import process_payment_batch
+
+User = get_user_model()
+
+
+class DecliningRail(LocalPaymentRail):
+    """Declines payments of exactly 13.00"""
+    
+    def send_payments(self, payments):
+        return [
+            RailResult(payment.id, False, error='Declined') if payment.amount == Decimal('13.00') else result
+            for payment, result in zip(payments, super().send_payments(payments))
+        ]
+
+
+class LostResponseRail(LocalPaymentRail):
+    """Pays, then loses the response while `lost` is set; remembers every key it was sent"""
+    
+    lost = True
+    keys = []
+    
+    def send_payments(self, payments):
+        LostResponseRail.keys.extend(self.idempotency_key(payment) for payment in payments)
+        results = super().send_payments(payments)
+        if LostResponseRail.lost:
+            raise ConnectionError('Connection reset')
+        return results
+
+
+@override_settings(BILL_PAYMENT_CHUNK_SIZE=2)
+class PaymentBatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test User'
+        )
+        self.org = Organization.objects.create(owner=self.user, name='Test Org')
+        self.vendor = Vendor.objects.create(organization=self.org, name='Acme Supplies')
+        self.batch = PaymentBatch.objects.create(
+            organization=self.org, name='March run', batch_date=date(2024, 3, 1), status='processing'
+        )
+    
+    def make_payment(self, number, total, amount):
+        bill = Bill.objects.create(
+            organization=self.org,
+            vendor=self.vendor,
+            bill_number=number,
+            bill_date=date(2024, 2, 1),
+            due_date=date(2024, 2, 1) + timedelta(days=30),
+            subtotal=total,
+            total_amount=total,
+            status='scheduled'
+        )
+        return BillPayment.objects.create(
+            bill=bill, batch=self.batch, amount=amount, payment_date=date(2024, 3, 1), payment_method='ach'
+        )
+    
+    def test_chunks_are_aggregated_into_batch_results(self):
+        """Every chunk settles; bills are marked paid or partially paid"""
+        full = self.make_payment('B-1', Decimal('100.00'), Decimal('100.00'))
+        partial = self.make_payment('B-2', Decimal('100.00'), Decimal('40.00'))
+        self.make_payment('B-3', Decimal('25.00'), Decimal('25.00'))
+        
+        process_payment_batch(str(self.batch.id))
+        
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.status, 'completed')
+        self.assertEqual(self.batch.processing_results['chunks'], 2)
+        self.assertEqual(self.batch.processing_results['success'], 3)
+        self.assertEqual(self.batch.processing_results['amount_paid'], '165.00')
+        
+        full.bill.refresh_from_db()
+        partial.bill.refresh_from_db()
+        self.assertEqual(full.bill.status, 'paid')
+        self.assertIsNotNone(full.bill.paid_at)
+        self.assertEqual((partial.bill.status, partial.bill.amount_paid), ('scheduled', Decimal('40.00')))
+    
+    @override_settings(BILL_PAYMENT_RAIL='tests.test_payment_batches.DecliningRail')
+    def test_declined_payments_fail_without_touching_bills(self):
+        """A declined payment fails alone and leaves its bill unpaid"""
+        declined = self.make_payment('B-1', Decimal('13.00'), Decimal('13.00'))
+        self.make_payment('B-2', Decimal('20.00'), Decimal('20.00'))
+        
+        process_payment_batch(str(self.batch.id))
+        
+        self.batch.refresh_from_db()
+        declined.refresh_from_db()
+        declined.bill.refresh_from_db()
+        self.assertEqual(self.batch.status, 'failed')
+        self.assertEqual(
+            (self.batch.processing_results['success'], self.batch.processing_results['failed']), (1, 1)
+        )
+        self.assertEqual(self.batch.processing_results['errors'], [{'payment_id': str(declined.id), 'error': 'Declined'}])
+        self.assertEqual(declined.status, 'failed')
+        self.assertEqual(declined.bill.amount_paid, Decimal('0.00'))
+
+    @override_settings(BILL_PAYMENT_RAIL='tests.test_payment_batches.LostResponseRail')
+    def test_unsettled_payments_are_reconciled_not_failed(self):
+        """Payments the rail may have paid stay processing, are never resent by a rerun and settle once"""
+        payment = self.make_payment('B-1', Decimal('50.00'), Decimal('50.00'))
+        LostResponseRail.lost, LostResponseRail.keys = True, []
+        
+        with self.assertLogs('app.billpay', level='ERROR'):
+            process_payment_batch(str(self.batch.id))
+        process_payment_batch(str(self.batch.id))
+        
+        payment.refresh_from_db()
+        self.batch.refresh_from_db()
+        self.assertEqual(payment.status, 'processing')
+        self.assertEqual(self.batch.status, 'processing')
+        self.assertEqual(len(LostResponseRail.keys), 1)
+        
+        LostResponseRail.lost = False
+        self.assertEqual(reconcile_payments()['success'], 0)  # Not stale yet
+        results = reconcile_payments(now=timezone.now() + timedelta(hours=1))
+        
+        payment.refresh_from_db()
+        payment.bill.refresh_from_db()
+        self.batch.refresh_from_db()
+        self.assertEqual(results['success'], 1)
+        self.assertEqual(self.batch.status, 'completed')
+        self.assertEqual(LostResponseRail.keys, [f'billpay-payment-{payment.id}'] * 2)
+        self.assertEqual(payment.status, 'completed')
+        self.assertEqual((payment.bill.status, payment.bill.amount_paid), ('paid', Decimal('50.00')))
+
+
+class PaymentOptimizerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test User'
+        )
+        self.org = Organization.objects.create(owner=self.user, name='Test Org')
+        self.vendor = Vendor.objects.create(
+            organization=self.org,
+            name='Acme Supplies',
+            early_payment_discount_percent=Decimal('2.00'),
+            early_payment_discount_days=10
+        )
+        self.bills = [
+            Bill.objects.create(
+                organization=self.org,
+                vendor=self.vendor,
+                bill_number=f'B-{index}',
+                bill_date=date.today(),
+                due_date=date.today() + timedelta(days=30),
+                subtotal=Decimal('1000.00'),
+                total_amount=Decimal('1000.00'),
+                status='approved'
+            )
+            for index in range(2)
+        ]
+        
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = f'/api/orgs/{self.org.id}/billpay/bills/optimize-payments/'
+    
+    def test_discounts_are_limited_by_cash(self):
+        """Only the discounts the cash balance can fund early are taken; dry runs change nothing"""
+        response = self.client.post(self.url, {'cash_balance': '1500.00'}, format='json')
+        
+        self.assertEqual(response.status_code, 200)
+        summary = response.data['summary']
+        self.assertEqual(summary['discounts_captured'], 1)
+        self.assertEqual(summary['discounts_declined'], 1)
+        self.assertEqual(summary['discount_savings'], Decimal('20.00'))
+        self.assertEqual(
+            sorted((payment['payment_date'], payment['amount']) for payment in response.data['payments']),
+            [(date.today() + timedelta(days=10), Decimal('980.00')), (date.today() + timedelta(days=30), Decimal('1000.00'))]
+        )
+        self.assertFalse(Bill.objects.filter(status='scheduled').exists())
+    
+    def test_apply_schedules_bills(self):
+        """With dry_run false every bill is scheduled on its planned date"""
+        response = self.client.post(self.url, {'cash_balance': '5000.00', 'dry_run': False}, format='json')
+        
+        self.assertEqual(response.data['scheduled'], 2)
+        self.assertEqual(
+            set(Bill.objects.values_list('status', 'scheduled_payment_date')),
+            {('scheduled', date.today() + timedelta(days=10))}
+        )
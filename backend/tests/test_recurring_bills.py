@@ -0,0 +1,93 @@
+"""
+Recurring bill detection and generation tests (Feature 4)
+"""
+from datetime import date
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+from app.users.models import Organization
+from app.billpay.models import Bill, RecurringSchedule, Vendor
+from app.billpay.recurring import detect_recurring_patterns, load_bill_history, sync_recurring_schedules
+from app.billpay.tasks import generate_recurring_bills
+
+User = get_user_model()
+
+TODAY = date(2024, 6, 20)
+
+
+class RecurringBillTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test User'
+        )
+        self.org = Organization.objects.create(owner=self.user, name='Test Org')
+        self.landlord = Vendor.objects.create(organization=self.org, name='Landlord', vendor_number='V-1')
+        self.contractor = Vendor.objects.create(organization=self.org, name='Contractor', vendor_number='V-2')
+        
+        bills = []
+        for month in range(6):
+            bills.append(self.make_bill(self.landlord, f'R-{month}', date(2024, 1, 5) + relativedelta(months=month), '2500.00'))
+        for index, (bill_date, amount) in enumerate([
+            (date(2024, 1, 3), '300.00'), (date(2024, 1, 20), '4100.00'),
+            (date(2024, 4, 2), '950.00'), (date(2024, 4, 9), '120.00'),
+        ]):
+            bills.append(self.make_bill(self.contractor, f'C-{index}', bill_date, amount))
+        Bill.objects.bulk_create(bills)
+    
+    def make_bill(self, vendor, number, bill_date, amount):
+        return Bill(
+            organization=self.org,
+            vendor=vendor,
+            bill_number=number,
+            bill_date=bill_date,
+            due_date=bill_date + relativedelta(days=30),
+            subtotal=Decimal(amount),
+            total_amount=Decimal(amount)
+        )
+    
+    def detect(self):
+        return sync_recurring_schedules(detect_recurring_patterns(load_bill_history([self.org.id]), today=TODAY))
+    
+    def test_detects_periodic_stable_vendors_only(self):
+        """A monthly fixed bill becomes a schedule; irregular bills do not"""
+        self.assertEqual(self.detect(), (1, 0))
+        
+        schedule = RecurringSchedule.objects.get()
+        self.assertEqual(schedule.vendor, self.landlord)
+        self.assertEqual(schedule.frequency, 'monthly')
+        self.assertEqual(schedule.expected_amount, Decimal('2500.00'))
+        self.assertEqual(schedule.start_date, date(2024, 1, 5))
+        self.assertEqual(schedule.next_expected_date, date(2024, 7, 5))
+        self.assertIsNotNone(schedule.detected_at)
+        self.assertFalse(schedule.is_active)
+        
+        # Re-running refreshes the same schedule
+        self.assertEqual(self.detect(), (0, 1))
+    
+    def test_generation_advances_schedule(self):
+        """Confirmed schedules get one bill per missed cycle and move to the next date"""
+        self.detect()
+        
+        # Detected schedules wait for confirmation
+        generate_recurring_bills(run_date='2024-08-10')
+        self.assertFalse(Bill.objects.filter(is_recurring=True).exists())
+        
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        schedule = RecurringSchedule.objects.get()
+        response = client.post(f'/api/orgs/{self.org.id}/billpay/recurring/{schedule.id}/confirm/')
+        self.assertEqual(response.status_code, 200)
+        
+        generate_recurring_bills(run_date='2024-08-10')
+        
+        schedule = RecurringSchedule.objects.get()
+        generated = Bill.objects.filter(recurring_schedule=schedule).order_by('bill_date')
+        self.assertEqual([bill.bill_date for bill in generated], [date(2024, 7, 5), date(2024, 8, 5)])
+        self.assertEqual(generated[0].total_amount, Decimal('2500.00'))
+        self.assertEqual(schedule.last_generated_date, date(2024, 8, 5))
+        self.assertEqual(schedule.next_expected_date, date(2024, 9, 5))
@@ -0,0 +1,258 @@
+"""
+Scenario simulation engine tests (Feature 3)
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+from app.users.models import Organization
+from app.api.models import Forecast, Transaction
+from app.planning.baseline import get_baseline, monthly_history
+from app.planning.models import Scenario, ScenarioResult
+from app.planning.retention import purge_scenario_results
+from app.planning.scheduling import simulate_scenario_chunk
+from app.planning.tasks import run_scheduled_scenarios
+from app.planning.simulator import (
+    SENSITIVITY_VARIABLES, ScenarioSimulator, SensitivityAnalyzer, compile_adjustments, project
+)
+
+User = get_user_model()
+
+BASE_DATA = {
+    'avg_monthly_revenue': Decimal('10000'),
+    'avg_monthly_expenses': Decimal('8000'),
+    'starting_cash': Decimal('50000'),
+}
+
+
+class ScenarioSimulatorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test User'
+        )
+        self.org = Organization.objects.create(owner=self.user, name='Test Org')
+        self.scenario = Scenario.objects.create(
+            organization=self.org,
+            name='Hiring plan',
+            base_year=2024,
+            base_month=1,
+            forecast_months=6
+        )
+
+    def add_adjustment(self, adjustment_type, change_type, value, start_month, end_month=None, name='Adjustment'):
+        return self.scenario.adjustments.create(
+            name=name,
+            adjustment_type=adjustment_type,
+            change_type=change_type,
+            value=Decimal(value),
+            start_month=start_month,
+            end_month=end_month
+        )
+
+    def test_adjustments_apply_in_order(self):
+        """Percentages scale absolute changes made before them, not after"""
+        self.add_adjustment('revenue', 'absolute', '1000', 2, name='A new client')
+        self.add_adjustment('revenue', 'percentage', '10', 3, end_month=4, name='B price rise')
+        self.add_adjustment('one_time', 'absolute', '-5000', 2, name='Equipment')
+
+        simulator = ScenarioSimulator(self.scenario)
+        revenue = simulator.project(BASE_DATA, revenue_growth=0, expense_growth=0)['revenue']
+
+        np.testing.assert_allclose(revenue, [10000, 11000, 12100, 12100, 11000, 11000])
+
+        result = simulator.simulate(BASE_DATA)
+        # Month 2: 52000 + (10200 + 1000) - 8080 - 5000 one-time
+        self.assertEqual(result['monthly_cash_balance'][:2], [52000.0, 50120.0])
+        self.assertEqual(result['break_even_month'], 1)
+        self.assertIsInstance(result['ending_cash'], Decimal)
+        ScenarioResult.objects.create(scenario=self.scenario, **result)
+
+    def test_growth_compounds_from_start_month(self):
+        """Growth-rate adjustments compound only while active"""
+        self.add_adjustment('expense', 'growth_rate', '10', 3, end_month=4)
+        compiled = compile_adjustments(list(self.scenario.adjustments.all()), 6)
+
+        multiplier, offset = compiled['expense']
+        np.testing.assert_allclose(multiplier, [1, 1, 1, 1.1, 1, 1])
+        np.testing.assert_allclose(offset, 0)
+
+    def test_projection_broadcasts_over_inputs(self):
+        """Batches of inputs are projected in one call"""
+        compiled = compile_adjustments([], 6)
+
+        projection = project(compiled, 50000, np.array([[9000, 10000], [11000, 12000]]), 8000)
+
+        self.assertEqual(projection['cash'].shape, (2, 2, 6))
+        np.testing.assert_allclose(
+            projection['revenue'][1, 0], project(compiled, 50000, 11000, 8000)['revenue']
+        )
+
+    def test_sensitivity_reruns_perturbed_inputs(self):
+        """The grid is one projection of really perturbed inputs, ranked for a tornado chart"""
+        self.add_adjustment('expense', 'absolute', '500', 1)
+        analyzer = SensitivityAnalyzer(self.scenario, BASE_DATA)
+
+        with self.assertNumQueries(0):
+            results = analyzer.analyze(list(SENSITIVITY_VARIABLES), [-20, 0, 20])
+
+        expected = analyzer.simulator.project(BASE_DATA, base_expenses=9600.0)['cash'][-1]
+        self.assertEqual(float(results['variables']['expenses'][2]['ending_cash']), round(expected, 2))
+        self.assertEqual(results['variables']['revenue'][1]['ending_cash'], results['base']['ending_cash'])
+
+        tornado = [bar['variable'] for bar in results['tornado']]
+        self.assertEqual(tornado[0], 'revenue')
+        self.assertEqual(set(tornado), set(SENSITIVITY_VARIABLES))
+        self.assertGreater(results['tornado'][0]['high']['ending_cash'], results['tornado'][0]['low']['ending_cash'])
+
+    def test_monte_carlo_is_seeded_and_bootstraps_history(self):
+        """Same seed, same distribution; history comes from monthly transaction totals"""
+        for month in range(1, 7):
+            Transaction.objects.create(
+                org=self.org, date=date(2024, month, 10), amount=Decimal(9000 + month * 500), description='Sales'
+            )
+            Transaction.objects.create(
+                org=self.org, date=date(2024, month, 12), amount=Decimal('-8000'), description='Payroll'
+            )
+        history = monthly_history(self.org.id, today=date(2024, 7, 15))
+        np.testing.assert_allclose(history['revenue'], [9500, 10000, 10500, 11000, 11500, 12000])
+        np.testing.assert_allclose(history['expenses'], 8000)
+
+        simulator = ScenarioSimulator(self.scenario)
+        base_data = dict(BASE_DATA, starting_cash=Decimal('1000'))
+        first = simulator.simulate_monte_carlo(2000, seed=42, base_data=base_data, history=history)
+        second = simulator.simulate_monte_carlo(2000, seed=42, base_data=base_data, history=history)
+
+        self.assertEqual(first['cash_percentiles'], second['cash_percentiles'])
+        bands = first['cash_percentiles']
+        self.assertTrue(all(low <= mid <= high for low, mid, high in zip(bands['p5'], bands['p50'], bands['p95'])))
+        self.assertEqual(first['cash_out_probability'], sorted(first['cash_out_probability']))
+        self.assertTrue(Decimal('0') <= first['confidence_level'] <= Decimal('100'))
+
+        result = ScenarioResult.objects.create(scenario=self.scenario, **first)
+        self.assertEqual(result.seed, 42)
+        self.assertEqual(result.simulation_mode, 'monte_carlo')
+
+    def test_baseline_snapshot_is_shared_until_transactions_change(self):
+        """Scenarios of one organization reuse the cached baseline"""
+        today = date.today()
+        Transaction.objects.create(org=self.org, date=today, amount=Decimal('30000'), description='Sales')
+        Transaction.objects.create(org=self.org, date=today, amount=Decimal('-15000'), description='Rent')
+        Forecast.objects.create(org=self.org, forecast_points=[{'date': today.isoformat(), 'balance': 42000.5}])
+
+        # Revision stamp, then the 90-day totals, forecast and monthly history
+        with self.assertNumQueries(4):
+            baseline = get_baseline(self.org.id)
+        self.assertEqual(baseline['avg_monthly_revenue'], Decimal('10000'))
+        self.assertEqual(baseline['avg_monthly_expenses'], Decimal('5000'))
+        self.assertEqual(baseline['starting_cash'], Decimal('42000.5'))
+
+        with self.assertNumQueries(1):
+            get_baseline(self.org.id)
+
+        Transaction.objects.create(org=self.org, date=today, amount=Decimal('3000'), description='Sales')
+        self.assertEqual(get_baseline(self.org.id)['avg_monthly_revenue'], Decimal('11000'))
+
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.post(
+            f'/api/orgs/{self.org.id}/planning/scenarios/{self.scenario.id}/simulate/',
+            {'mode': 'monte_carlo', 'paths': 500, 'seed': 3},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['results']['monthly_cash_balance'][0], 48000.5)
+        self.assertEqual(response.data['results']['seed'], 3)
+
+
+class ScheduledScenarioTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test User'
+        )
+        self.orgs = [
+            Organization.objects.create(owner=self.user, name=f'Org {index}') for index in range(2)
+        ]
+        self.scenarios = [
+            Scenario.objects.create(
+                organization=org, name=f'Plan {index}', base_year=2024, base_month=1, forecast_months=12
+            )
+            for org in self.orgs for index in range(2)
+        ]
+
+    def test_nightly_run_reports_failures_and_skips_unchanged(self):
+        """Chunks write results in bulk, report failures and skip scenarios whose inputs are unchanged"""
+        broken = self.scenarios[1]
+        broken.adjustments.create(
+            name='Runaway', adjustment_type='revenue', change_type='growth_rate', value=Decimal('1e12'), start_month=1
+        )
+
+        with self.assertLogs('app.planning', level='WARNING') as logs:
+            run_scheduled_scenarios.delay()
+
+        self.assertIn(f"'scenario_id': '{broken.id}'", logs.output[-1])
+        self.assertIn('1 failures', logs.output[-1])
+        self.assertEqual(ScenarioResult.objects.count(), 3)
+        self.assertEqual(Scenario.objects.filter(last_simulated_at__isnull=True).get(), broken)
+
+        broken.adjustments.all().delete()
+        self.scenarios[0].adjustments.create(
+            name='Price rise', adjustment_type='revenue', change_type='percentage', value=Decimal('5'), start_month=1
+        )
+        Scenario.objects.update(last_simulated_at=None)
+
+        summary = simulate_scenario_chunk(str(self.orgs[0].id), [str(scenario.id) for scenario in self.scenarios[:2]])
+
+        self.assertEqual((summary['simulated'], summary['skipped'], summary['failed']), (2, 0, 0))
+        run_scheduled_scenarios.delay()
+        # Org 1's scenarios are unchanged since their first results
+        self.assertEqual(ScenarioResult.objects.count(), 5)
+        self.assertEqual(Scenario.objects.filter(last_simulated_at__isnull=True).count(), 2)
+        self.assertEqual(
+            Scenario.objects.get(id=self.scenarios[0].id).latest_result.monthly_revenue[0],
+            10000 * 1.05
+        )
+
+        # Same revision, but the 90-day window has moved on
+        simulator = ScenarioSimulator(self.scenarios[2])
+        moved = dict(BASE_DATA, revision='unchanged')
+        self.assertNotEqual(
+            simulator.fingerprint(moved),
+            simulator.fingerprint(dict(moved, avg_monthly_revenue=Decimal('9000')))
+        )
+
+    def test_old_results_are_thinned(self):
+        """Latest N kept, then one per day, then one per week; the latest_result pointer survives"""
+        scenario = self.scenarios[0]
+        now = timezone.now().replace(hour=12, minute=0)
+        ages = (
+            [timedelta(minutes=minute) for minute in range(15)]
+            + [timedelta(days=10, hours=hour) for hour in range(3)]
+            + [timedelta(days=100, hours=hour) for hour in range(2)]
+            + [timedelta(days=800)]
+        )
+        results = ScenarioResult.objects.bulk_create([
+            ScenarioResult(scenario=scenario, monthly_revenue=[1.5, 2.25], month_labels=['Jan 2024', 'Feb 2024'])
+            for _ in ages
+        ])
+        for result, age in zip(results, ages):
+            ScenarioResult.objects.filter(id=result.id).update(simulated_at=now - age)
+        Scenario.objects.filter(id=scenario.id).update(latest_result=results[-1])
+
+        self.assertEqual(purge_scenario_results(now=now), 8)
+
+        kept = ScenarioResult.objects.filter(scenario=scenario)
+        self.assertEqual(kept.count(), 13)
+        self.assertTrue(kept.filter(id=results[-1].id).exists())
+        self.assertEqual(kept.first().monthly_revenue, [1.5, 2.25])
+        self.assertEqual(kept.first().monthly_profit, [])
@@ -0,0 +1,97 @@
+"""
+Nightly status transition tests (Features 1 and 4)
+"""
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.core import mail
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from app.users.models import Organization
+from app.invoices.models import Customer, Invoice
+from app.billpay.models import Bill, Vendor
+from app.billpay.transitions import BILL_TRANSITIONS
+from app.core.transitions import run_transitions, status_transitioned
+
+User = get_user_model()
+
+NOW = datetime(2024, 3, 1, 1, 0, tzinfo=dt_timezone.utc)
+TODAY = NOW.date()
+
+
+class StatusTransitionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test User'
+        )
+        self.org = Organization.objects.create(owner=self.user, name='Test Org')
+        self.vendor = Vendor.objects.create(organization=self.org, name='Acme Supplies')
+        self.events = []
+        
+        def record(sender, transition, ids, **kwargs):
+            self.events.append((transition, set(ids)))
+        
+        status_transitioned.connect(record)
+        self.addCleanup(status_transitioned.disconnect, record)
+    
+    def make_bill(self, number, status, due_date):
+        return Bill.objects.create(
+            organization=self.org,
+            vendor=self.vendor,
+            bill_number=number,
+            bill_date=due_date - timedelta(days=30),
+            due_date=due_date,
+            subtotal=Decimal('100.00'),
+            total_amount=Decimal('100.00'),
+            status=status
+        )
+    
+    def test_bill_transitions_report_changed_rows(self):
+        """Each transition is one statement; counts and events cover only rows it moved"""
+        due_soon = self.make_bill('B-1', 'approved', TODAY + timedelta(days=3))
+        overdue = self.make_bill('B-2', 'pending_approval', TODAY - timedelta(days=1))
+        self.make_bill('B-3', 'paid', TODAY - timedelta(days=1))
+        self.make_bill('B-4', 'scheduled', TODAY + timedelta(days=30))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(len(BILL_TRANSITIONS) * 3):  # savepoint, UPDATE, release
+                counts = run_transitions(BILL_TRANSITIONS, now=NOW)
+        
+        self.assertEqual(counts, {'bill_due_soon': 1, 'bill_overdue': 1})
+        self.assertEqual(self.events, [('bill_due_soon', {due_soon.id}), ('bill_overdue', {overdue.id})])
+        overdue.refresh_from_db()
+        self.assertEqual(overdue.status, 'overdue')
+        
+        # The owner is told about the bill coming due
+        self.assertEqual([message.to for message in mail.outbox], [['test@example.com']])
+        self.assertIn('B-1 from Acme Supplies', mail.outbox[0].body)
+        
+        # Already-notified and already-overdue bills don't move again
+        self.assertEqual(run_transitions(BILL_TRANSITIONS, now=NOW), {'bill_due_soon': 0, 'bill_overdue': 0})
+    
+    def test_invoice_overdue_task(self):
+        """update_invoice_statuses reports the invoices it marked"""
+        from app.invoices.tasks import update_invoice_statuses
+        
+        customer = Customer.objects.create(organization=self.org, name='Customer', email='c@test.com')
+        for number, status in enumerate(['sent', 'partial', 'paid']):
+            Invoice.objects.create(
+                organization=self.org,
+                customer=customer,
+                invoice_number=f'INV-{number}',
+                issue_date=date(2024, 1, 1),
+                due_date=date(2024, 1, 31),
+                subtotal=Decimal('100.00'),
+                total_amount=Decimal('100.00'),
+                status=status
+            )
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(update_invoice_statuses(), "Marked 2 invoices as overdue")
+        self.assertEqual(Invoice.objects.filter(status='overdue').count(), 2)
+        
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, '2 invoices are now overdue')
+        self.assertIn('INV-1 to Customer: $100.00', mail.outbox[0].body)
@@ -0,0 +1,149 @@
+"""
+Payment intent tests (Feature 1) against a local Stripe mock server
+The mock answers the handful of Stripe endpoints create_payment_intent uses,
+adds a fixed per-request latency and records every request it serves.
+"""
+import json
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import stripe
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from app.users.models import Organization
+from app.invoices.models import Customer, Invoice
+from app.invoices.stripe_utils import create_payment_intent
+
+User = get_user_model()
+
+MOCK_LATENCY_SECONDS = 0.05
+
+
+class StripeMockHandler(BaseHTTPRequestHandler):
+    """Minimal stand-in for the Stripe REST API"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _respond(self, body):
+        time.sleep(MOCK_LATENCY_SECONDS)
+        self.server.requests.append((self.command, self.path.split('?')[0], self.client_address[1]))
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path.startswith('/v1/customers'):
+            return self._respond({'object': 'list', 'data': [], 'has_more': False, 'url': '/v1/customers'})
+        self.send_error(404)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path == '/v1/customers':
+            return self._respond({'id': 'cus_mock_1', 'object': 'customer'})
+        if self.path == '/v1/payment_intents':
+            self.server.intent_count += 1
+            intent_id = f'pi_mock_{self.server.intent_count}'
+            return self._respond({
+                'id': intent_id,
+                'object': 'payment_intent',
+                'client_secret': f'{intent_id}_secret',
+            })
+        self.send_error(404)
+
+
+class StripePaymentIntentTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StripeMockHandler)
+        cls.server.requests = []
+        cls.server.intent_count = 0
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.requests.clear()
+        patchers = [
+            mock.patch.object(stripe, 'api_key', 'sk_test_mock'),
+            mock.patch.object(stripe, 'api_base', f'http://127.0.0.1:{self.server.server_port}'),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test User'
+        )
+        self.org = Organization.objects.create(owner=self.user, name='Test Org')
+        self.customer = Customer.objects.create(
+            organization=self.org,
+            name='Test Customer',
+            email='customer@test.com'
+        )
+
+    def make_invoice(self, number):
+        return Invoice.objects.create(
+            organization=self.org,
+            customer=self.customer,
+            invoice_number=number,
+            issue_date=date(2024, 1, 1),
+            due_date=date(2024, 1, 31),
+            subtotal=Decimal('100.00'),
+            total_amount=Decimal('100.00'),
+            status='sent'
+        )
+
+    def timed_intent(self, invoice):
+        started = time.perf_counter()
+        create_payment_intent(invoice)
+        return time.perf_counter() - started
+
+    def test_stripe_customer_id_is_cached(self):
+        """Only the first payment resolves the Stripe customer remotely"""
+        first_elapsed = self.timed_intent(self.make_invoice('INV-001'))
+        first_requests = list(self.server.requests)
+        self.server.requests.clear()
+
+        second_elapsed = self.timed_intent(self.make_invoice('INV-002'))
+        second_requests = list(self.server.requests)
+
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.stripe_customer_id, 'cus_mock_1')
+        self.assertEqual(
+            [(method, path) for method, path, _ in first_requests],
+            [('GET', '/v1/customers'), ('POST', '/v1/customers'), ('POST', '/v1/payment_intents')]
+        )
+        self.assertEqual(
+            [(method, path) for method, path, _ in second_requests],
+            [('POST', '/v1/payment_intents')]
+        )
+        self.assertLess(
+            second_elapsed, first_elapsed,
+            f'cached customer path took {second_elapsed:.3f}s vs {first_elapsed:.3f}s uncached'
+        )
+
+    def test_connections_are_reused(self):
+        """Consecutive Stripe calls share one keep-alive connection"""
+        for number in ['INV-001', 'INV-002', 'INV-003']:
+            create_payment_intent(self.make_invoice(number))
+
+        client_ports = {port for _, _, port in self.server.requests}
+        self.assertEqual(len(self.server.requests), 5)
+        self.assertEqual(len(client_ports), 1)
@@ -0,0 +1,179 @@
+"""
+Stripe webhook tests (Feature 1)
+Events come from a local stub that signs payloads the same way Stripe does,
+so the real signature verification runs on every request.
+"""
+import hashlib
+import hmac
+import json
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TestCase, Client, override_settings
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from app.users.models import Organization
+from app.invoices.models import Customer, Invoice, Payment, StripeWebhookEvent
+from app.invoices.stripe_utils import record_webhook_event, process_webhook_event, stale_webhook_event_ids
+from app.invoices.tasks import requeue_stale_webhook_events
+
+User = get_user_model()
+
+WEBHOOK_SECRET = 'whsec_local_stub'
+WEBHOOK_URL = '/api/invoices/webhook/stripe/'
+
+
+def make_stripe_event(event_id, event_type, obj):
+    """Build a Stripe event envelope"""
+    return {
+        'id': event_id,
+        'object': 'event',
+        'type': event_type,
+        'data': {'object': obj},
+    }
+
+
+def sign_payload(payload, secret=WEBHOOK_SECRET):
+    """Build a Stripe-Signature header for a raw payload"""
+    timestamp = int(time.time())
+    signed_payload = f'{timestamp}.{payload}'.encode()
+    signature = hmac.new(secret.encode(), signed_payload, hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={signature}'
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+class StripeWebhookTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test User'
+        )
+        self.org = Organization.objects.create(owner=self.user, name='Test Org')
+        self.customer = Customer.objects.create(
+            organization=self.org,
+            name='Test Customer',
+            email='customer@test.com'
+        )
+        self.invoice = Invoice.objects.create(
+            organization=self.org,
+            customer=self.customer,
+            invoice_number='INV-001',
+            issue_date=date(2024, 1, 1),
+            due_date=date(2024, 1, 31),
+            subtotal=Decimal('100.00'),
+            total_amount=Decimal('100.00'),
+            status='sent'
+        )
+        self.payment = Payment.objects.create(
+            invoice=self.invoice,
+            amount=Decimal('100.00'),
+            payment_method='card',
+            status='pending',
+            stripe_payment_intent_id='pi_stub_1'
+        )
+        self.intent = {'id': 'pi_stub_1', 'payment_method_types': ['card']}
+
+    def post_event(self, event):
+        payload = json.dumps(event)
+        return self.client.post(
+            WEBHOOK_URL,
+            data=payload,
+            content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=sign_payload(payload)
+        )
+
+    def test_webhook_rejects_bad_signature(self):
+        """Unsigned payloads never reach the ledger"""
+        payload = json.dumps(make_stripe_event('evt_bad', 'payment_intent.succeeded', self.intent))
+        response = self.client.post(
+            WEBHOOK_URL,
+            data=payload,
+            content_type='application/json',
+            HTTP_STRIPE_SIGNATURE='t=1,v1=deadbeef'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StripeWebhookEvent.objects.exists())
+
+    def test_redelivery_is_acked_and_queued_once(self):
+        """Retried deliveries are acknowledged but only queued the first time"""
+        event = make_stripe_event('evt_1', 'payment_intent.succeeded', self.intent)
+
+        with mock.patch('app.invoices.views.process_stripe_webhook.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                first = self.post_event(event)
+            with self.captureOnCommitCallbacks(execute=True):
+                second = self.post_event(event)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        delay.assert_called_once_with('evt_1')
+        self.assertEqual(StripeWebhookEvent.objects.count(), 1)
+
+        # Nothing is applied on the request path
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.amount_paid, Decimal('0.00'))
+
+    @mock.patch('app.invoices.tasks.send_thank_you_email.delay')
+    def test_event_processed_once(self, _thank_you):
+        """Processing the same ledger entry twice applies the payment once"""
+        record_webhook_event(make_stripe_event('evt_1', 'payment_intent.succeeded', self.intent))
+
+        first = process_webhook_event('evt_1')
+        second = process_webhook_event('evt_1')
+
+        self.assertEqual(first['status'], 'success')
+        self.assertEqual(second['status'], 'duplicate')
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.amount_paid, Decimal('100.00'))
+        self.assertEqual(self.invoice.status, 'paid')
+        self.assertEqual(
+            StripeWebhookEvent.objects.get(stripe_event_id='evt_1').status, 'processed'
+        )
+
+    @mock.patch('app.invoices.tasks.send_thank_you_email.delay')
+    def test_distinct_events_for_same_intent_count_once(self, _thank_you):
+        """A second success event for an already-succeeded intent is a no-op"""
+        for event_id in ['evt_1', 'evt_2']:
+            record_webhook_event(make_stripe_event(event_id, 'payment_intent.succeeded', self.intent))
+            process_webhook_event(event_id)
+
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.amount_paid, Decimal('100.00'))
+
+    def test_failed_event_is_requeued_on_retry(self):
+        """Events whose processing failed are handed back on redelivery"""
+        event = make_stripe_event('evt_1', 'payment_intent.succeeded', self.intent)
+        record_webhook_event(event)
+
+        with mock.patch('app.invoices.stripe_utils.handle_webhook_event', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                process_webhook_event('evt_1')
+
+        ledger_entry = StripeWebhookEvent.objects.get(stripe_event_id='evt_1')
+        self.assertEqual(ledger_entry.status, 'failed')
+        self.assertEqual(ledger_entry.attempts, 1)
+
+        _, needs_processing = record_webhook_event(event)
+        self.assertTrue(needs_processing)
+
+    def test_unqueued_events_are_swept(self):
+        """Events left received (their enqueue failed) or failed are queued again once stale"""
+        for event_id in ['evt_received', 'evt_failed', 'evt_done', 'evt_exhausted']:
+            record_webhook_event(make_stripe_event(event_id, 'payment_intent.succeeded', self.intent))
+        StripeWebhookEvent.objects.filter(stripe_event_id='evt_failed').update(status='failed', attempts=6)
+        StripeWebhookEvent.objects.filter(stripe_event_id='evt_done').update(status='processed', attempts=1)
+        StripeWebhookEvent.objects.filter(stripe_event_id='evt_exhausted').update(status='failed', attempts=20)
+
+        event = make_stripe_event('evt_received', 'payment_intent.succeeded', self.intent)
+        self.assertFalse(record_webhook_event(event)[1])
+        self.assertEqual(stale_webhook_event_ids(), [])
+
+        StripeWebhookEvent.objects.update(received_at=timezone.now() - timedelta(hours=1))
+        self.assertTrue(record_webhook_event(event)[1])
+        with mock.patch('app.invoices.tasks.process_stripe_webhook.delay') as delay:
+            requeue_stale_webhook_events()
+        self.assertEqual(sorted(call.args[0] for call in delay.call_args_list), ['evt_failed', 'evt_received'])